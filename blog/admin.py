@@ -1,5 +1,50 @@
-from django.contrib import admin
+from functools import reduce
+from operator import or_
+
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.utils import lookup_spawns_duplicates
+from django.db.models import Q
+from django.template.response import TemplateResponse
+from django.utils.text import smart_split, unescape_string_literal
 from .models import Post, Comment, Category, Tag
+from .pagination import EstimatedCountPaginator
+from .routers import comments_are_separate
+from . import moderation, search
+
+
+class ScalableChangeListMixin:
+    """
+    Changelist settings for tables too big to count or scan on every page
+    view: unfiltered pages show an estimated total, filtered ones skip the
+    extra count of the whole table, and searches use the FTS ``fts_table``
+    instead of ``LIKE`` for the ``search_fields`` it indexes (``fts_fields``);
+    matches of the other search fields are added with ``icontains``
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    fts_table = None
+    fts_fields = ()
+    
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not self.fts_table or not search.is_enabled(queryset.db):
+            return super().get_search_results(request, queryset, search_term)
+        condition = search.matching(search_term, self.fts_table) or Q(pk__in=[])
+        other_fields = [field for field in self.get_search_fields(request) if field not in self.fts_fields]
+        if other_fields:
+            condition |= self._words_in_fields(other_fields, search_term)
+        may_have_duplicates = any(lookup_spawns_duplicates(self.opts, f'{field}__icontains') for field in other_fields)
+        return queryset.filter(condition), may_have_duplicates
+    
+    @staticmethod
+    def _words_in_fields(fields, search_term):
+        """``Q`` requiring every word of ``search_term`` in one of ``fields``, as Django's own search does"""
+        words = Q()
+        for bit in smart_split(search_term):
+            if bit[:1] in ('"', "'") and bit[-1:] == bit[:1]:
+                bit = unescape_string_literal(bit)
+            words &= reduce(or_, (Q(**{f'{field}__icontains': bit}) for field in fields))
+        return words
 
 
 @admin.register(Category)
@@ -16,14 +61,16 @@ class TagAdmin(admin.ModelAdmin):
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(ScalableChangeListMixin, admin.ModelAdmin):
     list_display = ['title', 'author', 'category', 'status', 'created_at', 'published_at']
     list_filter = ['status', 'category', 'created_at', 'published_at']
+    list_select_related = ['author', 'category']
     search_fields = ['title', 'content']
+    fts_table = search.FTS_TABLE
+    fts_fields = ['title', 'content']
     prepopulated_fields = {'slug': ('title',)}
-    date_hierarchy = 'created_at'
     ordering = ['-created_at']
-    filter_horizontal = ['tags']
+    autocomplete_fields = ['author', 'category', 'tags']
     
     fieldsets = (
         ('Basic Information', {
@@ -47,12 +94,16 @@ class PostAdmin(admin.ModelAdmin):
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ScalableChangeListMixin, admin.ModelAdmin):
     list_display = ['post', 'author', 'created_at', 'is_active']
     list_filter = ['is_active', 'created_at']
+    list_select_related = ['post', 'author']
     search_fields = ['content', 'author__username', 'post__title']
-    date_hierarchy = 'created_at'
+    fts_table = search.COMMENT_FTS_TABLE
+    fts_fields = ['content']
     ordering = ['-created_at']
+    autocomplete_fields = ['post', 'author']
+    actions = ['approve_comments', 'hide_comments', 'purge_comments']
     
     fieldsets = (
         ('Comment Information', {
@@ -62,4 +113,59 @@ class CommentAdmin(admin.ModelAdmin):
             'fields': ('is_active',)
         }),
     )
-
+    
+    def get_list_select_related(self, request):
+        # Posts and users can't be joined when comments live in their own database;
+        # an empty tuple (unlike False) also stops the automatic join of list_display foreign keys
+        if comments_are_separate():
+            return ()
+        return super().get_list_select_related(request)
+    
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if comments_are_separate():
+            # One query per database for the page instead of two per row
+            queryset = queryset.prefetch_related('post', 'author')
+        return queryset
+    
+    def get_search_fields(self, request):
+        # Search only the comment itself when post titles and usernames can't be joined
+        if comments_are_separate():
+            return ['content']
+        return super().get_search_fields(request)
+    
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # Replaced by purge_comments, which doesn't load and list every comment first
+        actions.pop('delete_selected', None)
+        return actions
+    
+    def delete_queryset(self, request, queryset):
+        moderation.moderate(queryset, 'purge')
+    
+    def _moderate(self, request, queryset, action, verb):
+        changed = moderation.moderate(queryset, action)
+        self.message_user(request, f'{changed} comment{"s" if changed != 1 else ""} {verb}.', messages.SUCCESS)
+    
+    @admin.action(description='Approve selected comments', permissions=['change'])
+    def approve_comments(self, request, queryset):
+        self._moderate(request, queryset, 'approve', 'approved')
+    
+    @admin.action(description='Hide selected comments', permissions=['change'])
+    def hide_comments(self, request, queryset):
+        self._moderate(request, queryset, 'hide', 'hidden')
+    
+    @admin.action(description='Purge selected comments', permissions=['delete'])
+    def purge_comments(self, request, queryset):
+        if request.POST.get('confirm') == 'yes':
+            self._moderate(request, queryset, 'purge', 'purged')
+            return None
+        return TemplateResponse(request, 'admin/blog/comment/purge_confirmation.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'count': queryset.count(),
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across') == '1',
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+            'title': 'Purge comments',
+        })
@@ -0,0 +1,357 @@
+"""
+JSONL archives of the blog content.
+
+An archive is a text file (gzip-compressed when its name ends in ``.gz``)
+with one JSON object per line. The first line is a header; then come users,
+categories and tags, and finally one line per post that carries its tag and
+category names, its author's username and all of its comments::
+
+    {"type": "archive", "version": 1, "renderer": "...", "exported_at": "..."}
+    {"type": "user", "username": "alice", "email": "...", ...}
+    {"type": "category", "name": "Travel", "description": "", "created_at": "..."}
+    {"type": "tag", "name": "python", "created_at": "..."}
+    {"type": "post", "slug": "...", "author": "alice", "category": "Travel", "tags": ["python"],
+     "comments": [{"author": "bob", "content": "...", ...}], ...}
+
+``export_archive`` walks the posts in primary key order, one chunk at a
+time, so memory use does not grow with the size of the blog.
+``import_archive`` reads the lines as a stream and writes each batch of
+posts with a few ``bulk_create`` calls: the posts, their rows in the tag
+through table and their comments. Users, categories and tags are matched by
+username and name, so rows that already exist are reused. A post whose slug
+is taken is skipped, which makes re-importing an archive harmless, or is
+given a free slug with ``slug_conflict='rename'``.
+
+Password hashes are never exported; imported users get an unusable
+password. Image files are not included, only their names.
+"""
+import gzip
+import json
+from datetime import datetime
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import counters, page_cache, rendering, search
+from .models import Category, Comment, Post, Tag, build_summary
+from .pagination import POSTS_COUNT_TAG, SEARCH_COUNT_TAG
+from .sidebar import SIDEBAR_TAG
+from .timestamps import manual_timestamps
+
+VERSION = 1
+
+USER_FIELDS = ('username', 'email', 'first_name', 'last_name', 'is_active', 'date_joined')
+POST_FIELDS = ('slug', 'title', 'content', 'content_html', 'excerpt', 'image', 'status',
+               'created_at', 'updated_at', 'published_at')
+COMMENT_FIELDS = ('content', 'content_html', 'is_active', 'created_at', 'updated_at')
+DATETIME_FIELDS = ('date_joined', 'created_at', 'updated_at', 'published_at')
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def open_archive(path, mode='r'):
+    """Open ``path`` as text, compressing with gzip when the name ends in ``.gz``"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+# Export
+
+def _encode(value):
+    # Unlike DjangoJSONEncoder, keep the microseconds so timestamps survive a round trip
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _write(out, record):
+    out.write(json.dumps(record, default=_encode, ensure_ascii=False, separators=(',', ':')))
+    out.write('\n')
+
+
+def export_archive(out, chunk_size=1000, progress=None):
+    """Write every user, category, tag, post and comment to the text stream ``out``; return row counts"""
+    progress = progress or (lambda message: None)
+    totals = dict.fromkeys(('users', 'categories', 'tags', 'posts', 'comments'), 0)
+    _write(out, {
+        'type': 'archive', 'version': VERSION,
+        'renderer': rendering.renderer_name(), 'exported_at': timezone.now(),
+    })
+
+    for user in User.objects.order_by('pk').values(*USER_FIELDS).iterator(chunk_size=chunk_size):
+        _write(out, {'type': 'user', **user})
+        totals['users'] += 1
+    categories = Category.objects.order_by('pk').values('name', 'description', 'created_at')
+    for category in categories.iterator(chunk_size=chunk_size):
+        _write(out, {'type': 'category', **category})
+        totals['categories'] += 1
+    for tag in Tag.objects.order_by('pk').values('name', 'created_at').iterator(chunk_size=chunk_size):
+        _write(out, {'type': 'tag', **tag})
+        totals['tags'] += 1
+    # Posts refer to categories and tags by name; there are few of them next to posts and comments
+    category_names = dict(Category.objects.values_list('pk', 'name'))
+    tag_names = dict(Tag.objects.values_list('pk', 'name'))
+
+    through = Post.tags.through
+    last_pk = 0
+    while True:
+        posts = list(
+            Post.objects.filter(pk__gt=last_pk).order_by('pk')
+            .values('pk', 'author_id', 'category_id', *POST_FIELDS)[:chunk_size]
+        )
+        if not posts:
+            break
+        last_pk = posts[-1]['pk']
+        post_ids = [post['pk'] for post in posts]
+        tags = {}
+        for post_id, tag_id in through.objects.filter(post_id__in=post_ids).values_list('post_id', 'tag_id'):
+            tags.setdefault(post_id, []).append(tag_names[tag_id])
+        comments = {}
+        for comment in (
+            Comment.objects.filter(post_id__in=post_ids).order_by('created_at', 'pk')
+            .values('post_id', 'author_id', *COMMENT_FIELDS)
+        ):
+            comments.setdefault(comment.pop('post_id'), []).append(comment)
+        author_ids = {post['author_id'] for post in posts}
+        author_ids.update(comment['author_id'] for chunk in comments.values() for comment in chunk)
+        usernames = {}
+        for ids in _chunks(author_ids, 500):
+            usernames.update(User.objects.filter(pk__in=ids).values_list('pk', 'username'))
+        for chunk in comments.values():
+            for comment in chunk:
+                comment['author'] = usernames[comment.pop('author_id')]
+
+        for post in posts:
+            pk = post.pop('pk')
+            post['author'] = usernames[post.pop('author_id')]
+            post['category'] = category_names.get(post.pop('category_id'))
+            post['tags'] = sorted(tags.get(pk, []))
+            post['comments'] = comments.get(pk, [])
+            _write(out, {'type': 'post', **post})
+            totals['comments'] += len(post['comments'])
+        totals['posts'] += len(posts)
+        progress(f'{totals["posts"]} posts, {totals["comments"]} comments')
+    return totals
+
+
+# Import
+
+def _parse(record):
+    for field in DATETIME_FIELDS:
+        if record.get(field):
+            record[field] = parse_datetime(record[field])
+    return record
+
+
+def _records(lines):
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield _parse(json.loads(line))
+        except ValueError as e:
+            raise ArchiveError(f'line {number}: {e}') from e
+
+
+def _unique(records, field, wanted):
+    """Yield the first record for each value of ``field`` that is in ``wanted``"""
+    seen = set()
+    for record in records:
+        value = record[field]
+        if value in wanted and value not in seen:
+            seen.add(value)
+            yield record
+
+
+class ArchiveImporter:
+    """Import an archive written by ``export_archive``; see the module docstring"""
+
+    def __init__(self, batch_size=1000, slug_conflict='skip', rerender=False, progress=None):
+        if slug_conflict not in ('skip', 'rename'):
+            raise ValueError(f'Unknown slug conflict policy {slug_conflict!r}')
+        self.batch_size = batch_size
+        self.slug_conflict = slug_conflict
+        self.rerender = rerender
+        self.progress = progress or (lambda message: None)
+        self.users, self.categories, self.tags = {}, {}, {}
+        self.touched_categories, self.touched_tags = set(), set()
+        self.totals = dict.fromkeys(
+            ('users', 'categories', 'tags', 'posts', 'comments', 'skipped_posts', 'renamed_posts'), 0
+        )
+
+    def run(self, lines):
+        """Import every record in ``lines`` and return row counts"""
+        records = _records(lines)
+        header = next(records, None)
+        if not header or header.get('type') != 'archive' or header.get('version') != VERSION:
+            raise ArchiveError('Not a blog archive (missing or unsupported header line)')
+        # Stored HTML is only reused when it came out of the same renderer
+        self.keep_html = not self.rerender and header.get('renderer') == rendering.renderer_name()
+
+        pending_type, pending = None, []
+        for record in records:
+            kind = record.pop('type', None)
+            if kind not in ('user', 'category', 'tag', 'post'):
+                raise ArchiveError(f'Unknown record type {kind!r}')
+            if kind != pending_type or len(pending) >= self.batch_size:
+                self._flush(pending_type, pending)
+                pending_type, pending = kind, []
+            pending.append(record)
+        self._flush(pending_type, pending)
+        self._finish()
+        return self.totals
+
+    def _flush(self, kind, records):
+        if records:
+            importers = {
+                'user': self._import_users, 'category': self._import_categories,
+                'tag': self._import_tags, 'post': self._import_posts,
+            }
+            importers[kind](records)
+
+    def _resolve(self, model, field, values, mapping):
+        """Fill ``mapping`` with the pks of the rows whose ``field`` is in ``values``; return the missing values"""
+        missing = {value for value in values if value and value not in mapping}
+        for chunk in _chunks(missing, 500):
+            mapping.update(model.objects.filter(**{f'{field}__in': chunk}).values_list(field, 'pk'))
+        return [value for value in values if value and value not in mapping]
+
+    def _import_users(self, records):
+        missing = set(self._resolve(User, 'username', [r['username'] for r in records], self.users))
+        new = [User(**{field: r[field] for field in USER_FIELDS if field in r}) for r in _unique(records, 'username', missing)]
+        for user in new:
+            user.set_unusable_password()
+        User.objects.bulk_create(new, batch_size=self.batch_size)
+        self._resolve(User, 'username', [user.username for user in new], self.users)
+        self.totals['users'] += len(new)
+
+    def _import_categories(self, records):
+        missing = set(self._resolve(Category, 'name', [r['name'] for r in records], self.categories))
+        new = [Category(name=r['name'], description=r.get('description', ''), created_at=r.get('created_at'))
+               for r in _unique(records, 'name', missing)]
+        with manual_timestamps(Category):
+            Category.objects.bulk_create(new, batch_size=self.batch_size)
+        self._resolve(Category, 'name', [category.name for category in new], self.categories)
+        self.totals['categories'] += len(new)
+
+    def _import_tags(self, records):
+        missing = set(self._resolve(Tag, 'name', [r['name'] for r in records], self.tags))
+        new = [Tag(name=r['name'], created_at=r.get('created_at')) for r in _unique(records, 'name', missing)]
+        with manual_timestamps(Tag):
+            Tag.objects.bulk_create(new, batch_size=self.batch_size)
+        self._resolve(Tag, 'name', [tag.name for tag in new], self.tags)
+        self.totals['tags'] += len(new)
+
+    def _free_slugs(self, records):
+        """Drop or rename posts whose slug is already taken; return the records to insert"""
+        slugs = [r['slug'] for r in records]
+        taken = set(Post.objects.filter(slug__in=slugs).values_list('slug', flat=True))
+        kept, seen = [], set()
+        for record in records:
+            slug = record['slug']
+            if slug in taken or slug in seen:
+                if self.slug_conflict == 'skip':
+                    self.totals['skipped_posts'] += 1
+                    continue
+                base, suffix = slug[:190], 2
+                while slug in taken or slug in seen or Post.objects.filter(slug=slug).exists():
+                    slug, suffix = f'{base}-{suffix}', suffix + 1
+                record['slug'] = slug
+                self.totals['renamed_posts'] += 1
+            seen.add(slug)
+            kept.append(record)
+        return kept
+
+    def _rendered(self, instance, html, extensions):
+        # Anyone can write an archive, header included: its HTML is sanitized like fresh output
+        html = rendering.sanitize(html) if self.keep_html and html else None
+        if html is not None:
+            instance.content_html = html
+            instance.content_hash = rendering.content_hash(instance.content)
+        else:
+            rendering.refresh_rendered(instance, extensions)
+        return instance
+
+    def _import_posts(self, records):
+        records = self._free_slugs(records)
+        if not records:
+            return
+        authors = [r['author'] for r in records] + [c['author'] for r in records for c in r['comments']]
+        unknown = self._resolve(User, 'username', authors, self.users)
+        if unknown:
+            raise ArchiveError(f'Unknown users: {", ".join(sorted(set(unknown))[:10])}')
+        for field, model, mapping, names in (
+            ('category', Category, self.categories, [r['category'] for r in records]),
+            ('tag', Tag, self.tags, [name for r in records for name in r['tags']]),
+        ):
+            unknown = self._resolve(model, 'name', names, mapping)
+            if unknown:
+                raise ArchiveError(f'Unknown {field} names: {", ".join(sorted(set(unknown))[:10])}')
+
+        posts = []
+        for r in records:
+            post = Post(
+                **{field: r.get(field) for field in POST_FIELDS if field != 'content_html'},
+                author_id=self.users[r['author']], category_id=self.categories.get(r['category']),
+                comment_count=sum(1 for comment in r['comments'] if comment['is_active']),
+            )
+            post.image = post.image or None
+            post.excerpt = post.excerpt or ''
+            post.summary = build_summary(post.excerpt, post.content)
+            posts.append(self._rendered(post, r.get('content_html'), rendering.POST_EXTENSIONS))
+
+        through = Post.tags.through
+        with manual_timestamps(Post, Comment):
+            with transaction.atomic():
+                Post.objects.bulk_create(posts, batch_size=self.batch_size)
+                links = [through(post_id=post.pk, tag_id=self.tags[name])
+                         for post, r in zip(posts, records) for name in set(r['tags'])]
+                through.objects.bulk_create(links, batch_size=self.batch_size)
+            comments = [
+                self._rendered(Comment(
+                    post_id=post.pk, author_id=self.users[c['author']],
+                    **{field: c.get(field) for field in COMMENT_FIELDS if field != 'content_html'},
+                ), c.get('content_html'), rendering.COMMENT_EXTENSIONS)
+                for post, r in zip(posts, records) for c in r['comments']
+            ]
+            with transaction.atomic(using=router.db_for_write(Comment)):
+                Comment.objects.bulk_create(comments, batch_size=self.batch_size)
+
+        # bulk_create skips the signal handlers
+        search.index_posts(post.pk for post in posts)
+        for post in posts:
+            if post.status == 'published':
+                self.touched_categories.add(post.category_id)
+        self.touched_tags.update(link.tag_id for link in links)
+        self.totals['posts'] += len(posts)
+        self.totals['comments'] += len(comments)
+        self.progress(f'{self.totals["posts"]} posts, {self.totals["comments"]} comments')
+
+    def _finish(self):
+        self.touched_categories.discard(None)
+        for ids in _chunks(self.touched_categories, 500):
+            counters.refresh_category_counts(ids)
+        for ids in _chunks(self.touched_tags, 500):
+            counters.refresh_tag_counts(ids)
+        page_cache.invalidate(
+            'list:home', POSTS_COUNT_TAG, SEARCH_COUNT_TAG, SIDEBAR_TAG,
+            *(f'category:{pk}' for pk in self.touched_categories),
+            *(f'tag:{pk}' for pk in self.touched_tags),
+        )
+
+
+def import_archive(lines, **kwargs):
+    """Import the archive lines with an ``ArchiveImporter``; return row counts"""
+    return ArchiveImporter(**kwargs).run(lines)
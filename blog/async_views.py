@@ -0,0 +1,123 @@
+"""
+Async versions of the public read views, served when running under ASGI.
+
+Django's async ORM methods run each query through the single
+thread-sensitive executor, one after another. These views instead run
+independent blocking work (the page of posts, the sidebar, comments, related
+posts) in worker threads of their own with ``run_blocking`` and await them
+together, so their queries overlap. Each worker thread keeps its own
+database connection, which is why it is a good fit for SQLite in WAL mode:
+readers never block each other. Templates are rendered in a thread as well
+since the context processors read the session and the user.
+
+``blog/urls.py`` routes ``post_list`` and ``post_detail`` here when
+``BLOG_ASYNC_VIEWS`` is on (``blog_project/asgi.py`` enables it); comment
+submission is handed to the sync ``post_detail``.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import Http404
+from django.shortcuts import render
+from django.utils.http import urlencode
+
+from . import comment_queue, sidebar, view_counts, views
+from .conditional import conditional_page
+from .models import Post
+from .page_cache import add_dependencies, cache_anonymous_page, depend_on_posts
+from .pagination import paginate_posts
+from .related import related_posts
+from .routers import comments_are_separate
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run ``func`` in a worker thread of its own so several calls can overlap"""
+    def call():
+        try:
+            return func(*args, **kwargs)
+        finally:
+            # Worker threads don't see request_finished; drop broken or expired connections here
+            close_old_connections()
+    return await sync_to_async(call, thread_sensitive=False)()
+
+
+def _load_page(request, posts, per_page, allow_cursor, **paginator_kwargs):
+    page_obj = paginate_posts(request, posts, per_page, allow_cursor=allow_cursor, **paginator_kwargs)
+    # Evaluate in this thread so the template doesn't query from another one
+    page_obj.object_list = list(page_obj.object_list)
+    return page_obj
+
+
+def _load_comments(post):
+    comments = post.comments.filter(is_active=True)
+    comments = comments.prefetch_related('author') if comments_are_separate() else comments.select_related('author')
+    return list(comments)
+
+
+@conditional_page(views.post_list_validators)
+@cache_anonymous_page(lambda request: ['list:home', view_counts.TRENDING_TAG, sidebar.SIDEBAR_TAG])
+async def post_list(request):
+    """Display list of published posts with search and filtering"""
+    posts = Post.objects.filter(status='published').cards()
+    posts, search_query, category_id, tag_id = views.filter_posts(request, posts)
+
+    page_obj, categories, tags, trending = await asyncio.gather(
+        run_blocking(
+            _load_page, request, posts, 6, not search_query,
+            **views.post_list_count_options(posts, search_query, category_id, tag_id)
+        ),
+        run_blocking(sidebar.popular_categories),
+        run_blocking(sidebar.popular_tags),
+        run_blocking(view_counts.trending_posts),
+    )
+    depend_on_posts(request, page_obj)
+    filter_query = urlencode({
+        key: value for key, value in
+        (('search', search_query), ('category', category_id), ('tag', tag_id)) if value
+    })
+
+    context = {
+        'page_obj': page_obj,
+        'categories': categories,
+        'tags': tags,
+        'trending_posts': trending,
+        'search_query': search_query,
+        'selected_category': category_id,
+        'selected_tag': tag_id,
+        'filter_query': filter_query,
+    }
+    return await sync_to_async(render)(request, 'blog/post_list.html', context)
+
+
+@conditional_page(views.post_detail_validators)
+@cache_anonymous_page(lambda request, pk: [f'post:{pk}'])
+async def post_detail(request, pk):
+    """Display single post with comments"""
+    if request.method == 'POST':
+        return await sync_to_async(views.post_detail)(request, pk)
+
+    try:
+        post = await (
+            Post.objects.select_related('author', 'category').prefetch_related('tags')
+            .aget(pk=pk, status='published')
+        )
+    except Post.DoesNotExist:
+        raise Http404('No Post matches the given query.')
+
+    comments, related, pending = await asyncio.gather(
+        run_blocking(_load_comments, post),
+        run_blocking(related_posts, post),
+        sync_to_async(comment_queue.pending_comments)(request, post.pk),
+    )
+    depend_on_posts(request, [post])
+    add_dependencies(request, *(f'post:{related_post.pk}' for related_post in related))
+
+    context = {
+        'post': post,
+        'comments': comments,
+        'pending_comments': pending,
+        'related_posts': related,
+        'comment_form': views.CommentForm(),
+    }
+    return await sync_to_async(render)(request, 'blog/post_detail.html', context)
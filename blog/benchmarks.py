@@ -0,0 +1,376 @@
+"""
+HTTP benchmarks for the blog views.
+
+Each scenario issues the same request repeatedly through the test client and
+records wall-clock latency percentiles, the number of SQL queries and the
+time spent in them, and the size of the response body. Scenarios are built
+from the data in the database (the busiest category, the most popular tag,
+the most commented post, ...) so they stay meaningful for any dataset size;
+``manage.py benchmark`` runs them against a test database filled by
+``blog.loadgen``.
+
+Results are plain dicts so they can be written to JSON and compared with a
+stored baseline by ``compare``. ``run_concurrency`` measures raw reader and
+writer throughput of a database alias under contention
+(``manage.py benchmark_concurrency``).
+"""
+import math
+import platform
+import random
+import time
+from collections import namedtuple
+from contextlib import ExitStack
+
+import django
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+# Latency percentiles reported for every scenario
+PERCENTILES = (50, 90, 99)
+
+# Latency differences below this many milliseconds are treated as noise
+MIN_LATENCY_DELTA_MS = 1.0
+
+Scenario = namedtuple('Scenario', 'name method path data authenticated')
+
+
+def _percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def build_scenarios(search_term='django'):
+    """Return the benchmark scenarios for the current database contents"""
+    from .models import Category, Post, Tag
+
+    published = Post.objects.filter(status='published')
+    post = published.order_by('-comment_count', '-pk').first()
+    if post is None:
+        return []
+    category = Category.objects.order_by('-post_count', 'pk').first()
+    tag = Tag.objects.order_by('-post_count', 'pk').first()
+    author = (
+        User.objects.filter(blog_posts__status='published')
+        .annotate(total=Count('blog_posts')).order_by('-total', 'pk').first()
+    )
+    last_page = max(1, math.ceil(published.count() / 6))
+
+    home = reverse('blog:post_list')
+    scenarios = [
+        Scenario('post_list', 'get', home, None, False),
+        Scenario('post_list:search', 'get', f'{home}?search={search_term}', None, False),
+        Scenario('post_list:deep_page', 'get', f'{home}?page={last_page}', None, False),
+        Scenario('post_detail', 'get', reverse('blog:post_detail', args=[post.pk]), None, False),
+        Scenario('user_posts', 'get', reverse('blog:user_posts', args=[author.username]), None, False),
+        Scenario('comment_post', 'post', reverse('blog:post_detail', args=[post.pk]),
+                 {'content': 'Benchmark comment with a little **Markdown**.'}, True),
+    ]
+    if category:
+        scenarios += [
+            Scenario('post_list:category', 'get', f'{home}?category={category.pk}', None, False),
+            Scenario('category_posts', 'get', reverse('blog:category_posts', args=[category.pk]), None, False),
+        ]
+    if tag:
+        scenarios += [
+            Scenario('post_list:tag', 'get', f'{home}?tag={tag.pk}', None, False),
+            Scenario('tag_posts', 'get', reverse('blog:tag_posts', args=[tag.pk]), None, False),
+        ]
+    return scenarios
+
+
+class QueryTimer:
+    """``execute_wrapper`` summing query time with ``perf_counter``; Django's query log rounds to milliseconds"""
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+
+def run_scenario(scenario, iterations=50, warmup=5, client=None):
+    """Run one scenario and return its measurements"""
+    client = client or Client()
+    request = getattr(client, scenario.method)
+    latencies, query_counts, query_times, sizes, statuses = [], [], [], [], set()
+
+    for i in range(warmup + iterations):
+        with ExitStack() as stack:
+            # Every database, so comments in their own database are counted too
+            captures = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            timer = QueryTimer()
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(timer))
+            start = time.perf_counter()
+            response = request(scenario.path, scenario.data) if scenario.data else request(scenario.path)
+            elapsed = time.perf_counter() - start
+        if i < warmup:
+            continue
+        queries = [query for capture in captures for query in capture.captured_queries]
+        latencies.append(elapsed * 1000)
+        query_counts.append(len(queries))
+        query_times.append(timer.seconds * 1000)
+        sizes.append(len(response.content))
+        statuses.add(response.status_code)
+
+    latencies.sort()
+    result = {
+        'path': scenario.path,
+        'method': scenario.method.upper(),
+        'iterations': iterations,
+        'status': sorted(statuses),
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3),
+            'min': round(latencies[0], 3),
+            'max': round(latencies[-1], 3),
+            **{f'p{p}': round(_percentile(latencies, p), 3) for p in PERCENTILES},
+        },
+        'queries': max(query_counts),
+        'sql_ms': round(sum(query_times) / len(query_times), 3),
+        'bytes': max(sizes),
+    }
+    return result
+
+
+def run(scenarios, iterations=50, warmup=5, progress=None):
+    """Run every scenario and return the full report"""
+    from .models import Comment, Post
+
+    anonymous = Client()
+    authenticated = Client()
+    user, _ = User.objects.get_or_create(username='benchmark')
+    authenticated.force_login(user)
+
+    results = {}
+    for scenario in scenarios:
+        client = authenticated if scenario.authenticated else anonymous
+        results[scenario.name] = run_scenario(scenario, iterations, warmup, client)
+        if progress:
+            progress(scenario.name, results[scenario.name])
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'posts': Post.objects.count(),
+            'comments': Comment.objects.count(),
+            'iterations': iterations,
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold=0.2, metric='p50'):
+    """
+    Return a list of regressions of ``report`` against ``baseline``.
+
+    A scenario regresses when its ``metric`` latency grows by more than
+    ``threshold`` (a fraction, and at least ``MIN_LATENCY_DELTA_MS``), or when
+    it issues more SQL queries than before. Scenarios missing from either
+    report are ignored.
+    """
+    regressions = []
+    for name, current in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None:
+            continue
+        before, after = previous['latency_ms'][metric], current['latency_ms'][metric]
+        if after > before * (1 + threshold) and after - before >= MIN_LATENCY_DELTA_MS:
+            regressions.append(f'{name}: {metric} latency {before:.2f} ms -> {after:.2f} ms')
+        if current['queries'] > previous['queries']:
+            regressions.append(f'{name}: {previous["queries"]} -> {current["queries"]} queries')
+    return regressions
+
+
+def _concurrency_schema(alias):
+    from django.db import connections
+
+    with connections[alias].cursor() as cursor:
+        cursor.execute('CREATE TABLE IF NOT EXISTS bench_post (id INTEGER PRIMARY KEY, comment_count INTEGER NOT NULL)')
+        cursor.execute(
+            'CREATE TABLE IF NOT EXISTS bench_comment '
+            '(id INTEGER PRIMARY KEY, post_id INTEGER NOT NULL, body TEXT NOT NULL, created REAL NOT NULL)'
+        )
+        cursor.execute('CREATE INDEX IF NOT EXISTS bench_comment_post ON bench_comment (post_id, created)')
+        cursor.execute('DELETE FROM bench_comment')
+        cursor.execute('DELETE FROM bench_post')
+        cursor.executemany('INSERT INTO bench_post (id, comment_count) VALUES (%s, 0)', [(i,) for i in range(1, 101)])
+
+
+def run_concurrency(alias, readers=8, writers=2, duration=5.0):
+    """
+    Hammer database ``alias`` from reader and writer threads for ``duration`` seconds.
+
+    Readers fetch a post's newest comments, writers add a comment and bump the
+    post's counter in one transaction, like the comment form does. Returns
+    throughput, lock errors and write latency percentiles.
+    """
+    import threading
+
+    from django.db import OperationalError, connections, transaction
+
+    _concurrency_schema(alias)
+    deadline = time.perf_counter() + duration
+    lock = threading.Lock()
+    totals = {'reads': 0, 'writes': 0, 'errors': 0}
+    write_latencies = []
+
+    def reader(seed):
+        rng = random.Random(seed)
+        done = errors = 0
+        try:
+            while time.perf_counter() < deadline:
+                try:
+                    with connections[alias].cursor() as cursor:
+                        cursor.execute(
+                            'SELECT p.comment_count, c.body FROM bench_post p '
+                            'LEFT JOIN bench_comment c ON c.post_id = p.id WHERE p.id = %s '
+                            'ORDER BY c.created DESC LIMIT 20', [rng.randint(1, 100)],
+                        )
+                        cursor.fetchall()
+                    done += 1
+                except OperationalError:
+                    errors += 1
+        finally:
+            connections[alias].close()
+        with lock:
+            totals['reads'] += done
+            totals['errors'] += errors
+
+    def writer(seed):
+        rng = random.Random(seed)
+        done = errors = 0
+        latencies = []
+        try:
+            while time.perf_counter() < deadline:
+                post_id = rng.randint(1, 100)
+                start = time.perf_counter()
+                try:
+                    with transaction.atomic(using=alias):
+                        with connections[alias].cursor() as cursor:
+                            cursor.execute(
+                                'INSERT INTO bench_comment (post_id, body, created) VALUES (%s, %s, %s)',
+                                [post_id, 'x' * 200, time.time()],
+                            )
+                            cursor.execute('UPDATE bench_post SET comment_count = comment_count + 1 WHERE id = %s', [post_id])
+                    done += 1
+                    latencies.append((time.perf_counter() - start) * 1000)
+                except OperationalError:
+                    errors += 1
+        finally:
+            connections[alias].close()
+        with lock:
+            totals['writes'] += done
+            totals['errors'] += errors
+            write_latencies.extend(latencies)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(readers + i,)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    write_latencies.sort()
+    return {
+        'reads_per_second': round(totals['reads'] / duration, 1),
+        'writes_per_second': round(totals['writes'] / duration, 1),
+        'lock_errors': totals['errors'],
+        'write_latency_ms': {
+            f'p{p}': round(_percentile(write_latencies, p), 3) if write_latencies else None
+            for p in PERCENTILES
+        },
+    }
+
+
+READ_VIEWS = ('post_list', 'post_detail')
+
+
+def read_view_urlconf(read_views):
+    """URLconf module serving the blog with ``post_list``/``post_detail`` taken from ``read_views``"""
+    from types import ModuleType
+
+    from django.urls import include, path
+
+    from . import urls as blog_urls
+
+    patterns = [
+        path(str(pattern.pattern), getattr(read_views, pattern.name), name=pattern.name)
+        if getattr(pattern, 'name', None) in READ_VIEWS else pattern
+        for pattern in blog_urls.urlpatterns
+    ]
+    module = ModuleType(f'blog_benchmark_urls_{read_views.__name__}')
+    module.urlpatterns = [path('', include((patterns, blog_urls.app_name)))]
+    return module
+
+
+def _load_summary(latencies, errors, elapsed):
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'latency_ms': {f'p{p}': round(_percentile(latencies, p), 3) for p in PERCENTILES} if latencies else {},
+    }
+
+
+def run_wsgi_load(paths, concurrency=16, requests=400):
+    """Issue ``requests`` GETs spread over ``concurrency`` threads, each with its own test ``Client``"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.db import close_old_connections
+
+    def worker(index):
+        client = Client()
+        latencies, errors = [], 0
+        try:
+            for i in range(index, requests, concurrency):
+                start = time.perf_counter()
+                response = client.get(paths[i % len(paths)])
+                latencies.append((time.perf_counter() - start) * 1000)
+                errors += response.status_code != 200
+        finally:
+            close_old_connections()
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return _load_summary([ms for latencies, _ in results for ms in latencies], sum(e for _, e in results), elapsed)
+
+
+def run_asgi_load(paths, concurrency=16, requests=400):
+    """Issue ``requests`` GETs from ``concurrency`` concurrent tasks through the test ``AsyncClient``"""
+    import asyncio
+
+    from django.test import AsyncClient
+
+    async def worker(index):
+        client = AsyncClient()
+        latencies, errors = [], 0
+        for i in range(index, requests, concurrency):
+            start = time.perf_counter()
+            response = await client.get(paths[i % len(paths)])
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += response.status_code != 200
+        return latencies, errors
+
+    async def main():
+        return await asyncio.gather(*(worker(index) for index in range(concurrency)))
+
+    start = time.perf_counter()
+    results = asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    return _load_summary([ms for latencies, _ in results for ms in latencies], sum(e for _, e in results), elapsed)
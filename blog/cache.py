@@ -0,0 +1,310 @@
+"""
+Two-tier cache backend: a per-process LRU in front of a shared cache.
+
+``TwoTierCache`` answers reads from a small in-process LRU (the local tier)
+and falls back to another configured cache alias (the shared tier, e.g. the
+file-based cache every worker can see). Hot keys such as page cache tag
+versions, cached counts and rendered pages are then read from memory by
+every request after the first one in each process.
+
+Writes go to the shared tier and replace the local copy in the writing
+process only. Other processes keep their copy of a changed key until it
+expires, at most ``LOCAL_TIMEOUT`` seconds later. That is the longest
+another worker can see an old value (a page cache tag version, for
+instance), so keep it short. Values stored under versioned keys that are
+never rewritten, like counts and fragments, are never stale. ``clear()``
+also sets a generation key in the shared tier; each process reads it at
+most once per ``GENERATION_CHECK_INTERVAL`` seconds and empties its local
+tier when it has changed. Keys starting with one of ``SHARED_ONLY_PREFIXES``
+(counters written on every request, for instance) are never held locally.
+
+The local tier is shared by the threads of a process and named by the
+alias's ``LOCATION``.
+
+Options::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'blog.cache.TwoTierCache',
+            'OPTIONS': {'SHARED': 'shared', 'LOCAL_MAX_ENTRIES': 1000},
+        },
+        'shared': {'BACKEND': 'blog.cache.LockingFileBasedCache', ...},
+    }
+
+Hit rates of both tiers and local evictions are counted per process (see
+``tier_stats()``) and exported by ``blog.metrics``.
+
+``LockingFileBasedCache`` is Django's file cache with ``incr`` and ``add``
+made atomic across processes, which page cache tag versions rely on.
+"""
+import os
+import pickle
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+
+GENERATION_KEY = 'blog:cache:generation'
+
+# Caches for runs against a throwaway test database (the test suite, benchmarks and
+# query plan audits): kept in memory so nothing cached from it reaches the site
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'blog-test'},
+}
+TIER_STATS = ('local_hits', 'local_misses', 'shared_hits', 'shared_misses', 'local_evictions', 'generation_resets')
+
+# Lock files guarding read-modify-write operations of LockingFileBasedCache
+LOCK_STRIPES = 16
+
+_MISSING = object()
+
+
+class LockingFileBasedCache(FileBasedCache):
+    """
+    File cache whose ``incr``/``decr`` and ``add`` are atomic across processes.
+
+    Django's file cache reads and then writes, so two workers invalidating
+    the same page cache tag at once could both store the same new version.
+    Here the read and the write happen under an exclusive lock on one of
+    ``LOCK_STRIPES`` lock files, picked by the key, and ``incr`` keeps the
+    entry's expiry instead of resetting it to the default timeout.
+    """
+
+    @contextmanager
+    def _locked(self, fname):
+        self._createdir()
+        stripe = int(os.path.basename(fname)[:8], 16) % LOCK_STRIPES
+        with open(os.path.join(self._dir, f'lock-{stripe}'), 'ab') as lock_file:
+            locks.lock(lock_file, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(lock_file)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._locked(self._key_to_file(key, version)):
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        fname = self._key_to_file(key, version)
+        with self._locked(fname):
+            try:
+                with open(fname, 'rb') as f:
+                    expiry = pickle.load(f)
+                    value = pickle.loads(zlib.decompress(f.read()))
+            except (FileNotFoundError, EOFError):
+                raise ValueError(f"Key '{key}' not found") from None
+            if expiry is not None and expiry <= time.time():
+                raise ValueError(f"Key '{key}' not found")
+            value += delta
+            self.set(key, value, None if expiry is None else expiry - time.time(), version)
+        return value
+
+
+class LocalTier:
+    """The in-process LRU of one ``TwoTierCache`` location, shared by all threads"""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = None
+        self.checked_at = float('-inf')
+        self.stats = dict.fromkeys(TIER_STATS, 0)
+
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+class TwoTierCache(BaseCache):
+    def __init__(self, name, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED', 'shared')
+        self._max_entries = options.get('LOCAL_MAX_ENTRIES', 1000)
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self._check_interval = options.get('GENERATION_CHECK_INTERVAL', 1.0)
+        self._shared_only = tuple(options.get('SHARED_ONLY_PREFIXES', ()))
+        # Django creates a cache instance per thread; they all use the same local tier
+        with _tiers_lock:
+            self._tier = _tiers.setdefault((name, self._shared_alias), LocalTier())
+        self._local = self._tier.entries
+        self._lock = self._tier.lock
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    # Local tier
+
+    def _count(self, name, delta=1):
+        with self._lock:
+            self._tier.stats[name] += delta
+
+    def _is_local(self, key):
+        return not key.startswith(self._shared_only)
+
+    def _sync_generation(self):
+        """Empty the local tier if a process has cleared the cache since the last check"""
+        tier = self._tier
+        now = time.monotonic()
+        if now - tier.checked_at < self._check_interval:
+            return
+        generation = self.shared.get(GENERATION_KEY)
+        with self._lock:
+            tier.checked_at = now
+            if generation != tier.generation:
+                if self._local:
+                    tier.stats['generation_resets'] += 1
+                self._local.clear()
+                tier.generation = generation
+
+    def _local_get(self, local_key):
+        with self._lock:
+            entry = self._local.get(local_key)
+            if entry is None:
+                return _MISSING
+            if entry[1] <= time.monotonic():
+                del self._local[local_key]
+                return _MISSING
+            self._local.move_to_end(local_key)
+        return pickle.loads(entry[0])
+
+    def _local_set(self, local_key, value, timeout=DEFAULT_TIMEOUT):
+        timeout = self.get_backend_timeout(timeout)
+        lifetime = self._local_timeout if timeout is None else min(timeout - time.time(), self._local_timeout)
+        if lifetime <= 0:
+            self._local_delete(local_key)
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._local[local_key] = (pickled, time.monotonic() + lifetime)
+            self._local.move_to_end(local_key)
+            while len(self._local) > self._max_entries:
+                self._local.popitem(last=False)
+                self._tier.stats['local_evictions'] += 1
+
+    def _local_delete(self, local_key):
+        with self._lock:
+            self._local.pop(local_key, None)
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        if not self._is_local(key):
+            return self.shared.get(key, default, version)
+        local_key = self.make_and_validate_key(key, version)
+        self._sync_generation()
+        value = self._local_get(local_key)
+        if value is not _MISSING:
+            self._count('local_hits')
+            return value
+        self._count('local_misses')
+        value = self.shared.get(key, _MISSING, version)
+        if value is _MISSING:
+            self._count('shared_misses')
+            return default
+        self._count('shared_hits')
+        self._local_set(local_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        local_keys = {key: self.make_and_validate_key(key, version) for key in keys}
+        self._sync_generation()
+        found, remote = {}, []
+        for key, local_key in local_keys.items():
+            value = self._local_get(local_key) if self._is_local(key) else _MISSING
+            if value is _MISSING:
+                remote.append(key)
+            else:
+                found[key] = value
+        self._count('local_hits', len(found))
+        if remote:
+            self._count('local_misses', sum(1 for key in remote if self._is_local(key)))
+            fetched = self.shared.get_many(remote, version)
+            self._count('shared_hits', len(fetched))
+            self._count('shared_misses', len(remote) - len(fetched))
+            for key, value in fetched.items():
+                if self._is_local(key):
+                    self._local_set(local_keys[key], value)
+            found.update(fetched)
+        return found
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version) is not _MISSING
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version)
+        self.shared.set(key, value, timeout, version)
+        if self._is_local(key):
+            self._local_set(local_key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version)
+        if not self.shared.add(key, value, timeout, version):
+            return False
+        if self._is_local(key):
+            self._local_set(local_key, value, timeout)
+        return True
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version)
+        local_keys = {key: self.make_and_validate_key(key, version) for key in data}
+        for key, value in data.items():
+            if key not in failed and self._is_local(key):
+                self._local_set(local_keys[key], value, timeout)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        # The local copy keeps its own, shorter expiry
+        return self.shared.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        local_key = self.make_and_validate_key(key, version)
+        deleted = self.shared.delete(key, version)
+        self._local_delete(local_key)
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.shared.delete_many(keys, version)
+        for key in keys:
+            self._local_delete(self.make_and_validate_key(key, version))
+
+    def incr(self, key, delta=1, version=None):
+        local_key = self.make_and_validate_key(key, version)
+        value = self.shared.incr(key, delta, version)
+        if self._is_local(key):
+            # The shared tier doesn't say how long the key has left, so keep the local default
+            self._local_set(local_key, value, None)
+        return value
+
+    def clear(self):
+        self.shared.clear()
+        # Tell the other processes to empty their local tiers too
+        generation = uuid.uuid4().hex
+        self.shared.set(GENERATION_KEY, generation, None)
+        with self._lock:
+            self._local.clear()
+            self._tier.generation = generation
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    # Statistics
+
+    def tier_stats(self):
+        """Hit, miss and eviction counts of this process, with the local tier's size"""
+        with self._lock:
+            return {**self._tier.stats, 'local_entries': len(self._local)}
+
+    def reset_tier_stats(self):
+        with self._lock:
+            self._tier.stats = dict.fromkeys(TIER_STATS, 0)
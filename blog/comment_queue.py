@@ -0,0 +1,212 @@
+"""
+Write-behind queue for new comments.
+
+With ``BLOG_COMMENT_QUEUE_ENABLED`` on, ``post_detail`` validates a submitted
+comment and writes it to a spool directory instead of the database, so a
+burst of comments never holds the database write lock inside requests.
+``manage.py process_comment_queue`` commits the spooled comments in batches.
+
+The spool (``BLOG_COMMENT_SPOOL_DIR``) works like a maildir: a comment is
+written to ``tmp/``, flushed to disk and atomically renamed into ``new/``.
+A worker claims a batch by renaming files into ``cur/``, inserts the
+comments in one transaction and then deletes the files; comments that can no
+longer be stored (deleted post or user) are moved to ``failed/``. Files left
+in ``cur/`` by a crashed worker go back to ``new/`` after
+``STALE_CLAIM_SECONDS``. Each comment keeps the time it was submitted as its
+``created_at``, and a comment already stored with the same post, author and
+``created_at`` is not inserted twice, so replaying a claim is safe.
+
+Until a comment is committed only its author sees it: the session keeps a
+rendered copy that ``pending_comments`` returns while the spool file still
+exists. Queued comments are stored with the model default ``is_active=True``
+and can be moderated in the admin like any other comment.
+"""
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+
+from . import counters, page_cache, rendering
+from .timestamps import bulk_create_keeping_timestamps
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = 'blog_pending_comments'
+STALE_CLAIM_SECONDS = 300
+
+
+def is_enabled():
+    return getattr(settings, 'BLOG_COMMENT_QUEUE_ENABLED', False)
+
+
+def spool_directory(state):
+    root = getattr(settings, 'BLOG_COMMENT_SPOOL_DIR', os.path.join(settings.BASE_DIR, 'spool', 'comments'))
+    return os.path.join(root, state)
+
+
+def _ensure_directories():
+    for state in ('tmp', 'new', 'cur', 'failed'):
+        os.makedirs(spool_directory(state), exist_ok=True)
+
+
+def _spool_path(state, name):
+    return os.path.join(spool_directory(state), name)
+
+
+def enqueue(request, post, content):
+    """Spool a validated comment by ``request.user`` on ``post`` and remember it in the session"""
+    _ensure_directories()
+    created_at = timezone.now()
+    # Names sort by submission time, so workers commit comments in order
+    name = f'{time.time_ns():020d}-{uuid.uuid4().hex}.json'
+    payload = {
+        'post_id': post.pk,
+        'author_id': request.user.pk,
+        'content': content,
+        'created_at': created_at.isoformat(),
+    }
+    temporary = _spool_path('tmp', name)
+    with open(temporary, 'w') as f:
+        json.dump(payload, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, _spool_path('new', name))
+
+    pending = request.session.get(SESSION_KEY, [])
+    pending.append({
+        'name': name,
+        'post_id': post.pk,
+        'content_html': rendering.render_markdown(content, rendering.COMMENT_EXTENSIONS),
+        'created_at': payload['created_at'],
+    })
+    request.session[SESSION_KEY] = pending
+    return name
+
+
+def _is_pending(name):
+    return os.path.exists(_spool_path('new', name)) or os.path.exists(_spool_path('cur', name))
+
+
+def pending_comments(request, post_id):
+    """Return the visitor's own comments on ``post_id`` that are still waiting in the spool"""
+    pending = request.session.get(SESSION_KEY)
+    if not pending:
+        return []
+    still_pending = [entry for entry in pending if _is_pending(entry['name'])]
+    if len(still_pending) != len(pending):
+        request.session[SESSION_KEY] = still_pending
+    return [
+        {**entry, 'created_at': datetime.fromisoformat(entry['created_at'])}
+        for entry in still_pending if entry['post_id'] == post_id
+    ]
+
+
+def queued_count():
+    try:
+        return len(os.listdir(spool_directory('new')))
+    except FileNotFoundError:
+        return 0
+
+
+def recover_stale_claims(max_age=STALE_CLAIM_SECONDS):
+    """Return files claimed by a worker that died back to ``new/``; return how many"""
+    _ensure_directories()
+    recovered = 0
+    cutoff = time.time() - max_age
+    for name in os.listdir(spool_directory('cur')):
+        path = _spool_path('cur', name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.replace(path, _spool_path('new', name))
+                recovered += 1
+        except FileNotFoundError:
+            pass
+    return recovered
+
+
+def _claim(batch_size):
+    claimed = []
+    for name in sorted(os.listdir(spool_directory('new'))):
+        if len(claimed) >= batch_size:
+            break
+        try:
+            os.replace(_spool_path('new', name), _spool_path('cur', name))
+        except FileNotFoundError:
+            # Another worker claimed it first
+            continue
+        # Renaming keeps the old mtime; touch it so the claim isn't mistaken for a stale one
+        os.utime(_spool_path('cur', name))
+        claimed.append(name)
+    return claimed
+
+
+def _fail(name, reason):
+    logger.warning('Dropping queued comment %s: %s', name, reason)
+    os.replace(_spool_path('cur', name), _spool_path('failed', name))
+
+
+def process_batch(batch_size=500):
+    """Commit up to ``batch_size`` queued comments; return ``(committed, failed)``"""
+    from django.contrib.auth.models import User
+
+    from .models import Comment, Post
+
+    _ensure_directories()
+    payloads = {}
+    failed = 0
+    for name in _claim(batch_size):
+        try:
+            with open(_spool_path('cur', name)) as f:
+                payloads[name] = json.load(f)
+        except ValueError as e:
+            _fail(name, f'unreadable spool file ({e})')
+            failed += 1
+    if not payloads:
+        return 0, failed
+
+    post_ids = set(Post.objects.filter(
+        pk__in={payload['post_id'] for payload in payloads.values()}, status='published',
+    ).values_list('pk', flat=True))
+    author_ids = set(User.objects.filter(
+        pk__in={payload['author_id'] for payload in payloads.values()}, is_active=True,
+    ).values_list('pk', flat=True))
+
+    comments = {}
+    for name, payload in payloads.items():
+        if payload['post_id'] not in post_ids or payload['author_id'] not in author_ids:
+            _fail(name, 'post or author no longer available')
+            failed += 1
+            continue
+        created_at = datetime.fromisoformat(payload['created_at'])
+        comment = Comment(
+            post_id=payload['post_id'], author_id=payload['author_id'], content=payload['content'],
+            created_at=created_at, updated_at=created_at,
+        )
+        rendering.refresh_rendered(comment, rendering.COMMENT_EXTENSIONS)
+        comments[name] = comment
+
+    using = router.db_for_write(Comment)
+    with transaction.atomic(using=using):
+        # A replayed claim (worker died after commit) must not insert twice
+        existing = set(
+            Comment.objects.filter(
+                post_id__in={c.post_id for c in comments.values()},
+                created_at__in={c.created_at for c in comments.values()},
+            ).values_list('post_id', 'author_id', 'created_at')
+        )
+        new = [c for c in comments.values() if (c.post_id, c.author_id, c.created_at) not in existing]
+        bulk_create_keeping_timestamps(Comment, new, using=using)
+
+    # bulk_create skips the signal handlers
+    touched = {comment.post_id for comment in comments.values()}
+    counters.refresh_comment_counts(touched)
+    page_cache.invalidate(counters.COMMENTS_TAG, *(f'post:{post_id}' for post_id in touched))
+    for name in comments:
+        os.remove(_spool_path('cur', name))
+    return len(comments), failed
@@ -0,0 +1,88 @@
+"""
+Conditional GET support (ETag / Last-Modified / 304) for the public views.
+
+Each view supplies a cheap validator function that renders nothing: it
+reads the newest edit time from an index and the page cache tag versions of
+the posts, names and counts the page shows. The ETag is a
+hash of those values, the request path and whether the visitor is
+anonymous or which user is logged in, so the two audiences never share a
+validator. Responses also get ``Cache-Control`` and ``Vary`` headers that keep
+shared caches from handing an authenticated page to anyone else.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+
+def _validators(request, validator, args, kwargs):
+    """Return (last_modified, etag) for ``request``, computed at most once"""
+    if not hasattr(request, '_conditional_validators'):
+        result = None
+        # A pending flash message must not be hidden behind a 304
+        if 'messages' not in request.COOKIES:
+            result = validator(request, *args, **kwargs)
+        if result is not None:
+            last_modified, parts = result
+            audience = f'user:{request.user.pk}' if request.user.is_authenticated else 'anonymous'
+            source = '|'.join(str(part) for part in (request.get_full_path(), audience, last_modified, *parts))
+            result = (last_modified, hashlib.sha1(source.encode()).hexdigest())
+        request._conditional_validators = result
+    return request._conditional_validators
+
+
+def patch_audience_headers(request, response):
+    """Allow shared caching of anonymous pages only, and vary on the session cookie"""
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'BLOG_HTTP_MAX_AGE', 60))
+    patch_vary_headers(response, ('Cookie',))
+
+
+def conditional_page(validator):
+    """
+    Answer conditional GETs for a view with 304 Not Modified when possible.
+
+    ``validator(request, *args, **kwargs)`` returns ``(last_modified, parts)``,
+    where ``parts`` is a tuple of values that change whenever the page does,
+    or None when the object does not exist.
+    """
+    def decorator(view_func):
+        def etag_func(request, *args, **kwargs):
+            result = _validators(request, validator, args, kwargs)
+            return result[1] if result else None
+
+        def last_modified_func(request, *args, **kwargs):
+            result = _validators(request, validator, args, kwargs)
+            return result[0] if result else None
+
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view_func)
+
+        if iscoroutinefunction(view_func):
+            def prepare(request, args, kwargs):
+                # Load the user and memoize the validators so condition() and the
+                # headers below don't touch the database from the event loop
+                request.user.is_authenticated
+                _validators(request, validator, args, kwargs)
+
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                await sync_to_async(prepare)(request, args, kwargs)
+                response = await conditional_view(request, *args, **kwargs)
+                if request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+                    patch_audience_headers(request, response)
+                return response
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+                patch_audience_headers(request, response)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,116 @@
+"""
+Denormalized counters: active comments per post and published posts per
+category and tag.
+
+The signal handlers in ``blog.signals`` apply incremental ``F()`` updates
+inside the transaction of the triggering save or delete. Anything that
+bypasses signals (``QuerySet.update()``, ``bulk_create()``, raw SQL) should
+call the ``refresh_*`` helpers afterwards, and ``repair_counters`` fixes any
+drift that slipped through.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .routers import comments_are_separate
+
+# Page cache tag bumped whenever any ``comment_count`` may have changed, for list page ETags
+COMMENTS_TAG = 'counts:comments'
+
+
+def _bump(model, pks, field, delta):
+    pks = {pk for pk in pks if pk is not None}
+    if pks and delta:
+        # Clamp at zero so pre-existing drift can never break a delete; repair_counters fixes it
+        value = F(field) + delta if delta > 0 else Greatest(F(field) + delta, Value(0))
+        model.objects.filter(pk__in=pks).update(**{field: value})
+
+
+def adjust_comment_counts(post_ids, delta):
+    from .models import Post
+    _bump(Post, post_ids, 'comment_count', delta)
+
+
+def adjust_category_counts(category_ids, delta):
+    from .models import Category
+    _bump(Category, category_ids, 'post_count', delta)
+
+
+def adjust_tag_counts(tag_ids, delta):
+    from .models import Tag
+    _bump(Tag, tag_ids, 'post_count', delta)
+
+
+def _count_subquery(queryset, group_field):
+    counts = queryset.order_by().values(group_field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def _refresh(queryset, field, actual):
+    """Rewrite ``field`` for rows whose stored value differs from ``actual``; return the number fixed"""
+    stale = list(
+        queryset.annotate(actual=actual).exclude(**{field: F('actual')}).values_list('pk', flat=True)
+    )
+    if stale:
+        queryset.model.objects.filter(pk__in=stale).update(**{field: actual})
+    return len(stale)
+
+
+def _refresh_from_counts(queryset, field, counts):
+    """``_refresh`` for counts computed in another database: ``counts`` maps pk to the actual value"""
+    stale = defaultdict(list)
+    for pk, stored in queryset.values_list('pk', field).iterator():
+        actual = counts.get(pk, 0)
+        if stored != actual:
+            stale[actual].append(pk)
+    for actual, pks in stale.items():
+        for start in range(0, len(pks), 500):
+            queryset.model.objects.filter(pk__in=pks[start:start + 500]).update(**{field: actual})
+    return sum(len(pks) for pks in stale.values())
+
+
+def refresh_comment_counts(post_ids=None):
+    """Recompute ``Post.comment_count`` for the given posts (all posts when None)"""
+    from .models import Comment, Post
+
+    posts = Post.objects.all() if post_ids is None else Post.objects.filter(pk__in=post_ids)
+    comments = Comment.objects.filter(is_active=True)
+    if comments_are_separate():
+        # No cross-database subquery: count in the comments database, compare in Python
+        if post_ids is not None:
+            comments = comments.filter(post_id__in=post_ids)
+        counts = dict(comments.order_by().values('post_id').annotate(total=Count('pk')).values_list('post_id', 'total'))
+        return _refresh_from_counts(posts, 'comment_count', counts)
+    actual = _count_subquery(comments.filter(post=OuterRef('pk')), 'post')
+    return _refresh(posts, 'comment_count', actual)
+
+
+def refresh_category_counts(category_ids=None):
+    """Recompute ``Category.post_count`` for the given categories (all when None)"""
+    from .models import Category, Post
+
+    categories = Category.objects.all() if category_ids is None else Category.objects.filter(pk__in=category_ids)
+    actual = _count_subquery(Post.objects.filter(category=OuterRef('pk'), status='published'), 'category')
+    return _refresh(categories, 'post_count', actual)
+
+
+def refresh_tag_counts(tag_ids=None):
+    """Recompute ``Tag.post_count`` for the given tags (all when None)"""
+    from .models import Post, Tag
+
+    tags = Tag.objects.all() if tag_ids is None else Tag.objects.filter(pk__in=tag_ids)
+    through = Post.tags.through
+    actual = _count_subquery(through.objects.filter(tag=OuterRef('pk'), post__status='published'), 'tag')
+    return _refresh(tags, 'post_count', actual)
+
+
+def repair_counters():
+    """Recompute every counter, returning the number of rows fixed per counter"""
+    with transaction.atomic():
+        return {
+            'post.comment_count': refresh_comment_counts(),
+            'category.post_count': refresh_category_counts(),
+            'tag.post_count': refresh_tag_counts(),
+        }
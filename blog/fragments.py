@@ -0,0 +1,43 @@
+"""
+Cached template fragments: post cards, post bodies and comments.
+
+Pages for logged-in visitors can't be cached whole (see ``blog.page_cache``),
+but most of their markup is the same for everyone. The ``{% fragment %}``
+tag in ``blog_fragments`` caches such a block under a key built from the
+object's primary key and the version values given in the template (its
+``updated_at``, counts it shows ...), so an edit simply makes the next
+render use a new key. Blocks with controls for the object's owner also vary
+on whether the visitor is the owner or staff.
+
+Inside a loop the tag can look up the fragments of every object in the list
+with one ``get_many`` before rendering the first of them. Changes that
+alter a fragment without touching its object's version (renaming a tag,
+category or user) invalidate the ``fragments`` page cache tag, whose version
+is part of every key.
+"""
+import hashlib
+
+from django.conf import settings
+
+from . import page_cache
+
+FRAGMENTS_TAG = 'fragments'
+KEY_PREFIX = 'blog:fragment'
+
+
+def is_enabled():
+    return getattr(settings, 'BLOG_FRAGMENT_CACHE_ENABLED', True)
+
+
+def timeout():
+    return getattr(settings, 'BLOG_FRAGMENT_CACHE_TIMEOUT', 60 * 60)
+
+
+def generation():
+    return page_cache.tag_versions([FRAGMENTS_TAG])[FRAGMENTS_TAG]
+
+
+def fragment_key(name, generation, vary_on):
+    """Cache key of fragment ``name`` for the values in ``vary_on``"""
+    digest = hashlib.md5(':'.join(str(value) for value in vary_on).encode(), usedforsecurity=False).hexdigest()
+    return f'{KEY_PREFIX}:{name}:{generation}:{digest}'
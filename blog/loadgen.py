@@ -0,0 +1,186 @@
+"""
+Synthetic data for load testing.
+
+Generates users, categories, tags, posts, tag links and comments with
+production-like shapes: tag popularity follows a Zipf curve, comment counts
+per post have a long tail, and a share of posts stay drafts. Everything is
+written with batched ``bulk_create`` calls (tag links go straight into the
+M2M through table), so signal handlers do not run; counters are computed
+while generating and the search and related-post indexes are rebuilt at the
+end. The same seed always produces the same data.
+"""
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from . import page_cache, related, rendering, search
+from .models import Category, Comment, Post, Tag, build_summary
+from .pagination import POSTS_COUNT_TAG, SEARCH_COUNT_TAG
+from .sidebar import SIDEBAR_TAG
+from .timestamps import manual_timestamps
+
+WORDS = (
+    'django python web design travel food coffee data cloud server cache query index '
+    'garden music photo city river mountain ocean recipe bread pasta startup market '
+    'story history science space code testing deploy linux mobile health fitness '
+    'book film review guide tips habit focus team remote work learning open source'
+).split()
+
+SENTENCES = (
+    'Great article, thanks for sharing.',
+    'I tried this and it worked perfectly.',
+    'Could you expand on the second point?',
+    'This is exactly what I was looking for.',
+    'I disagree with part of this, but it is well argued.',
+    'Bookmarked for later.',
+    'Any follow-up planned on this topic?',
+)
+
+
+class LoadGenerator:
+    """Generate a reproducible synthetic dataset; see the module docstring"""
+
+    def __init__(self, seed=0, prefix='load', batch_size=2000, progress=None):
+        self.rng = random.Random(seed)
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.progress = progress or (lambda message: None)
+        self.now = timezone.now()
+
+    def _title(self, words=6):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words)).capitalize()
+
+    def _body(self):
+        sections = []
+        for _ in range(self.rng.randint(2, 5)):
+            sections.append(f'## {self._title(3)}')
+            for _ in range(self.rng.randint(1, 3)):
+                sections.append(' '.join(self._title(self.rng.randint(8, 16)) + '.' for _ in range(4)))
+            if self.rng.random() < 0.4:
+                sections.append('\n'.join(f'- {self._title(4)}' for _ in range(self.rng.randint(2, 5))))
+        return '\n\n'.join(sections)
+
+    def _rendered_pool(self, sources, extensions):
+        return [(source, rendering.render_markdown(source, extensions), rendering.content_hash(source))
+                for source in sources]
+
+    def _long_tail(self, mean, cap=2000):
+        # Pareto(alpha=2) minus one has mean 1 and a heavy tail
+        return min(cap, int(mean * (self.rng.paretovariate(2.0) - 1)))
+
+    def create_users(self, count):
+        password = make_password(None)
+        users = User.objects.bulk_create(
+            [User(username=f'{self.prefix}_user{i}', password=password) for i in range(count)],
+            batch_size=self.batch_size,
+        )
+        self.progress(f'{count} users')
+        return [user.pk for user in users]
+
+    def create_categories(self, count):
+        categories = Category.objects.bulk_create(
+            [Category(name=f'{self.rng.choice(WORDS).title()} {self.prefix} {i}') for i in range(count)],
+            batch_size=self.batch_size,
+        )
+        self.progress(f'{count} categories')
+        return [category.pk for category in categories]
+
+    def create_tags(self, count):
+        tags = Tag.objects.bulk_create(
+            [Tag(name=f'{self.rng.choice(WORDS)}-{self.prefix}-{i}') for i in range(count)],
+            batch_size=self.batch_size,
+        )
+        self.progress(f'{count} tags')
+        return [tag.pk for tag in tags]
+
+    def generate(self, posts=10000, users=1000, categories=20, tags=500, comments_per_post=3.0,
+                 draft_ratio=0.1, days=3 * 365, tag_skew=1.1):
+        """Create the dataset and return a dict of row counts"""
+        user_ids = self.create_users(users)
+        category_ids = self.create_categories(categories)
+        tag_ids = self.create_tags(tags)
+        # Zipf-like popularity: the n-th tag is picked proportionally to 1 / n^skew
+        tag_weights = [1.0 / (rank ** tag_skew) for rank in range(1, len(tag_ids) + 1)]
+
+        bodies = self._rendered_pool([self._body() for _ in range(200)], rendering.POST_EXTENSIONS)
+        replies = self._rendered_pool(SENTENCES, rendering.COMMENT_EXTENSIONS)
+        category_counts = dict.fromkeys(category_ids, 0)
+        tag_counts = dict.fromkeys(tag_ids, 0)
+        totals = {'posts': 0, 'tag_links': 0, 'comments': 0}
+        through = Post.tags.through
+
+        with manual_timestamps(Post, Comment):
+            for start in range(0, posts, self.batch_size):
+                size = min(self.batch_size, posts - start)
+                batch, links, comment_plan = [], [], []
+                for i in range(start, start + size):
+                    created = self.now - timedelta(seconds=self.rng.uniform(0, days * 86400))
+                    published = self.rng.random() >= draft_ratio
+                    source, html, digest = self.rng.choice(bodies)
+                    category_id = self.rng.choice(category_ids) if category_ids else None
+                    post_tags = set(self.rng.choices(tag_ids, tag_weights, k=self.rng.randint(1, 5))) if tag_ids else set()
+                    active = [self.rng.random() < 0.95 for _ in range(self._long_tail(comments_per_post))] if published else []
+                    excerpt = self._title(12) if self.rng.random() < 0.5 else ''
+                    batch.append(Post(
+                        title=self._title(), slug=f'{self.prefix}-post-{i}',
+                        author_id=self.rng.choice(user_ids), content=source, content_html=html,
+                        content_hash=digest, excerpt=excerpt, summary=build_summary(excerpt, source),
+                        category_id=category_id, status='published' if published else 'draft',
+                        comment_count=sum(active), created_at=created, updated_at=created,
+                        published_at=created if published else None,
+                    ))
+                    links.append(post_tags)
+                    comment_plan.append((created, active))
+                    if published:
+                        if category_id:
+                            category_counts[category_id] += 1
+                        for tag_id in post_tags:
+                            tag_counts[tag_id] += 1
+
+                with transaction.atomic():
+                    Post.objects.bulk_create(batch)
+                    through.objects.bulk_create(
+                        [through(post_id=post.pk, tag_id=tag_id) for post, post_tags in zip(batch, links) for tag_id in post_tags],
+                        batch_size=self.batch_size,
+                    )
+                    comments = []
+                    for post, (created, active) in zip(batch, comment_plan):
+                        for is_active in active:
+                            source, html, digest = self.rng.choice(replies)
+                            # Most comments arrive within a few days of publication
+                            when = min(self.now, created + timedelta(hours=self.rng.expovariate(1 / 48)))
+                            comments.append(Comment(
+                                post_id=post.pk, author_id=self.rng.choice(user_ids), content=source,
+                                content_html=html, content_hash=digest, is_active=is_active,
+                                created_at=when, updated_at=when,
+                            ))
+                    Comment.objects.bulk_create(comments, batch_size=self.batch_size)
+
+                totals['posts'] += len(batch)
+                totals['tag_links'] += sum(len(tag_set) for tag_set in links)
+                totals['comments'] += len(comments)
+                self.progress(f'{totals["posts"]}/{posts} posts, {totals["comments"]} comments')
+
+        with transaction.atomic():
+            Category.objects.bulk_update(
+                [Category(pk=pk, post_count=count) for pk, count in category_counts.items()], ['post_count'],
+                batch_size=self.batch_size,
+            )
+            Tag.objects.bulk_update(
+                [Tag(pk=pk, post_count=count) for pk, count in tag_counts.items()], ['post_count'],
+                batch_size=self.batch_size,
+            )
+        totals.update(users=len(user_ids), categories=len(category_ids), tags=len(tag_ids))
+        return totals
+
+    def rebuild_derived(self, search_index=True, related_posts=False):
+        """Refresh the indexes that bulk inserts bypass"""
+        if search_index:
+            self.progress(f'search index: {search.rebuild_index()} posts')
+        if related_posts:
+            related.rebuild_all(progress=lambda done: self.progress(f'related posts: {done} posts'))
+        page_cache.invalidate('list:home', POSTS_COUNT_TAG, SEARCH_COUNT_TAG, SIDEBAR_TAG)
@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from blog import benchmarks, query_plans, view_counts
+from blog.cache import TEST_CACHES
+from blog.loadgen import LoadGenerator
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN QUERY PLAN on the queries behind each view and flag full scans and temporary sorts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=2000,
+                            help='Number of posts to generate (default: 2000)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the dataset (default: 0)')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the test database between runs and reuse its data')
+        parser.add_argument('--analyze', action='store_true',
+                            help='Run ANALYZE first so the planner uses table statistics')
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help='Only audit this scenario; may be given several times')
+        parser.add_argument('--ignore-table', action='append', dest='ignore_tables', default=[],
+                            help='Do not flag full scans of this (small) table; may be given several times')
+        parser.add_argument('--show-plans', action='store_true', help='Print the SQL and plan of every query')
+        parser.add_argument('--strict', action='store_true', help='Exit with an error when any problem is found')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        # Cache in memory so nothing computed from the test database reaches the site's cache
+        test_caches = override_settings(CACHES=TEST_CACHES)
+        test_caches.enable()
+        old_names = []
+        for alias in connections:
+            connection = connections[alias]
+            old_names.append((connection, connection.settings_dict['NAME']))
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if not Post.objects.exists():
+                self.stdout.write(f'Generating {options["posts"]} posts...')
+                generator = LoadGenerator(seed=options['seed'], prefix='bench')
+                generator.generate(posts=options['posts'], users=max(10, options['posts'] // 20))
+                generator.rebuild_derived(related_posts=True)
+            if options['analyze']:
+                for alias in connections:
+                    with connections[alias].cursor() as cursor:
+                        cursor.execute('ANALYZE')
+
+            scenarios = benchmarks.build_scenarios()
+            if options['scenarios']:
+                scenarios = [scenario for scenario in scenarios if scenario.name in options['scenarios']]
+            # Cached pages and counts would hide the queries being audited
+            with override_settings(BLOG_PAGE_CACHE_ENABLED=False, BLOG_COUNT_CACHE_TIMEOUT=0):
+                report = query_plans.audit(scenarios, ignore_tables=options['ignore_tables'])
+        finally:
+            # Write the views counted so far to the test database, not to the real one at exit
+            view_counts.drain()
+            for connection, old_name in old_names:
+                connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+            test_caches.disable()
+
+        total = 0
+        for name, entries in report.items():
+            flagged = [entry for entry in entries if entry['problems']]
+            total += sum(len(entry['problems']) for entry in flagged)
+            style = self.style.WARNING if flagged else self.style.SUCCESS
+            self.stdout.write(style(f'{name}: {len(entries)} queries, {len(flagged)} with problems'))
+            for entry in entries if options['show_plans'] else flagged:
+                self.stdout.write(f'  [{entry["alias"]}] {entry["sql"]}')
+                for line in entry['plan']:
+                    marker = '!' if line.strip() in entry['problems'] else ' '
+                    self.stdout.write(f'   {marker} {line}')
+
+        if total and options['strict']:
+            raise CommandError(f'{total} query plan problems found')
+        if not total:
+            self.stdout.write(self.style.SUCCESS('No full scans or temporary sorts found.'))
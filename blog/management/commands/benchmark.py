@@ -0,0 +1,93 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from blog import benchmarks, view_counts
+from blog.cache import TEST_CACHES
+from blog.loadgen import LoadGenerator
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the blog views against a generated test database and compare with a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=2000,
+                            help='Number of posts to generate (default: 2000)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the dataset (default: 0)')
+        parser.add_argument('--iterations', type=int, default=50,
+                            help='Measured requests per scenario (default: 50)')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Unmeasured requests per scenario before measuring (default: 5)')
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help='Only run this scenario; may be given several times')
+        parser.add_argument('--with-page-cache', action='store_true',
+                            help='Leave the anonymous page cache on (measures cache hits instead of the views)')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the test database between runs and reuse its data')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Compare against a JSON file written by an earlier run')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed p50 latency growth before failing, as a fraction (default: 0.2)')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Could not read baseline {options["baseline"]}: {e}')
+
+        setup_test_environment()
+        # Cache in memory so nothing computed from the test database reaches the site's cache
+        test_caches = override_settings(CACHES=TEST_CACHES)
+        test_caches.enable()
+        old_names = []
+        for alias in connections:
+            connection = connections[alias]
+            old_names.append((connection, connection.settings_dict['NAME']))
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if not Post.objects.exists():
+                self.stdout.write(f'Generating {options["posts"]} posts...')
+                generator = LoadGenerator(seed=options['seed'], prefix='bench')
+                generator.generate(posts=options['posts'], users=max(10, options['posts'] // 20))
+                generator.rebuild_derived(related_posts=True)
+
+            scenarios = benchmarks.build_scenarios()
+            if options['scenarios']:
+                scenarios = [scenario for scenario in scenarios if scenario.name in options['scenarios']]
+            with override_settings(BLOG_PAGE_CACHE_ENABLED=options['with_page_cache']):
+                report = benchmarks.run(
+                    scenarios, iterations=options['iterations'], warmup=options['warmup'],
+                    progress=self.write_result,
+                )
+        finally:
+            # Write the views counted so far to the test database, not to the real one at exit
+            view_counts.drain()
+            for connection, old_name in old_names:
+                connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+            test_caches.disable()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+        if baseline is not None:
+            regressions = benchmarks.compare(report, baseline, options['threshold'])
+            if regressions:
+                raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def write_result(self, name, result):
+        latency = result['latency_ms']
+        self.stdout.write(
+            f'{name:<22} p50 {latency["p50"]:8.2f} ms  p90 {latency["p90"]:8.2f} ms  '
+            f'p99 {latency["p99"]:8.2f} ms  {result["queries"]:3d} queries  '
+            f'{result["sql_ms"]:7.2f} ms SQL  {result["bytes"]:7d} bytes'
+        )
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from blog import async_views, benchmarks, view_counts, views
+from blog.cache import TEST_CACHES
+from blog.loadgen import LoadGenerator
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Compare throughput and tail latency of the sync (WSGI) and async (ASGI) read views under concurrent load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=2000,
+                            help='Number of posts to generate (default: 2000)')
+        parser.add_argument('--concurrency', type=int, default=16,
+                            help='Concurrent clients (default: 16)')
+        parser.add_argument('--requests', type=int, default=400,
+                            help='Requests per run (default: 400)')
+        parser.add_argument('--with-page-cache', action='store_true',
+                            help='Leave the anonymous page cache on')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        # Cache in memory so nothing computed from the test database reaches the site's cache
+        test_caches = override_settings(CACHES=TEST_CACHES)
+        test_caches.enable()
+        old_names = []
+        for alias in connections:
+            connection = connections[alias]
+            old_names.append((connection, connection.settings_dict['NAME']))
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.stdout.write(f'Generating {options["posts"]} posts...')
+            generator = LoadGenerator(prefix='bench')
+            generator.generate(posts=options['posts'], users=max(10, options['posts'] // 20))
+            generator.rebuild_derived(related_posts=True)
+
+            runs = (
+                ('wsgi', views, benchmarks.run_wsgi_load),
+                ('asgi', async_views, benchmarks.run_asgi_load),
+            )
+            for name, read_views, run in runs:
+                with override_settings(ROOT_URLCONF=benchmarks.read_view_urlconf(read_views),
+                                       BLOG_PAGE_CACHE_ENABLED=options['with_page_cache']):
+                    post_ids = Post.objects.filter(status='published').order_by('-created_at').values_list('pk', flat=True)
+                    paths = [reverse('blog:post_list')] + [reverse('blog:post_detail', args=[pk]) for pk in post_ids[:20]]
+                    result = run(paths, options['concurrency'], options['requests'])
+                latency = result['latency_ms']
+                self.stdout.write(
+                    f'{name}  {result["requests_per_second"]:8.1f} req/s  p50 {latency["p50"]:8.2f} ms  '
+                    f'p90 {latency["p90"]:8.2f} ms  p99 {latency["p99"]:8.2f} ms  {result["errors"]} errors'
+                )
+        finally:
+            # Write the views counted so far to the test database, not to the real one at exit
+            view_counts.drain()
+            for connection, old_name in old_names:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            test_caches.disable()
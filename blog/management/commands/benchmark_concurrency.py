@@ -0,0 +1,54 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from blog import benchmarks
+from blog_project.sqlite3.base import DEFAULT_PRAGMAS
+
+MODES = {
+    'default': {'ENGINE': 'django.db.backends.sqlite3', 'OPTIONS': {}},
+    'tuned': {
+        'ENGINE': 'blog_project.sqlite3',
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'pragmas': DEFAULT_PRAGMAS},
+    },
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare reader and writer throughput of plain and tuned SQLite settings on a scratch database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Reader threads (default: 8)')
+        parser.add_argument('--writers', type=int, default=2, help='Writer threads (default: 2)')
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per mode (default: 5)')
+
+    def handle(self, *args, **options):
+        modes = dict(MODES)
+        default = settings.DATABASES['default']
+        if default['ENGINE'] == 'blog_project.sqlite3':
+            # Measure the options this site actually runs with
+            modes['tuned'] = {'ENGINE': default['ENGINE'], 'OPTIONS': default.get('OPTIONS', {})}
+
+        with tempfile.TemporaryDirectory() as directory:
+            for mode, config in modes.items():
+                alias = f'benchmark_{mode}'
+                connections.settings[alias] = connections.configure_settings({
+                    'default': dict(default),
+                    alias: {**config, 'NAME': os.path.join(directory, f'{mode}.sqlite3')},
+                })[alias]
+                try:
+                    result = benchmarks.run_concurrency(
+                        alias, options['readers'], options['writers'], options['duration'],
+                    )
+                finally:
+                    connections[alias].close()
+                    del connections.settings[alias]
+                latency = result['write_latency_ms']
+                self.stdout.write(
+                    f'{mode:<8} {result["reads_per_second"]:9.1f} reads/s  {result["writes_per_second"]:8.1f} writes/s  '
+                    f'{result["lock_errors"]:5d} lock errors  write p50 {latency["p50"]} ms  p99 {latency["p99"]} ms'
+                )
+        self.stdout.write(self.style.SUCCESS('Done.'))
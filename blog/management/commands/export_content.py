@@ -0,0 +1,23 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from blog.archive import export_archive, open_archive
+
+
+class Command(BaseCommand):
+    help = 'Export users, categories, tags, posts and comments to a JSONL archive (gzip when the name ends in .gz)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Archive file to write, e.g. blog.jsonl.gz; "-" writes to stdout')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of posts read per query (default: 1000)')
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            export_archive(sys.stdout, chunk_size=options['chunk_size'])
+            return
+        with open_archive(options['path'], 'w') as out:
+            totals = export_archive(out, chunk_size=options['chunk_size'], progress=self.stdout.write)
+        summary = ', '.join(f'{count} {name}' for name, count in totals.items())
+        self.stdout.write(self.style.SUCCESS(f'Exported {summary} to {options["path"]}.'))
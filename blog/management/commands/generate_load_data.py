@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.loadgen import LoadGenerator
+
+
+class Command(BaseCommand):
+    help = 'Generate a large, reproducible synthetic dataset for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10000, help='Number of posts (default: 10000)')
+        parser.add_argument('--users', type=int, default=1000, help='Number of users (default: 1000)')
+        parser.add_argument('--categories', type=int, default=20, help='Number of categories (default: 20)')
+        parser.add_argument('--tags', type=int, default=500, help='Number of tags (default: 500)')
+        parser.add_argument('--comments-per-post', type=float, default=3.0,
+                            help='Average comments per published post; the distribution is long-tailed (default: 3)')
+        parser.add_argument('--draft-ratio', type=float, default=0.1,
+                            help='Share of posts left as drafts (default: 0.1)')
+        parser.add_argument('--days', type=int, default=3 * 365,
+                            help='Spread post dates over this many days (default: 1095)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+        parser.add_argument('--prefix', default='load',
+                            help='Prefix for generated usernames, slugs and names; must be unique per run (default: load)')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Number of posts to insert per batch (default: 2000)')
+        parser.add_argument('--skip-search-index', action='store_true',
+                            help='Do not rebuild the search index afterwards')
+        parser.add_argument('--related-posts', action='store_true',
+                            help='Also rebuild the related-posts index (slow for large datasets)')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('At least one user is required.')
+        if not 0 <= options['draft_ratio'] <= 1:
+            raise CommandError('--draft-ratio must be between 0 and 1.')
+
+        generator = LoadGenerator(
+            seed=options['seed'],
+            prefix=options['prefix'],
+            batch_size=options['batch_size'],
+            progress=self.stdout.write,
+        )
+        totals = generator.generate(
+            posts=options['posts'],
+            users=options['users'],
+            categories=options['categories'],
+            tags=options['tags'],
+            comments_per_post=options['comments_per_post'],
+            draft_ratio=options['draft_ratio'],
+            days=options['days'],
+        )
+        generator.rebuild_derived(
+            search_index=not options['skip_search_index'],
+            related_posts=options['related_posts'],
+        )
+        summary = ', '.join(f'{count} {name.replace("_", " ")}' for name, count in totals.items())
+        self.stdout.write(self.style.SUCCESS(f'Generated {summary}.'))
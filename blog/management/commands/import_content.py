@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import related
+from blog.archive import ArchiveError, import_archive, open_archive
+
+
+class Command(BaseCommand):
+    help = 'Import a JSONL archive written by export_content, reusing existing users, categories and tags'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Archive file to read (gzip when the name ends in .gz); "-" reads stdin')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of posts inserted per batch (default: 1000)')
+        parser.add_argument('--slug-conflict', choices=('skip', 'rename'), default='skip',
+                            help='What to do with posts whose slug already exists (default: skip)')
+        parser.add_argument('--rerender', action='store_true',
+                            help='Render the Markdown again instead of reusing the HTML stored in the archive')
+        parser.add_argument('--related-posts', action='store_true',
+                            help='Rebuild the related-posts index afterwards (slow for large archives)')
+
+    def handle(self, *args, **options):
+        kwargs = {
+            'batch_size': options['batch_size'],
+            'slug_conflict': options['slug_conflict'],
+            'rerender': options['rerender'],
+            'progress': self.stdout.write,
+        }
+        try:
+            if options['path'] == '-':
+                totals = import_archive(sys.stdin, **kwargs)
+            else:
+                with open_archive(options['path']) as lines:
+                    totals = import_archive(lines, **kwargs)
+        except (OSError, ArchiveError) as e:
+            raise CommandError(f'Could not import {options["path"]}: {e}')
+
+        if options['related_posts']:
+            related.rebuild_all(progress=lambda done: self.stdout.write(f'related posts: {done} posts'))
+        summary = ', '.join(f'{count} {name.replace("_", " ")}' for name, count in totals.items())
+        self.stdout.write(self.style.SUCCESS(f'Imported {summary}.'))
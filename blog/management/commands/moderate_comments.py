@@ -0,0 +1,58 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from blog.moderation import ACTIONS, comment_filter, moderate
+
+
+def _moment(value):
+    """Parse a date or datetime argument into an aware datetime"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Not a date or datetime: {value}')
+        moment = datetime.combine(day, time.min)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+class Command(BaseCommand):
+    help = 'Approve, hide or purge the comments matching the given filters in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=ACTIONS)
+        parser.add_argument('--post', type=int, help='Only comments on the post with this id')
+        parser.add_argument('--author', help='Only comments by this username')
+        parser.add_argument('--since', help='Only comments created at or after this date or datetime')
+        parser.add_argument('--until', help='Only comments created before this date or datetime')
+        parser.add_argument('--contains', help='Only comments containing this text (case-insensitive)')
+        parser.add_argument('--matching', help='Only comments matching this full-text search query')
+        parser.add_argument('--all', action='store_true', help='Allow running without any filter')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of comments changed per statement (default: 1000)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many comments match')
+
+    def handle(self, *args, **options):
+        filters = {
+            'post': options['post'],
+            'author': options['author'],
+            'since': _moment(options['since']) if options['since'] else None,
+            'until': _moment(options['until']) if options['until'] else None,
+            'contains': options['contains'],
+            'matching': options['matching'],
+        }
+        if not options['all'] and all(value is None for value in filters.values()):
+            raise CommandError('Give at least one filter, or --all to moderate every comment.')
+
+        comments = comment_filter(**filters)
+        if options['dry_run']:
+            self.stdout.write(f'{comments.count()} comments match.')
+            return
+        changed = moderate(
+            comments, options['action'], batch_size=options['batch_size'],
+            progress=lambda done: self.stdout.write(f'{done} comments...'),
+        )
+        verb = {'approve': 'Approved', 'hide': 'Hid', 'purge': 'Purged'}[options['action']]
+        self.stdout.write(self.style.SUCCESS(f'{verb} {changed} comments.'))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog import comment_queue
+
+
+class Command(BaseCommand):
+    help = 'Commit comments from the write-behind spool in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Maximum comments per transaction (default: 500)')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty (default: 1)')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the queue once and exit instead of running as a worker')
+
+    def handle(self, *args, **options):
+        recovered = comment_queue.recover_stale_claims()
+        if recovered:
+            self.stdout.write(f'Requeued {recovered} comments from an interrupted worker')
+
+        total = 0
+        while True:
+            committed, failed = comment_queue.process_batch(options['batch_size'])
+            total += committed
+            if committed or failed:
+                self.stdout.write(f'Committed {committed} comments ({failed} dropped)')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Committed {total} queued comments.'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from blog import view_counts
+
+
+class Command(BaseCommand):
+    help = 'Delete hourly post view buckets older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Keep this many days of buckets (default: BLOG_VIEW_BUCKET_RETENTION_DAYS)')
+
+    def handle(self, *args, **options):
+        deleted = view_counts.prune_buckets(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} view buckets.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from blog import related
+
+
+class Command(BaseCommand):
+    help = 'Recompute the precomputed related posts of every published post'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of posts to process per batch (default: 500)')
+
+    def handle(self, *args, **options):
+        done = related.rebuild_all(
+            batch_size=options['batch_size'],
+            progress=lambda done: self.stdout.write(f'{done} posts processed'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Related posts rebuilt for {done} posts.'))
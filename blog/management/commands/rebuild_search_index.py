@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for blog posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of posts to index per batch (default: 1000)')
+
+    def handle(self, *args, **options):
+        if not search.is_enabled():
+            raise CommandError('The full-text search index is only available on SQLite.')
+        indexed = search.rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} posts.'))
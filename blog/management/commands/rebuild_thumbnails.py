@@ -0,0 +1,45 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from blog.models import Post
+from blog.thumbnails import generate_variants_safely
+
+
+def _generate(name, overwrite):
+    return name, len(generate_variants_safely(name, overwrite=overwrite))
+
+
+class Command(BaseCommand):
+    help = 'Generate the resized and WebP variants of every post image using a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of worker processes (default: CPU count)')
+        parser.add_argument('--missing-only', action='store_true',
+                            help='Only create variants that do not exist yet')
+
+    def handle(self, *args, **options):
+        names = list(
+            Post.objects.exclude(image='').exclude(image__isnull=True)
+            .order_by().values_list('image', flat=True).distinct()
+        )
+        if not names:
+            self.stdout.write('No post images found.')
+            return
+
+        # Workers only touch storage; don't let them inherit open database connections
+        connections.close_all()
+        overwrite = not options['missing_only']
+        written = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            results = pool.map(_generate, names, [overwrite] * len(names), chunksize=16)
+            for done, (name, count) in enumerate(results, start=1):
+                written += count
+                if done % 100 == 0 or done == len(names):
+                    self.stdout.write(f'{done}/{len(names)} images processed')
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} variant files for {len(names)} images.'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from blog import page_cache
+from blog.counters import COMMENTS_TAG, repair_counters
+from blog.sidebar import SIDEBAR_TAG
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized comment and post counters, fixing any drift'
+
+    def handle(self, *args, **options):
+        fixed = repair_counters()
+        if fixed['category.post_count'] or fixed['tag.post_count']:
+            page_cache.invalidate(SIDEBAR_TAG)
+        if fixed['post.comment_count']:
+            page_cache.invalidate(COMMENTS_TAG)
+        for counter, rows in fixed.items():
+            self.stdout.write(f'{counter}: {rows} row{"s" if rows != 1 else ""} fixed')
+        self.stdout.write(self.style.SUCCESS('Counters are up to date.'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from blog import rendering
+from blog.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = 'Re-render stored post and comment HTML whose renderer or source changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Re-render every row, not just stale ones')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of rows to process per batch (default: 500)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Renderer: {rendering.renderer_name()}')
+        for model, extensions in ((Post, rendering.POST_EXTENSIONS), (Comment, rendering.COMMENT_EXTENSIONS)):
+            updated = rendering.rerender(
+                model, extensions, force=options['force'], batch_size=options['batch_size']
+            )
+            self.stdout.write(f'{model._meta.verbose_name_plural}: {updated} re-rendered')
+        self.stdout.write(self.style.SUCCESS('Stored HTML is up to date.'))
@@ -0,0 +1,294 @@
+"""
+Per-request instrumentation and a Prometheus-style metrics endpoint.
+
+``RequestMetricsMiddleware`` times every request and, per resolved URL name
+(``blog:post_list``, ``blog:post_detail`` ...), feeds in-process histograms
+with the wall time, the number of SQL queries and the time spent in them, the
+template render time and the response size. SQL is measured with an
+execute wrapper installed on every connection and templates with ``InstrumentedDjangoTemplates``
+(select it as the template ``BACKEND``), so the cost per request is a few
+``perf_counter`` calls and one lock per histogram.
+
+Histograms live in the memory of each server process; with several workers
+every process has to be scraped separately. ``metrics_view`` renders them in
+the Prometheus text format, together with the page cache counters and the
+per-process tier statistics of a ``blog.cache.TwoTierCache``.
+
+Requests can optionally be profiled: with ``BLOG_PROFILE_DIR`` set, a sample
+(``BLOG_PROFILE_SAMPLE_RATE``) of requests runs under cProfile and the stats of
+the ones slower than ``BLOG_PROFILE_SLOW_SECONDS`` are dumped to that directory.
+"""
+import cProfile
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+from django.template.backends.django import DjangoTemplates, Template
+
+from . import page_cache
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1_000, 5_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+
+# name: (help text, buckets)
+METRICS = {
+    'blog_request_duration_seconds': ('Wall time of the request', DURATION_BUCKETS),
+    'blog_request_sql_queries': ('SQL queries per request', QUERY_BUCKETS),
+    'blog_request_sql_duration_seconds': ('Time spent in SQL per request', DURATION_BUCKETS),
+    'blog_request_template_duration_seconds': ('Time spent rendering templates per request', DURATION_BUCKETS),
+    'blog_response_size_bytes': ('Size of the response body', SIZE_BUCKETS),
+}
+
+_current = ContextVar('blog_request_metrics', default=None)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """Return ``([(upper bound, cumulative count), ...], sum, count)``"""
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for bound, bucket_count in zip((*self.buckets, float('inf')), counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+        return cumulative, total, count
+
+
+class Registry:
+    """Histograms keyed by metric name and label values"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(METRICS[name][1]))
+        histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self):
+        """Return all histograms in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        for name, (help_text, _) in METRICS.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for (metric, labels), histogram in histograms:
+                if metric != name:
+                    continue
+                label_text = ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+                buckets, total, count = histogram.snapshot()
+                for bound, cumulative in buckets:
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{{{label_text},le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{label_text}}} {total}')
+                lines.append(f'{name}_count{{{label_text}}} {count}')
+        return lines
+
+
+registry = Registry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RequestStats:
+    __slots__ = ('queries', 'sql_time', 'template_time', '_lock')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        # Async views run queries from several worker threads at once
+        self._lock = threading.Lock()
+
+    def add_query(self, duration):
+        with self._lock:
+            self.queries += 1
+            self.sql_time += duration
+
+
+def _sql_timer(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(time.perf_counter() - start)
+
+
+def _install_sql_timer(connection):
+    if _sql_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_sql_timer)
+
+
+@receiver(connection_created)
+def install_sql_timer(sender, connection, **kwargs):
+    # Installed on every connection, in every thread; it only records while a request is measured
+    _install_sql_timer(connection)
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """``DjangoTemplates`` backend that adds template render time to the request metrics"""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
+
+
+def _profile_directory():
+    return getattr(settings, 'BLOG_PROFILE_DIR', None)
+
+
+class RequestMetricsMiddleware:
+    """Record timing, SQL, template and size metrics for every request"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'BLOG_METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self._is_coroutine = iscoroutinefunction(get_response)
+        if self._is_coroutine:
+            markcoroutinefunction(self)
+        self.sample_rate = getattr(settings, 'BLOG_PROFILE_SAMPLE_RATE', 0.01)
+        self.slow_seconds = getattr(settings, 'BLOG_PROFILE_SLOW_SECONDS', 1.0)
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        # Connections opened before this module was imported missed connection_created
+        for connection in connections.all(initialized_only=True):
+            _install_sql_timer(connection)
+        stats = RequestStats()
+        token = _current.set(stats)
+        profiler = None
+        if _profile_directory() and random.random() < self.sample_rate:
+            profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            if profiler:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler:
+                    profiler.disable()
+        finally:
+            _current.reset(token)
+        duration = time.perf_counter() - start
+        view = self.record(request, response, stats, duration)
+        if profiler and duration >= self.slow_seconds:
+            self.dump_profile(profiler, view, duration)
+        return response
+
+    async def __acall__(self, request):
+        # cProfile only sees the event loop thread, so async requests are not profiled
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, stats, duration):
+        """Feed the histograms for a finished request; return its view name"""
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        labels = (('view', view), ('method', request.method))
+        registry.observe('blog_request_duration_seconds', labels, duration)
+        registry.observe('blog_request_sql_queries', labels, stats.queries)
+        registry.observe('blog_request_sql_duration_seconds', labels, stats.sql_time)
+        registry.observe('blog_request_template_duration_seconds', labels, stats.template_time)
+        if not response.streaming:
+            registry.observe('blog_response_size_bytes', labels, len(response.content))
+        return view
+
+    def dump_profile(self, profiler, view, duration):
+        directory = _profile_directory()
+        os.makedirs(directory, exist_ok=True)
+        name = f'{view.replace(":", "-")}-{time.strftime("%Y%m%d-%H%M%S")}-{int(duration * 1000)}ms-{os.getpid()}.prof'
+        profiler.dump_stats(os.path.join(directory, name))
+
+
+def _is_allowed(request):
+    if settings.DEBUG or request.user.is_staff:
+        return True
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'BLOG_METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+
+
+def metrics_view(request):
+    """Expose the request histograms and page cache counters to Prometheus"""
+    if not _is_allowed(request):
+        raise Http404
+    lines = registry.render()
+    for name, value in page_cache.stats().items():
+        metric = f'blog_page_cache_{name}_total'
+        lines += [f'# TYPE {metric} counter', f'{metric} {value}']
+    for alias in settings.CACHES:
+        tier_stats = getattr(caches[alias], 'tier_stats', None)
+        if tier_stats is None:
+            continue
+        for name, value in tier_stats().items():
+            metric = f'blog_cache_{name}' if name == 'local_entries' else f'blog_cache_{name}_total'
+            kind = 'gauge' if name == 'local_entries' else 'counter'
+            lines += [f'# TYPE {metric} {kind}', f'{metric}{{cache="{_escape(alias)}"}} {value}']
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE blog_post_fts USING fts5("
+        "title, excerpt, tags, content, "
+        "tokenize = 'porter unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO blog_post_fts (rowid, title, excerpt, tags, content) "
+        "SELECT p.id, p.title, p.excerpt, "
+        "COALESCE((SELECT group_concat(t.name, ' ') FROM blog_post_tags pt "
+        "JOIN blog_tag t ON t.id = pt.tag_id WHERE pt.post_id = p.id), ''), "
+        "p.content FROM blog_post p"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS blog_post_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:39
+
+from django.db import migrations, models
+
+
+def populate_counters(apps, schema_editor):
+    schema_editor.execute(
+        "UPDATE blog_post SET comment_count = ("
+        "SELECT COUNT(*) FROM blog_comment c WHERE c.post_id = blog_post.id AND c.is_active)"
+    )
+    schema_editor.execute(
+        "UPDATE blog_category SET post_count = ("
+        "SELECT COUNT(*) FROM blog_post p WHERE p.category_id = blog_category.id AND p.status = 'published')"
+    )
+    schema_editor.execute(
+        "UPDATE blog_tag SET post_count = ("
+        "SELECT COUNT(*) FROM blog_post_tags pt JOIN blog_post p ON p.id = pt.post_id "
+        "WHERE pt.tag_id = blog_tag.id AND p.status = 'published')"
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of published posts'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of active comments'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of published posts'),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
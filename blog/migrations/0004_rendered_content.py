@@ -0,0 +1,103 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:42
+
+import hashlib
+
+from django.db import migrations, models
+from django.utils.html import linebreaks
+
+try:
+    import markdown
+    import nh3
+except ImportError:
+    markdown = nh3 = None
+
+# A copy of blog.rendering as of this migration, so later changes there don't alter it.
+# The hashes it writes match the runtime ones until the renderer or its policy changes.
+RENDERER_VERSION = 1
+POST_EXTENSIONS = ['extra', 'sane_lists']
+COMMENT_EXTENSIONS = ['sane_lists', 'nl2br']
+ALLOWED_TAGS = set(nh3.ALLOWED_TAGS) if nh3 else set()
+ALLOWED_ATTRIBUTES = {tag: set(attributes) for tag, attributes in nh3.ALLOWED_ATTRIBUTES.items()} if nh3 else {}
+LINK_REL = 'noopener noreferrer nofollow'
+
+
+def renderer_name():
+    if markdown is None:
+        return f'v{RENDERER_VERSION}:linebreaks'
+    policy = repr((
+        sorted(ALLOWED_TAGS),
+        sorted((tag, sorted(attributes)) for tag, attributes in ALLOWED_ATTRIBUTES.items()),
+        LINK_REL,
+    ))
+    digest = hashlib.sha256(policy.encode()).hexdigest()[:12]
+    return f'v{RENDERER_VERSION}:markdown-{markdown.__version__}:nh3-{nh3.__version__}:policy-{digest}'
+
+
+def render(source, extensions):
+    if markdown is None:
+        return linebreaks(source, autoescape=True)
+    html = markdown.markdown(source, extensions=extensions, output_format='html')
+    return nh3.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, link_rel=LINK_REL)
+
+
+def rerender(model, extensions, using):
+    # Each database only renders its own rows: comments may live in a database of their own
+    manager = model._base_manager.db_manager(using)
+    renderer = renderer_name()
+    last_pk = 0
+    while True:
+        batch = list(
+            manager.filter(pk__gt=last_pk).order_by('pk').only('pk', 'content', 'content_html', 'content_hash')[:500]
+        )
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+        stale = []
+        for obj in batch:
+            digest = hashlib.sha256(f'{renderer}\n{obj.content}'.encode()).hexdigest()
+            if digest != obj.content_hash:
+                obj.content_html = render(obj.content, extensions)
+                obj.content_hash = digest
+                stale.append(obj)
+        manager.bulk_update(stale, ['content_html', 'content_hash'])
+
+
+def render_posts(apps, schema_editor):
+    rerender(apps.get_model('blog', 'Post'), POST_EXTENSIONS, schema_editor.connection.alias)
+
+
+def render_comments(apps, schema_editor):
+    rerender(apps.get_model('blog', 'Comment'), COMMENT_EXTENSIONS, schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='content_html',
+            field=models.TextField(blank=True, editable=False, help_text='Rendered and sanitized content'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='content_html',
+            field=models.TextField(blank=True, editable=False, help_text='Rendered and sanitized content'),
+        ),
+        # The hints let the comments router run each half only where its table lives
+        migrations.RunPython(render_posts, migrations.RunPython.noop, hints={'model_name': 'post'}),
+        migrations.RunPython(render_comments, migrations.RunPython.noop, hints={'model_name': 'comment'}),
+    ]
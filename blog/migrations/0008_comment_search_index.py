@@ -0,0 +1,50 @@
+from django.db import migrations
+
+
+def create_comment_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    # External content: the index stores no copy of the text, the triggers keep it in step.
+    # SQLite drops triggers when Django rebuilds a table; after a later migration that
+    # alters blog_comment, the post_migrate handler in blog.signals creates them again.
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE blog_comment_fts USING fts5("
+        "content, content = 'blog_comment', content_rowid = 'id', "
+        "tokenize = 'porter unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER blog_comment_fts_insert AFTER INSERT ON blog_comment BEGIN "
+        "INSERT INTO blog_comment_fts (rowid, content) VALUES (new.id, new.content); END"
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER blog_comment_fts_delete AFTER DELETE ON blog_comment BEGIN "
+        "INSERT INTO blog_comment_fts (blog_comment_fts, rowid, content) VALUES ('delete', old.id, old.content); END"
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER blog_comment_fts_update AFTER UPDATE OF content ON blog_comment BEGIN "
+        "INSERT INTO blog_comment_fts (blog_comment_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+        "INSERT INTO blog_comment_fts (rowid, content) VALUES (new.id, new.content); END"
+    )
+    schema_editor.execute("INSERT INTO blog_comment_fts (blog_comment_fts) VALUES ('rebuild')")
+
+
+def drop_comment_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for trigger in ('insert', 'delete', 'update'):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS blog_comment_fts_{trigger}")
+    schema_editor.execute("DROP TABLE IF EXISTS blog_comment_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_access_pattern_indexes'),
+    ]
+
+    operations = [
+        # The hint lets the router run this wherever the comment table lives
+        migrations.RunPython(
+            create_comment_search_index, drop_comment_search_index, hints={'model_name': 'comment'},
+        ),
+    ]
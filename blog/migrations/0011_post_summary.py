@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:24
+
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+
+def build_summary(excerpt, content):
+    # A copy of blog.models.build_summary as of this migration
+    return Truncator(excerpt or content).words(20)
+
+
+def fill_summaries(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    manager = Post._base_manager.db_manager(schema_editor.connection.alias)
+    last_pk = 0
+    while True:
+        batch = list(manager.filter(pk__gt=last_pk).order_by('pk').only('pk', 'excerpt', 'content')[:500])
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+        for post in batch:
+            post.summary = build_summary(post.excerpt, post.content)
+        manager.bulk_update(batch, ['summary'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_sidebar_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='summary',
+            field=models.TextField(blank=True, editable=False, help_text='Card text, set from the excerpt or content on save'),
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop, hints={'model_name': 'post'}),
+    ]
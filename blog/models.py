@@ -1,18 +1,42 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.text import Truncator
 
+from . import rendering
 
-class Category(models.Model):
+
+class CounterFieldsMixin:
+    """Keep full saves from overwriting counters that are maintained with F() updates"""
+    counter_fields = ()
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class Category(CounterFieldsMixin, models.Model):
     """Category model for organizing blog posts"""
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
+    post_count = models.PositiveIntegerField(default=0, editable=False, help_text="Number of published posts")
     created_at = models.DateTimeField(auto_now_add=True)
     
+    counter_fields = ('post_count',)
+    
     class Meta:
         verbose_name_plural = "Categories"
         ordering = ['name']
+        indexes = [
+            # Sidebar ranking (see blog.sidebar)
+            models.Index(fields=['-post_count', 'name']),
+        ]
     
     def __str__(self):
         return self.name
@@ -21,19 +45,48 @@ class Category(models.Model):
         return reverse('blog:category_posts', kwargs={'pk': self.pk})
 
 
-class Tag(models.Model):
+class Tag(CounterFieldsMixin, models.Model):
     """Tag model for tagging blog posts"""
     name = models.CharField(max_length=50, unique=True)
+    post_count = models.PositiveIntegerField(default=0, editable=False, help_text="Number of published posts")
     created_at = models.DateTimeField(auto_now_add=True)
     
+    counter_fields = ('post_count',)
+    
     class Meta:
         ordering = ['name']
+        indexes = [
+            # Sidebar ranking (see blog.sidebar)
+            models.Index(fields=['-post_count', 'name']),
+        ]
     
     def __str__(self):
         return self.name
 
 
-class Post(models.Model):
+SUMMARY_WORDS = 20
+
+# Columns a post card in the list views shows (see PostQuerySet.cards)
+CARD_FIELDS = (
+    'title', 'summary', 'image', 'comment_count', 'created_at', 'updated_at', 'published_at',
+    'author__username', 'author__first_name', 'author__last_name', 'category__name',
+)
+
+
+def build_summary(excerpt, content):
+    """Card text of a post: its excerpt, or else the first words of its content"""
+    return Truncator(excerpt or content).words(SUMMARY_WORDS)
+
+
+class PostQuerySet(models.QuerySet):
+    def cards(self):
+        """Load only what a list card shows, leaving out the content and rendered HTML"""
+        return self.select_related('author', 'category').only(*CARD_FIELDS).prefetch_related(
+            models.Prefetch('tags', queryset=Tag.objects.only('pk', 'name'))
+        )
+
+
+class Post(CounterFieldsMixin, models.Model):
     """Blog post model"""
     STATUS_CHOICES = [
         ('draft', 'Draft'),
@@ -44,20 +97,40 @@ class Post(models.Model):
     slug = models.SlugField(max_length=200, unique=True)
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blog_posts')
     content = models.TextField()
+    content_html = models.TextField(blank=True, editable=False, help_text="Rendered and sanitized content")
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
     excerpt = models.TextField(max_length=300, blank=True, help_text="Brief description of the post")
+    summary = models.TextField(blank=True, editable=False, help_text="Card text, set from the excerpt or content on save")
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='posts')
     tags = models.ManyToManyField(Tag, blank=True, related_name='posts')
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='draft')
+    comment_count = models.PositiveIntegerField(default=0, editable=False, help_text="Number of active comments")
+    view_count = models.PositiveIntegerField(default=0, editable=False, help_text="Number of page views")
+    trending_score = models.FloatField(default=0, editable=False, help_text="Decayed view score, see blog.view_counts")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     published_at = models.DateTimeField(null=True, blank=True)
     
+    counter_fields = ('comment_count', 'view_count', 'trending_score')
+    
+    objects = PostQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['-created_at']),
-            models.Index(fields=['status']),
+            # Public lists filter on status (and category or author) and show the newest first
+            models.Index(fields=['status', '-created_at']),
+            models.Index(fields=['category', 'status', '-created_at']),
+            models.Index(fields=['author', 'status', '-created_at']),
+            # "Trending" and "most read" blocks
+            models.Index(fields=['status', '-trending_score']),
+            models.Index(fields=['status', '-view_count']),
+            # Recently published posts counted by a windowed sidebar
+            models.Index(fields=['status', 'published_at']),
+            # Newest edit of a list, read by the conditional GET validators
+            models.Index(fields=['status', '-updated_at']),
         ]
     
     def __str__(self):
@@ -69,7 +142,15 @@ class Post(models.Model):
     def save(self, *args, **kwargs):
         if self.status == 'published' and not self.published_at:
             self.published_at = timezone.now()
-        super().save(*args, **kwargs)
+        rendering.refresh_rendered(self, rendering.POST_EXTENSIONS)
+        self.summary = build_summary(self.excerpt, self.content)
+        # Counter signal handlers run inside the same transaction as the save
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
     
     @property
     def is_published(self):
@@ -78,9 +159,12 @@ class Post(models.Model):
 
 class Comment(models.Model):
     """Comment model for blog posts"""
-    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
-    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments')
+    # No database constraints: comments may live in their own database (see blog/routers.py)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments', db_constraint=False)
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments', db_constraint=False)
     content = models.TextField()
+    content_html = models.TextField(blank=True, editable=False, help_text="Rendered and sanitized content")
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
@@ -90,11 +174,63 @@ class Comment(models.Model):
         indexes = [
             models.Index(fields=['created_at']),
             models.Index(fields=['is_active']),
+            # A post's visible comments, oldest first (post_detail)
+            models.Index(
+                fields=['post', 'created_at'], condition=models.Q(is_active=True), name='blog_comment_active_post_idx',
+            ),
         ]
     
     def __str__(self):
         return f'Comment by {self.author.username} on {self.post.title}'
     
+    def save(self, *args, **kwargs):
+        rendering.refresh_rendered(self, rendering.COMMENT_EXTENSIONS)
+        # Counter signal handlers run inside the same transaction as the save
+        # (when comments have their own database, only the comment write is atomic)
+        using = kwargs.get('using') or router.db_for_write(Comment, instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(Comment, instance=self)
+        with transaction.atomic(using=using):
+            return super().delete(*args, **kwargs)
+    
     def get_absolute_url(self):
         return reverse('blog:post_detail', kwargs={'pk': self.post.pk}) + f'#comment-{self.pk}'
 
+
+
+class RelatedPost(models.Model):
+    """Precomputed related-post link, maintained by blog.related"""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    
+    class Meta:
+        ordering = ['-score']
+        indexes = [
+            models.Index(fields=['post', '-score']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'related'], name='unique_related_post'),
+        ]
+    
+    def __str__(self):
+        return f'{self.post_id} -> {self.related_id} ({self.score:.2f})'
+
+
+class PostViewBucket(models.Model):
+    """Page views of a post per hour, written in batches by blog.view_counts"""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='view_buckets')
+    hour = models.DateTimeField()
+    views = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-hour']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'hour'], name='unique_post_view_bucket'),
+        ]
+    
+    def __str__(self):
+        return f'{self.post_id} @ {self.hour:%Y-%m-%d %H:00}: {self.views}'
@@ -0,0 +1,95 @@
+"""
+Bulk comment moderation.
+
+``moderate`` approves, hides or purges every comment in a queryset, a batch
+of primary keys at a time: one ``UPDATE`` (or ``DELETE``) per batch, then a
+recount of ``comment_count`` for just the posts the batch touched, in the
+same transaction when comments share the posts' database. Model signals are
+bypassed, so the page cache tags of the touched posts are invalidated here
+once the batch has committed. The comment search index follows through its
+triggers.
+
+Used by the ``CommentAdmin`` actions and ``manage.py moderate_comments``.
+"""
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from . import counters, page_cache, search
+from .routers import comments_are_separate
+
+ACTIONS = ('approve', 'hide', 'purge')
+
+
+def comment_filter(post=None, author=None, since=None, until=None, contains=None, matching=None):
+    """Return the comments narrowed by every given filter"""
+    from django.contrib.auth.models import User
+
+    from .models import Comment
+
+    comments = Comment.objects.all()
+    if post is not None:
+        comments = comments.filter(post_id=post)
+    if author is not None:
+        # Resolved first: users may live in another database than comments
+        author_id = User.objects.filter(username=author).values_list('pk', flat=True).first()
+        comments = comments.filter(author_id=author_id) if author_id else comments.none()
+    if since is not None:
+        comments = comments.filter(created_at__gte=since)
+    if until is not None:
+        comments = comments.filter(created_at__lt=until)
+    if contains:
+        comments = comments.filter(content__icontains=contains)
+    if matching:
+        if search.is_enabled(comments.db):
+            comments = search.filter_matching(comments, matching, search.COMMENT_FTS_TABLE)
+        else:
+            comments = comments.filter(content__icontains=matching)
+    return comments
+
+
+def _apply_batch(model, action, pks, using):
+    if action == 'purge':
+        # A plain DELETE: no per-row deletion collector or signals, and nothing else references comments
+        connection = connections[using]
+        table = connection.ops.quote_name(model._meta.db_table)
+        pk_column = connection.ops.quote_name(model._meta.pk.column)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} WHERE {pk_column} IN ({", ".join(["%s"] * len(pks))})', pks)
+    else:
+        model.objects.filter(pk__in=pks).update(is_active=action == 'approve', updated_at=timezone.now())
+
+
+def moderate(queryset, action, batch_size=1000, progress=None):
+    """Apply ``action`` ('approve', 'hide' or 'purge') to the comments in ``queryset``; return how many changed"""
+    if action not in ACTIONS:
+        raise ValueError(f'Unknown moderation action {action!r}')
+    progress = progress or (lambda done: None)
+    model = queryset.model
+    using = router.db_for_write(model)
+    separate = comments_are_separate()
+    if action != 'purge':
+        # Rows already in the wanted state change nothing
+        queryset = queryset.filter(is_active=action != 'approve')
+
+    changed = 0
+    last_pk = 0
+    while True:
+        rows = list(
+            queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'post_id')[:batch_size]
+        )
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+        pks = [pk for pk, _ in rows]
+        post_ids = {post_id for _, post_id in rows}
+        with transaction.atomic(using=using):
+            _apply_batch(model, action, pks, using)
+            if not separate:
+                counters.refresh_comment_counts(post_ids)
+        if separate:
+            # Posts are in the other database; recount once the comments have committed
+            counters.refresh_comment_counts(post_ids)
+        page_cache.invalidate(counters.COMMENTS_TAG, *(f'post:{post_id}' for post_id in post_ids))
+        changed += len(pks)
+        progress(changed)
+    return changed
@@ -0,0 +1,197 @@
+"""
+Full-page cache for anonymous readers.
+
+Rendered pages are stored under a key built from the path and normalized
+query string, together with the dependency tags they were built from, for
+example ``post:42``, ``category:3``, ``tag:7``, ``author:alice`` or
+``list:home``. Every tag has a version number in the cache. A cached page is
+only served while all of its tags still have the versions it was stored
+with, so invalidating a tag is a single ``incr`` and never requires finding
+or flushing the pages that depend on it. The signal handlers in
+``blog.signals`` decide which tags a model change invalidates.
+
+Hit, miss and invalidation counts are kept in the memory of each process,
+so counting costs no cache write; ``/metrics/`` exports them per process
+(see ``stats()`` and ``blog.metrics``).
+"""
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.http import urlencode
+
+KEY_PREFIX = 'blog:page'
+STATS = ('hits', 'misses', 'invalidations')
+
+# Query parameters that never change the rendered page
+IGNORED_PARAMS = {'fbclid', 'gclid'}
+
+
+def is_enabled():
+    return getattr(settings, 'BLOG_PAGE_CACHE_ENABLED', True)
+
+
+def _tag_key(tag):
+    return f'{KEY_PREFIX}:tag:{tag}'
+
+
+_stats = dict.fromkeys(STATS, 0)
+_stats_lock = threading.Lock()
+
+
+def _record(name, delta=1):
+    with _stats_lock:
+        _stats[name] += delta
+
+
+def tag_versions(tags):
+    """Return the current version of each tag, initialising unknown tags"""
+    keys = {_tag_key(tag): tag for tag in tags}
+    found = cache.get_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+    for key, tag in keys.items():
+        if tag not in versions:
+            # A fresh, time-based version means an evicted tag can never match an old entry
+            cache.add(key, time.time_ns(), None)
+            versions[tag] = cache.get(key)
+    return versions
+
+
+def invalidate(*tags):
+    """Invalidate every cached page that depends on any of ``tags``"""
+    tags = {tag for tag in tags if tag}
+    for tag in tags:
+        try:
+            cache.incr(_tag_key(tag))
+        except ValueError:
+            cache.set(_tag_key(tag), time.time_ns(), None)
+    if tags:
+        _record('invalidations', len(tags))
+
+
+def stats():
+    """Return the hit, miss and invalidation counts of this process"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.update(dict.fromkeys(STATS, 0))
+
+
+def normalized_query(request):
+    """Return the query string with parameters sorted and tracking parameters dropped"""
+    params = sorted(
+        (key, value)
+        for key, values in request.GET.lists()
+        for value in values
+        if key not in IGNORED_PARAMS and not key.startswith('utm_')
+    )
+    return urlencode(params)
+
+
+def page_key(request):
+    digest = hashlib.sha256(f'{request.path}?{normalized_query(request)}'.encode()).hexdigest()
+    return f'{KEY_PREFIX}:entry:{digest}'
+
+
+def add_dependencies(request, *tags):
+    """Record extra dependency tags discovered while rendering ``request``"""
+    if not hasattr(request, '_page_cache_tags'):
+        request._page_cache_tags = set()
+    request._page_cache_tags.update(tag for tag in tags if tag)
+
+
+def depend_on_posts(request, posts):
+    """Make the page depend on each listed post and the category and tags it shows"""
+    tags = []
+    for post in posts:
+        tags.append(f'post:{post.pk}')
+        if post.category_id:
+            tags.append(f'category:{post.category_id}')
+        tags.extend(f'tag:{tag.pk}' for tag in post.tags.all())
+    add_dependencies(request, *tags)
+
+
+def _is_cacheable_request(request):
+    return (
+        request.method == 'GET'
+        and not request.user.is_authenticated
+        # Pending flash messages make the page unique to this visitor
+        and 'messages' not in request.COOKIES
+    )
+
+
+def _is_cacheable_response(response):
+    return response.status_code == 200 and not response.streaming and not response.cookies
+
+
+def cache_anonymous_page(dependencies, timeout=None):
+    """
+    Cache a view's response for anonymous GET requests.
+
+    ``dependencies(request, *args, **kwargs)`` returns the tags known before
+    rendering; the view may add more with ``add_dependencies``. Works for both
+    sync and async views.
+    """
+    def decorator(view_func):
+        def lookup(request, args, kwargs):
+            """Return ``(cached response, None)`` on a hit, ``(None, versions)`` on a miss"""
+            entry = cache.get(page_key(request))
+            if entry is not None and tag_versions(entry['versions']) == entry['versions']:
+                _record('hits')
+                response = HttpResponse(entry['content'], content_type=entry['content_type'])
+                response['X-Page-Cache'] = 'hit'
+                return response, None
+            _record('misses')
+            # Read versions before rendering so a concurrent invalidation wins
+            return None, tag_versions(dependencies(request, *args, **kwargs))
+
+        def store(request, response, versions):
+            if not _is_cacheable_response(response):
+                return
+            extra = getattr(request, '_page_cache_tags', set()) - versions.keys()
+            versions.update(tag_versions(extra))
+            cache.set(page_key(request), {
+                'content': response.content,
+                'content_type': response['Content-Type'],
+                'versions': versions,
+            }, getattr(settings, 'BLOG_PAGE_CACHE_TIMEOUT', 600) if timeout is None else timeout)
+
+        def finish(request, response, versions):
+            response['X-Page-Cache'] = 'miss'
+            if getattr(response, 'is_rendered', True):
+                store(request, response, versions)
+            else:
+                response.add_post_render_callback(lambda response: store(request, response, versions))
+            return response
+
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                # The user and the cache tags may need the database, so check them in a thread
+                if not is_enabled() or not await sync_to_async(_is_cacheable_request)(request):
+                    return await view_func(request, *args, **kwargs)
+                response, versions = await sync_to_async(lookup)(request, args, kwargs)
+                if response is not None:
+                    return response
+                response = await view_func(request, *args, **kwargs)
+                return await sync_to_async(finish)(request, response, versions)
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not is_enabled() or not _is_cacheable_request(request):
+                return view_func(request, *args, **kwargs)
+            response, versions = lookup(request, args, kwargs)
+            if response is not None:
+                return response
+            return finish(request, view_func(request, *args, **kwargs), versions)
+        return wrapper
+    return decorator
@@ -0,0 +1,256 @@
+"""
+Keyset (cursor) pagination for post lists.
+
+Page-number pagination needs a ``COUNT(*)`` plus an ``OFFSET`` scan that
+grows with the page number. Cursor pages instead seek straight to the
+``(created_at, id)`` position of the last row seen, so fetching page 10,000
+costs the same as fetching page 1. Cursor mode is opt-in through the
+``cursor`` query parameter; plain ``?page=N`` URLs keep working.
+
+Numbered pages still need the total, so ``CachedCountPaginator`` caches it
+per normalized filter (``count_key``). A cached count is stored with the
+current versions of the ``counts:*`` page cache tags, which the signal
+handlers in ``blog.signals`` bump whenever posts are published, unpublished,
+moved, retagged or deleted, so paging through a result only counts it once.
+``EstimatedCountPaginator`` skips the count of unfiltered tables altogether
+(used by the admin changelists).
+"""
+import base64
+import hashlib
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from . import page_cache
+
+CURSOR_PARAM = 'cursor'
+COUNT_KEY_PREFIX = 'blog:count'
+
+# Bumped when the set of published posts or their category/tag links change
+POSTS_COUNT_TAG = 'counts:posts'
+# Bumped when the searchable text of a published post changes
+SEARCH_COUNT_TAG = 'counts:search'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(post, direction):
+    """Return an opaque token pointing just past ``post`` in ``direction`` ('next' or 'prev')"""
+    payload = json.dumps([post.created_at.isoformat(), post.pk, direction[0]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return ``(created_at, pk, direction)`` for a token made by ``encode_cursor``"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, pk, direction = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(pk), {'n': 'next', 'p': 'prev'}[direction]
+    except (ValueError, TypeError, KeyError) as exc:
+        raise InvalidCursor(token) from exc
+
+
+class CursorPage:
+    """A page of posts fetched by keyset, exposing next/previous cursor tokens"""
+    is_cursor = True
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} posts>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.object_list[-1], 'next') if self._has_next else ''
+
+    @property
+    def previous_cursor(self):
+        return encode_cursor(self.object_list[0], 'prev') if self._has_previous else ''
+
+
+class KeysetPaginator:
+    """Paginate a post queryset newest-first on ``(created_at, id)`` without COUNT or OFFSET"""
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def get_page(self, cursor):
+        """Return the page for ``cursor``, falling back to the first page for missing or bad tokens"""
+        try:
+            created_at, pk, direction = decode_cursor(cursor) if cursor else (None, None, 'next')
+        except InvalidCursor:
+            created_at, pk, direction = None, None, 'next'
+
+        if created_at is None:
+            rows = list(self.queryset.order_by('-created_at', '-pk')[:self.per_page + 1])
+            return CursorPage(rows[:self.per_page], len(rows) > self.per_page, False)
+
+        if direction == 'next':
+            rows = list(
+                self.queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+                .order_by('-created_at', '-pk')[:self.per_page + 1]
+            )
+            return CursorPage(rows[:self.per_page], len(rows) > self.per_page, True)
+
+        rows = list(
+            self.queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+            .order_by('created_at', 'pk')[:self.per_page + 1]
+        )
+        rows.reverse()
+        return CursorPage(rows[-self.per_page:], True, len(rows) > self.per_page)
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator that caches ``count`` under ``count_key``.
+
+    ``counter`` may replace the exact ``COUNT`` with a callable returning
+    ``(count, is_estimate)``; ``estimated`` tells templates to say "about".
+    """
+
+    def __init__(self, object_list, per_page, count_key=None, count_tags=(POSTS_COUNT_TAG,), counter=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+        self.count_tags = count_tags
+        self.counter = counter
+
+    def _compute_count(self):
+        if self.counter is not None:
+            return self.counter()
+        return super().count, False
+
+    @cached_property
+    def _count(self):
+        if self.count_key is None:
+            return self._compute_count()
+        versions = page_cache.tag_versions(self.count_tags)
+        source = repr((self.count_key, sorted(versions.items())))
+        key = f'{COUNT_KEY_PREFIX}:{hashlib.sha256(source.encode()).hexdigest()}'
+        result = cache.get(key)
+        if result is None:
+            result = self._compute_count()
+            cache.set(key, result, getattr(settings, 'BLOG_COUNT_CACHE_TIMEOUT', 3600))
+        return result
+
+    @property
+    def count(self):
+        return self._count[0]
+
+    @property
+    def estimated(self):
+        return self._count[1]
+
+
+def estimated_row_count(model, using):
+    """
+    Estimate the rows in ``model``'s table from its primary key range, or return None.
+
+    Two index lookups instead of a table scan. The estimate is an upper
+    bound, high by the number of deleted rows.
+    """
+    if connections[using].vendor != 'sqlite' or not model._meta.pk.get_internal_type().endswith('AutoField'):
+        return None
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'SELECT MIN(rowid), MAX(rowid) FROM {connections[using].ops.quote_name(model._meta.db_table)}')
+        low, high = cursor.fetchone()
+    return 0 if low is None else high - low + 1
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that estimates the count of an unfiltered queryset over ``BLOG_ESTIMATE_COUNT_OVER`` rows.
+
+    The estimate can be too high after deletions, so a page past the last
+    row switches to the exact count and returns the real last page instead.
+    """
+    estimated = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > getattr(settings, 'BLOG_ESTIMATE_COUNT_OVER', 10000):
+                self.estimated = True
+                return estimate
+        return super().count
+
+    def page(self, number):
+        page = super().page(number)
+        if not self.estimated or page.object_list or page.number == 1:
+            return page
+        self.estimated = False
+        self.count = super().count
+        self.__dict__.pop('num_pages', None)
+        return super().page(self.num_pages)
+
+
+def filter_count_key(name, *filters):
+    """Return a count key for list ``name`` narrowed by ``filters``, ignoring empty ones"""
+    return (name, *(str(value).strip() for value in filters if value))
+
+
+def wants_cursor(request):
+    """Return True when the request opted into cursor pagination"""
+    return CURSOR_PARAM in request.GET
+
+
+def paginate_posts(request, queryset, per_page, allow_cursor=True, count_key=None, **paginator_kwargs):
+    """Return a cursor page when requested, otherwise a regular numbered page"""
+    if allow_cursor and wants_cursor(request):
+        return KeysetPaginator(queryset, per_page).get_page(request.GET.get(CURSOR_PARAM))
+    paginator = CachedCountPaginator(queryset, per_page, count_key=count_key, **paginator_kwargs)
+    return paginator.get_page(request.GET.get('page'))
+
+
+class CursorPaginationMixin:
+    """
+    ListView mixin that serves keyset pages when the ``cursor`` parameter is
+    present and caches the count of numbered pages under ``get_count_key()``
+    """
+    paginator_class = CachedCountPaginator
+
+    def get_count_key(self):
+        return None
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        return super().get_paginator(
+            queryset, per_page, orphans=orphans, allow_empty_first_page=allow_empty_first_page,
+            count_key=self.get_count_key(), **kwargs
+        )
+
+    def paginate_queryset(self, queryset, page_size):
+        if not wants_cursor(self.request):
+            return super().paginate_queryset(queryset, page_size)
+        page = KeysetPaginator(queryset, page_size).get_page(self.request.GET.get(CURSOR_PARAM))
+        return (None, page, page.object_list, page.has_other_pages())
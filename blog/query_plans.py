@@ -0,0 +1,97 @@
+"""
+Query plan audit for the public views.
+
+``capture`` requests a view with the test client and records every SELECT
+it sends, with its parameters, on every database. ``explain`` runs
+``EXPLAIN QUERY PLAN`` on such a query and ``problems`` picks out the plan
+steps that don't scale with the table size: full table scans and temporary
+B-trees built to sort or group rows. ``manage.py audit_query_plans`` runs
+this for each benchmark scenario (see ``blog.benchmarks``).
+
+Only SQLite query plans are understood.
+"""
+from contextlib import ExitStack
+
+from django.db import connections
+from django.test import Client
+
+# Plan steps that don't mention an index; small lookup tables can be allowed with ``ignore_tables``
+FULL_SCAN = 'SCAN '
+TEMP_BTREE = 'USE TEMP B-TREE'
+
+
+def capture(path, client=None):
+    """GET ``path``; return the response and the ``(alias, sql, params)`` of every SELECT it ran"""
+    client = client or Client()
+    queries = []
+
+    def recorder(alias):
+        def record(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                queries.append((alias, sql, tuple(params) if params is not None else None))
+            return execute(sql, params, many, context)
+        return record
+
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder(alias)))
+        response = client.get(path)
+    return response, queries
+
+
+def explain(alias, sql, params=None):
+    """Return the plan of ``sql`` as indented lines, one per step"""
+    with connections[alias].cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        rows = cursor.fetchall()
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return lines
+
+
+def problems(plan, ignore_tables=()):
+    """Return the steps of ``plan`` that scan a whole table or sort into a temporary B-tree"""
+    found = []
+    for line in plan:
+        step = line.strip()
+        if step.startswith(TEMP_BTREE):
+            found.append(step)
+        elif step.startswith(FULL_SCAN) and ' USING ' not in step and 'VIRTUAL TABLE' not in step:
+            # "SCAN <table>" without an index; subquery and CTE scans read their own (already planned) rows
+            table = step[len(FULL_SCAN):].split()[0]
+            if table not in ignore_tables and not table.startswith(('(', 'CONSTANT')):
+                found.append(step)
+    return found
+
+
+def audit(scenarios, ignore_tables=(), client=None):
+    """
+    Explain the queries behind each GET scenario.
+
+    Return ``{scenario name: [{'alias', 'sql', 'plan', 'problems'}, ...]}``
+    with each distinct query listed once per scenario.
+    """
+    client = client or Client()
+    report = {}
+    for scenario in scenarios:
+        if scenario.method != 'get':
+            continue
+        _, queries = capture(scenario.path, client)
+        seen = set()
+        entries = []
+        for alias, sql, params in queries:
+            if (alias, sql, params) in seen or connections[alias].vendor != 'sqlite':
+                continue
+            seen.add((alias, sql, params))
+            plan = explain(alias, sql, params)
+            entries.append({
+                'alias': alias,
+                'sql': sql,
+                'plan': plan,
+                'problems': problems(plan, ignore_tables),
+            })
+        report[scenario.name] = entries
+    return report
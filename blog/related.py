@@ -0,0 +1,118 @@
+"""
+Precomputed related posts.
+
+For every published post the ``RELATED_LIMIT`` most similar published posts
+are stored in ``RelatedPost`` so ``post_detail`` reads them with one indexed
+query. Similarity is the sum of the weights of the shared tags, where rare
+tags weigh more than popular ones (``1 / log(2 + post_count)``), plus a bonus
+for sharing the category. Candidates are limited to the most recent posts
+per tag and per category so a single popular tag cannot make an update
+scan the whole archive.
+
+The signal handlers in ``blog.signals`` call ``refresh_around`` when a
+post's tags, category or status change; ``manage.py rebuild_related_posts``
+recomputes everything.
+"""
+import math
+from collections import defaultdict
+
+from django.db import transaction
+
+RELATED_LIMIT = 5
+CANDIDATES_PER_KEY = 200
+CATEGORY_WEIGHT = 0.5
+
+
+def _tag_weight(post_count):
+    return 1.0 / math.log(2 + post_count)
+
+
+def compute_related(post_id):
+    """Return ``[(related_id, score), ...]`` for a post, best first"""
+    from .models import Post, Tag
+
+    post = Post.objects.filter(pk=post_id, status='published').values('category_id').first()
+    if post is None:
+        return []
+
+    published = Post.objects.filter(status='published').exclude(pk=post_id)
+    scores = defaultdict(float)
+    tags = Tag.objects.filter(posts__pk=post_id).values_list('pk', 'post_count')
+    for tag_id, post_count in tags:
+        weight = _tag_weight(post_count)
+        candidates = published.filter(tags__pk=tag_id).order_by('-created_at').values_list('pk', flat=True)
+        for candidate in candidates[:CANDIDATES_PER_KEY]:
+            scores[candidate] += weight
+
+    if post['category_id']:
+        candidates = published.filter(category_id=post['category_id']).order_by('-created_at')
+        for candidate in candidates.values_list('pk', flat=True)[:CANDIDATES_PER_KEY]:
+            scores[candidate] += CATEGORY_WEIGHT
+
+    # Highest score first, newer post (higher id) first on ties
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+    return ranked[:RELATED_LIMIT]
+
+
+def update_related(post_ids):
+    """Recompute and store the related posts of each post in ``post_ids``"""
+    from .models import RelatedPost
+
+    post_ids = set(post_ids)
+    if not post_ids:
+        return
+    rows = [
+        RelatedPost(post_id=post_id, related_id=related_id, score=score)
+        for post_id in post_ids
+        for related_id, score in compute_related(post_id)
+    ]
+    with transaction.atomic():
+        RelatedPost.objects.filter(post_id__in=post_ids).delete()
+        RelatedPost.objects.bulk_create(rows)
+
+
+def refresh_around(post_id):
+    """
+    Update a post whose tags, category or status changed, and its neighbours.
+
+    Similarity is symmetric, so besides the post itself this refreshes the
+    posts that currently list it and the posts it now lists.
+    """
+    from .models import RelatedPost
+
+    referrers = set(RelatedPost.objects.filter(related_id=post_id).values_list('post_id', flat=True))
+    update_related([post_id])
+    neighbours = set(RelatedPost.objects.filter(post_id=post_id).values_list('related_id', flat=True))
+    update_related(referrers | neighbours)
+
+
+def related_posts(post, limit=RELATED_LIMIT):
+    """Return the stored related posts of ``post`` with only the fields the sidebar shows"""
+    from .models import RelatedPost
+
+    links = (
+        RelatedPost.objects.filter(post=post).select_related('related')
+        .only('related__title', 'related__published_at', 'related__created_at')[:limit]
+    )
+    return [link.related for link in links]
+
+
+def rebuild_all(batch_size=500, progress=None):
+    """Recompute the related posts of every published post; return the number processed"""
+    from .models import Post, RelatedPost
+
+    RelatedPost.objects.exclude(post__status='published').delete()
+    done = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            Post.objects.filter(status='published', pk__gt=last_pk).order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            return done
+        update_related(batch)
+        done += len(batch)
+        last_pk = batch[-1]
+        if progress:
+            progress(done)
@@ -0,0 +1,103 @@
+"""
+Markdown rendering for post and comment bodies.
+
+Bodies are rendered once, when the model is saved, and the sanitized HTML is
+stored next to the source together with a hash of (renderer, source). The
+renderer covers the ``markdown`` and ``nh3`` versions and the sanitizer
+policy below, so upgrading either package or changing the policy makes the
+stored HTML stale. Bump ``RENDERER_VERSION`` whenever the output would change
+for any other reason, then run ``manage.py rerender_content`` to refresh the
+stored HTML.
+
+Rendering uses the optional ``markdown`` and ``nh3`` packages. Without them
+bodies fall back to the escaped ``linebreaks`` output the templates used
+before, which is still safe to mark as such.
+"""
+import hashlib
+
+from django.utils.html import linebreaks
+
+try:
+    import markdown
+    import nh3
+except ImportError:  # pragma: no cover - depends on the environment
+    markdown = nh3 = None
+
+RENDERER_VERSION = 1
+
+POST_EXTENSIONS = ['extra', 'sane_lists']
+COMMENT_EXTENSIONS = ['sane_lists', 'nl2br']
+
+# Sanitizer policy: nh3's defaults, spelled out so changing them changes ``renderer_name()``
+ALLOWED_TAGS = set(nh3.ALLOWED_TAGS) if nh3 else set()
+ALLOWED_ATTRIBUTES = {tag: set(attributes) for tag, attributes in nh3.ALLOWED_ATTRIBUTES.items()} if nh3 else {}
+LINK_REL = 'noopener noreferrer nofollow'
+
+
+def _policy_digest():
+    policy = repr((
+        sorted(ALLOWED_TAGS),
+        sorted((tag, sorted(attributes)) for tag, attributes in ALLOWED_ATTRIBUTES.items()),
+        LINK_REL,
+    ))
+    return hashlib.sha256(policy.encode()).hexdigest()[:12]
+
+
+def renderer_name():
+    """Identify the renderer in use so a change of renderer invalidates stored HTML"""
+    if markdown is None:
+        engine = 'linebreaks'
+    else:
+        engine = f'markdown-{markdown.__version__}:nh3-{nh3.__version__}:policy-{_policy_digest()}'
+    return f'v{RENDERER_VERSION}:{engine}'
+
+
+def content_hash(source):
+    """Hash of the renderer and ``source``; equal hashes mean the stored HTML is current"""
+    return hashlib.sha256(f'{renderer_name()}\n{source}'.encode()).hexdigest()
+
+
+def render_markdown(source, extensions=POST_EXTENSIONS):
+    """Render Markdown ``source`` to sanitized HTML"""
+    if markdown is None:
+        return linebreaks(source, autoescape=True)
+    html = markdown.markdown(source, extensions=extensions, output_format='html')
+    return sanitize(html)
+
+
+def sanitize(html):
+    """Clean ``html`` with the sanitizer policy above; None when ``nh3`` is not installed"""
+    if nh3 is None:
+        return None
+    return nh3.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, link_rel=LINK_REL)
+
+
+def refresh_rendered(instance, extensions=POST_EXTENSIONS):
+    """Re-render ``instance.content`` if its stored HTML is stale; return True when it changed"""
+    digest = content_hash(instance.content)
+    if digest == instance.content_hash:
+        return False
+    instance.content_html = render_markdown(instance.content, extensions)
+    instance.content_hash = digest
+    return True
+
+
+def rerender(model, extensions=POST_EXTENSIONS, force=False, batch_size=500, using=None):
+    """Refresh stored HTML for every ``model`` row that is stale (or all rows with ``force``)"""
+    manager = model._base_manager.db_manager(using)
+    updated = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            manager.filter(pk__gt=last_pk).order_by('pk')
+            .only('pk', 'content', 'content_html', 'content_hash')[:batch_size]
+        )
+        if not batch:
+            return updated
+        last_pk = batch[-1].pk
+        if force:
+            for obj in batch:
+                obj.content_hash = ''
+        stale = [obj for obj in batch if refresh_rendered(obj, extensions)]
+        manager.bulk_update(stale, ['content_html', 'content_hash'])
+        updated += len(stale)
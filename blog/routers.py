@@ -0,0 +1,68 @@
+"""
+Database router that keeps comments in their own database.
+
+Comments are written far more often than anything else, and on SQLite every
+write takes a database-wide lock. With ``CommentsRouter`` in
+``DATABASE_ROUTERS`` and ``BLOG_COMMENTS_DATABASE`` naming a database alias,
+the ``blog_comment`` table lives in that database and every other model stays
+in ``default``.
+
+SQL cannot cross databases, so:
+
+* ``Comment.post`` and ``Comment.author`` have no database constraint, and
+  the cascades from deleted posts and users are done by the signal handlers
+  in ``blog.signals`` instead of by the ORM;
+* comment queries must not join posts or users: use ``prefetch_related``
+  instead of ``select_related``, and ``blog.counters`` counts comments in the
+  comments database before writing the totals to ``default``.
+
+The comments database only gets the comment table (``manage.py migrate
+--database <alias>``). ``default`` keeps an empty one so the deletion
+collector and older data migrations still find it.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, router
+
+
+def comments_database():
+    """Alias of the database holding comments"""
+    from .models import Comment
+    return router.db_for_write(Comment)
+
+
+def comments_are_separate():
+    """Return True when comments live in a different database from posts"""
+    from .models import Post
+    return comments_database() != router.db_for_write(Post)
+
+
+def _is_comment(model_or_obj):
+    # Historical models from migrations are different classes, so compare labels
+    return model_or_obj._meta.label_lower == 'blog.comment'
+
+
+class CommentsRouter:
+    """Route ``blog.Comment`` to ``settings.BLOG_COMMENTS_DATABASE`` and everything else to default"""
+
+    @property
+    def alias(self):
+        return getattr(settings, 'BLOG_COMMENTS_DATABASE', None) or DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        # Always answer: otherwise Django falls back to the database of the
+        # instance in the hints, and comment.author would be read from the comments database
+        return self.alias if _is_comment(model) else DEFAULT_DB_ALIAS
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if _is_comment(obj1) or _is_comment(obj2):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS or self.alias == DEFAULT_DB_ALIAS:
+            return None
+        if db == self.alias:
+            return app_label == 'blog' and model_name == 'comment'
+        return None
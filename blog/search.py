@@ -0,0 +1,224 @@
+"""
+Full-text search for blog posts.
+
+On SQLite the posts are indexed in an FTS5 virtual table (``blog_post_fts``)
+whose rowid is the post primary key. The index covers title, excerpt, tag
+names and content and is kept in sync by the handlers in ``blog.signals``.
+Comment bodies are indexed in ``blog_comment_fts``, an external-content
+table that triggers in the comments database keep up to date, so bulk
+inserts and updates are covered too. Other database backends fall back to
+the original ``icontains`` lookups.
+"""
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'blog_post_fts'
+COMMENT_FTS_TABLE = 'blog_comment_fts'
+
+# The triggers of migration 0008. SQLite drops them whenever Django rebuilds blog_comment
+# (AlterField, RemoveField ...), so restore_comment_triggers() recreates them after migrate
+COMMENT_FTS_TRIGGERS = {
+    'blog_comment_fts_insert': (
+        "AFTER INSERT ON blog_comment BEGIN "
+        "INSERT INTO blog_comment_fts (rowid, content) VALUES (new.id, new.content); END"
+    ),
+    'blog_comment_fts_delete': (
+        "AFTER DELETE ON blog_comment BEGIN "
+        "INSERT INTO blog_comment_fts (blog_comment_fts, rowid, content) VALUES ('delete', old.id, old.content); END"
+    ),
+    'blog_comment_fts_update': (
+        "AFTER UPDATE OF content ON blog_comment BEGIN "
+        "INSERT INTO blog_comment_fts (blog_comment_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+        "INSERT INTO blog_comment_fts (rowid, content) VALUES (new.id, new.content); END"
+    ),
+}
+
+# bm25() weights, in the column order of the FTS table
+COLUMN_WEIGHTS = (10.0, 5.0, 5.0, 1.0)  # title, excerpt, tags, content
+
+_TOKEN_RE = re.compile(r'"([^"]*)"?(\*?)|(\S+)')
+_WORD_RE = re.compile(r'\w+')
+
+
+def is_enabled(using=DEFAULT_DB_ALIAS):
+    """Return True when the database ``using`` supports the FTS index"""
+    return connections[using].vendor == 'sqlite'
+
+
+def build_match_expression(query):
+    """
+    Translate a user search string into a safe FTS5 MATCH expression.
+
+    Bare words are ANDed together, ``"quoted text"`` is matched as a phrase
+    and a trailing ``*`` turns a word or phrase into a prefix query. Any
+    other FTS5 syntax in the input is treated as plain text.
+    """
+    terms = []
+    for phrase, star, bare in _TOKEN_RE.findall(query):
+        words = _WORD_RE.findall(phrase or bare)
+        if not words:
+            continue
+        term = '"%s"' % ' '.join(words)
+        if star or bare.endswith('*'):
+            term += '*'
+        terms.append(term)
+    return ' '.join(terms)
+
+
+def search_posts(queryset, query):
+    """Filter ``queryset`` to posts matching ``query``, best matches first"""
+    if not is_enabled():
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(content__icontains=query) |
+            Q(tags__name__icontains=query)
+        ).distinct()
+
+    expression = build_match_expression(query)
+    if not expression:
+        return queryset.none()
+
+    weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS)
+    table = queryset.model._meta.db_table
+    pk_column = queryset.model._meta.pk.column
+    rank = RawSQL(
+        f"SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND rowid = \"{table}\".\"{pk_column}\"",
+        [expression],
+    )
+    return filter_matching(queryset, query).annotate(search_rank=rank).order_by('search_rank', '-created_at')
+
+
+def matching(query, table=FTS_TABLE):
+    """``Q`` for the rows whose rowid matches ``query`` in the FTS ``table``, or None for an empty query"""
+    expression = build_match_expression(query)
+    if not expression:
+        return None
+    return Q(pk__in=RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [expression]))
+
+
+def filter_matching(queryset, query, table=FTS_TABLE):
+    """Filter ``queryset`` to the rows whose rowid matches ``query`` in the FTS ``table``, unranked"""
+    condition = matching(query, table)
+    return queryset.none() if condition is None else queryset.filter(condition)
+
+
+def estimate_count(queryset, query, sample_size=1000):
+    """
+    Return ``(count, is_estimate)`` for a queryset filtered by ``search_posts``.
+
+    Queries matching at most ``sample_size`` indexed posts are counted
+    exactly. For broader ones only the first ``sample_size`` matches are
+    checked against the rest of the filters (status, category, tag) and the
+    share that passes is scaled up to the number of matches in the index,
+    which the index counts without touching the posts table.
+    """
+    expression = build_match_expression(query) if is_enabled() else ''
+    if not expression:
+        return queryset.count(), False
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expression])
+        matches = cursor.fetchone()[0]
+        if matches <= sample_size:
+            return queryset.count(), False
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT %s", [expression, sample_size]
+        )
+        sample = [row[0] for row in cursor.fetchall()]
+    passing = queryset.filter(pk__in=sample).count()
+    estimate = passing * matches / len(sample)
+    # Two significant figures; more would suggest a precision the sample doesn't have
+    digits = max(len(str(int(estimate))) - 2, 0)
+    return int(round(estimate, -digits)), True
+
+
+def _documents(post_ids):
+    """Yield (rowid, title, excerpt, tags, content) rows for the given posts"""
+    from .models import Post
+
+    tag_names = {}
+    through = Post.tags.through
+    for post_id, name in through.objects.filter(post_id__in=post_ids).values_list('post_id', 'tag__name'):
+        tag_names.setdefault(post_id, []).append(name)
+
+    posts = Post.objects.filter(pk__in=post_ids).values_list('pk', 'title', 'excerpt', 'content')
+    for pk, title, excerpt, content in posts:
+        yield pk, title, excerpt, ' '.join(sorted(tag_names.get(pk, []))), content
+
+
+def remove_posts(post_ids):
+    """Drop the given posts from the search index"""
+    post_ids = list(post_ids)
+    if not post_ids or not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pk,) for pk in post_ids])
+
+
+def index_posts(post_ids):
+    """(Re)index the given posts, removing any that no longer exist"""
+    post_ids = list(post_ids)
+    if not post_ids or not is_enabled():
+        return
+    remove_posts(post_ids)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, excerpt, tags, content) VALUES (%s, %s, %s, %s, %s)",
+            list(_documents(post_ids)),
+        )
+
+
+def restore_comment_triggers(using=DEFAULT_DB_ALIAS):
+    """Recreate the comment index triggers missing in ``using`` and resync the index; return their names"""
+    if not is_enabled(using):
+        return []
+    names = [COMMENT_FTS_TABLE, *COMMENT_FTS_TRIGGERS]
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"SELECT name FROM sqlite_master WHERE name IN ({', '.join(['%s'] * len(names))})", names
+        )
+        existing = {name for name, in cursor.fetchall()}
+        if COMMENT_FTS_TABLE not in existing:
+            # Not migrated this far, or comments live in another database
+            return []
+        missing = [name for name in COMMENT_FTS_TRIGGERS if name not in existing]
+        for name in missing:
+            cursor.execute(f"CREATE TRIGGER {name} {COMMENT_FTS_TRIGGERS[name]}")
+        if missing:
+            # Comments may have changed while the triggers were gone
+            cursor.execute(f"INSERT INTO {COMMENT_FTS_TABLE} ({COMMENT_FTS_TABLE}) VALUES ('rebuild')")
+    return missing
+
+
+def rebuild_index(batch_size=1000):
+    """Rebuild the whole search index from the posts table, returning the number of posts indexed"""
+    from .models import Post
+
+    if not is_enabled():
+        return 0
+
+    indexed = 0
+    last_pk = 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        while True:
+            batch = list(
+                Post.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {FTS_TABLE} (rowid, title, excerpt, tags, content) VALUES (%s, %s, %s, %s, %s)",
+                    list(_documents(batch)),
+                )
+            indexed += len(batch)
+            last_pk = batch[-1]
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return indexed
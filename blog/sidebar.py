@@ -0,0 +1,84 @@
+"""
+Sidebar aggregates for ``post_list``: the most used tags and categories.
+
+By default the ranking is the published-post count that ``blog.counters``
+keeps up to date incrementally on every publish, unpublish, retag and
+delete, so the top entries are one read of the ``(-post_count, name)``
+index however many tags exist. With ``BLOG_SIDEBAR_WINDOW_DAYS`` set, posts
+published within that many days are counted instead; that query reads only
+the recent posts and their tag links.
+
+The results are kept in a process-local cache together with the version of
+the ``sidebar`` page cache tag. The signal handlers in ``blog.signals``
+invalidate that tag whenever a count, name or row changes, which every
+process notices on its next request with a single shared cache lookup.
+Entries also expire after ``BLOG_SIDEBAR_CACHE_TIMEOUT`` seconds so that a
+time window keeps moving.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import page_cache
+
+SIDEBAR_TAG = 'sidebar'
+
+_lock = threading.Lock()
+_local = {}
+
+
+def _window_days():
+    return getattr(settings, 'BLOG_SIDEBAR_WINDOW_DAYS', None)
+
+
+def _top(model, limit, related_name):
+    """Return ``limit`` dicts with the pk, name and post count of the most used ``model`` rows"""
+    days = _window_days()
+    if not days:
+        return list(
+            model.objects.filter(post_count__gt=0).order_by('-post_count', 'name')
+            .values('pk', 'name', 'post_count')[:limit]
+        )
+    cutoff = timezone.now() - timedelta(days=days)
+    recent = Q(**{f'{related_name}__status': 'published', f'{related_name}__published_at__gte': cutoff})
+    return list(
+        model.objects.filter(recent).values('pk', 'name')
+        .annotate(post_count=Count(related_name)).order_by('-post_count', 'name')[:limit]
+    )
+
+
+def _cached(name, limit, build):
+    version = page_cache.tag_versions([SIDEBAR_TAG])[SIDEBAR_TAG]
+    key = (name, limit, _window_days())
+    now = time.monotonic()
+    with _lock:
+        entry = _local.get(key)
+    if entry and entry[0] == version and entry[1] > now:
+        return entry[2]
+    items = build()
+    with _lock:
+        _local[key] = (version, now + getattr(settings, 'BLOG_SIDEBAR_CACHE_TIMEOUT', 300), items)
+    return items
+
+
+def popular_tags(limit=None):
+    """The tags with the most published posts, as dicts with ``pk``, ``name`` and ``post_count``"""
+    from .models import Tag
+    limit = limit or getattr(settings, 'BLOG_SIDEBAR_TAGS', 20)
+    return _cached('tags', limit, lambda: _top(Tag, limit, 'posts'))
+
+
+def popular_categories(limit=None):
+    """The categories with the most published posts, as dicts with ``pk``, ``name`` and ``post_count``"""
+    from .models import Category
+    limit = limit or getattr(settings, 'BLOG_SIDEBAR_CATEGORIES', 10)
+    return _cached('categories', limit, lambda: _top(Category, limit, 'posts'))
+
+
+def clear_local_cache():
+    with _lock:
+        _local.clear()
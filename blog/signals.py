@@ -0,0 +1,398 @@
+"""
+Signal handlers that keep derived blog data in sync with the models.
+"""
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import counters, page_cache, related, search, thumbnails
+from .fragments import FRAGMENTS_TAG
+from .pagination import POSTS_COUNT_TAG, SEARCH_COUNT_TAG
+from .routers import comments_are_separate
+from .sidebar import SIDEBAR_TAG
+from .models import Category, Comment, Post, RelatedPost, Tag
+
+
+# Previous row state, read once and shared by the handlers below
+
+@receiver(pre_save, sender=Post)
+def remember_previous_post_state(sender, instance, raw=False, **kwargs):
+    instance._previous_state = None
+    if instance.pk and not raw:
+        instance._previous_state = (
+            Post.objects.filter(pk=instance.pk)
+            .values('status', 'category_id', 'image', 'title', 'excerpt', 'content_hash').first()
+        )
+
+
+@receiver(pre_delete, sender=Post)
+def remember_deleted_post_state(sender, instance, **kwargs):
+    instance._previous_state = Post.objects.filter(pk=instance.pk).values('status', 'category_id', 'image').first()
+    instance._previous_tag_ids = list(
+        Post.tags.through.objects.filter(post_id=instance.pk).values_list('tag_id', flat=True)
+    )
+
+
+@receiver(pre_save, sender=Comment)
+def remember_previous_comment_state(sender, instance, raw=False, **kwargs):
+    instance._previous_state = None
+    if instance.pk and not raw:
+        instance._previous_state = Comment.objects.filter(pk=instance.pk).values('post_id', 'is_active').first()
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def remember_removed_tag_links(sender, instance, action, reverse, pk_set, **kwargs):
+    # clear() sends no pk_set and remove() may name unlinked rows, so capture the links first
+    if action not in ('pre_remove', 'pre_clear'):
+        return
+    if reverse:
+        links = Post.tags.through.objects.filter(tag_id=instance.pk)
+        if action == 'pre_remove':
+            links = links.filter(post_id__in=pk_set)
+    else:
+        links = Post.tags.through.objects.filter(post_id=instance.pk)
+        if action == 'pre_remove':
+            links = links.filter(tag_id__in=pk_set)
+    instance._removed_tag_links = list(links.values_list('post_id', 'tag_id'))
+
+
+def _retagged_post_ids(instance, action, pk_set):
+    """Return the posts a reverse (tag.posts) m2m change touched, drafts included"""
+    removed = getattr(instance, '_removed_tag_links', []) if action != 'post_add' else []
+    return set(pk_set or []) | {post_id for post_id, _ in removed}
+
+
+# Comment cascades across databases
+
+@receiver(post_delete, sender=Post)
+def delete_comments_of_deleted_post(sender, instance, **kwargs):
+    # The deletion collector only looks in the post's database
+    if comments_are_separate():
+        Comment.objects.filter(post_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=User)
+def delete_comments_of_deleted_user(sender, instance, **kwargs):
+    if comments_are_separate():
+        Comment.objects.filter(author_id=instance.pk).delete()
+
+
+# Search index
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, **kwargs):
+    search.index_posts([instance.pk])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_deleted_post(sender, instance, **kwargs):
+    search.remove_posts([instance.pk])
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def reindex_retagged_posts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        search.index_posts([instance.pk])
+    else:
+        search.index_posts(_retagged_post_ids(instance, action, pk_set))
+
+
+@receiver(post_migrate)
+def restore_comment_search_triggers(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    # A migration that rebuilt blog_comment took the triggers with it
+    if sender.label == 'blog':
+        search.restore_comment_triggers(using)
+
+
+@receiver(post_save, sender=Tag)
+def reindex_renamed_tag_posts(sender, instance, created, **kwargs):
+    if not created:
+        search.index_posts(instance.posts.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_deleted_tag_posts(sender, instance, **kwargs):
+    instance._search_post_ids = list(instance.posts.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def reindex_deleted_tag_posts(sender, instance, **kwargs):
+    search.index_posts(getattr(instance, '_search_post_ids', []))
+
+
+# Denormalized counters
+
+@receiver(post_save, sender=Post)
+def update_post_counters(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_previous_state', None) or {'status': None, 'category_id': None}
+    was_published = old['status'] == 'published'
+    is_published = instance.status == 'published'
+
+    if (was_published, old['category_id']) != (is_published, instance.category_id):
+        if was_published:
+            counters.adjust_category_counts([old['category_id']], -1)
+        if is_published:
+            counters.adjust_category_counts([instance.category_id], 1)
+
+    if was_published != is_published:
+        tag_ids = Post.tags.through.objects.filter(post_id=instance.pk).values_list('tag_id', flat=True)
+        counters.adjust_tag_counts(list(tag_ids), 1 if is_published else -1)
+
+
+@receiver(post_delete, sender=Post)
+def update_deleted_post_counters(sender, instance, **kwargs):
+    old = getattr(instance, '_previous_state', None)
+    if old and old['status'] == 'published':
+        counters.adjust_category_counts([old['category_id']], -1)
+        counters.adjust_tag_counts(getattr(instance, '_previous_tag_ids', []), -1)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def update_retagged_counters(sender, instance, action, reverse, pk_set, **kwargs):
+    through = Post.tags.through
+    if action in ('pre_remove', 'pre_clear'):
+        # Only links that actually exist (to published posts) change the counts
+        links = through.objects.filter(post__status='published')
+        if reverse:
+            links = links.filter(tag_id=instance.pk)
+            if action == 'pre_remove':
+                links = links.filter(post_id__in=pk_set)
+        else:
+            links = links.filter(post_id=instance.pk)
+            if action == 'pre_remove':
+                links = links.filter(tag_id__in=pk_set)
+        instance._counter_removed_links = list(links.values_list('post_id', 'tag_id'))
+
+    elif action in ('post_remove', 'post_clear'):
+        removed = getattr(instance, '_counter_removed_links', [])
+        if reverse:
+            counters.adjust_tag_counts([instance.pk], -len(removed))
+        else:
+            counters.adjust_tag_counts([tag_id for _, tag_id in removed], -1)
+
+    elif action == 'post_add' and pk_set:
+        # Django only reports the links that were actually created
+        if reverse:
+            added = Post.objects.filter(pk__in=pk_set, status='published').count()
+            counters.adjust_tag_counts([instance.pk], added)
+        elif instance.status == 'published':
+            counters.adjust_tag_counts(pk_set, 1)
+
+
+@receiver(post_save, sender=Comment)
+def update_comment_counters(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_previous_state', None) or {'post_id': None, 'is_active': False}
+    if (old['post_id'], old['is_active']) == (instance.post_id, instance.is_active):
+        return
+    if old['is_active']:
+        counters.adjust_comment_counts([old['post_id']], -1)
+    if instance.is_active:
+        counters.adjust_comment_counts([instance.post_id], 1)
+
+
+@receiver(post_delete, sender=Comment)
+def update_deleted_comment_counters(sender, instance, **kwargs):
+    if instance.is_active:
+        counters.adjust_comment_counts([instance.post_id], -1)
+
+
+# Page cache invalidation
+
+def _post_author_tag(post):
+    return f'author:{post.author.username}' if post.author_id else None
+
+
+@receiver(post_save, sender=Post)
+def invalidate_saved_post_pages(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_previous_state', None) or {'category_id': None}
+    tag_ids = Post.tags.through.objects.filter(post_id=instance.pk).values_list('tag_id', flat=True)
+    page_cache.invalidate(
+        f'post:{instance.pk}', 'list:home', _post_author_tag(instance),
+        f'category:{old["category_id"]}' if old['category_id'] else None,
+        f'category:{instance.category_id}' if instance.category_id else None,
+        *(f'tag:{tag_id}' for tag_id in tag_ids),
+    )
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_pages(sender, instance, **kwargs):
+    page_cache.invalidate(
+        f'post:{instance.pk}', 'list:home', _post_author_tag(instance),
+        f'category:{instance.category_id}' if instance.category_id else None,
+        *(f'tag:{tag_id}' for tag_id in getattr(instance, '_previous_tag_ids', [])),
+    )
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_retagged_post_pages(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        post_ids = _retagged_post_ids(instance, action, pk_set)
+        page_cache.invalidate(f'tag:{instance.pk}', 'list:home', *(f'post:{pk}' for pk in post_ids))
+    else:
+        removed = getattr(instance, '_removed_tag_links', []) if action != 'post_add' else []
+        tag_ids = set(pk_set or []) | {tag_id for _, tag_id in removed}
+        page_cache.invalidate(f'post:{instance.pk}', 'list:home', *(f'tag:{pk}' for pk in tag_ids))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, **kwargs):
+    old = getattr(instance, '_previous_state', None) or {'post_id': None}
+    page_cache.invalidate(
+        f'post:{instance.post_id}',
+        f'post:{old["post_id"]}' if old['post_id'] else None,
+        counters.COMMENTS_TAG,
+    )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_pages(sender, instance, **kwargs):
+    page_cache.invalidate(f'category:{instance.pk}', 'list:home', SIDEBAR_TAG, FRAGMENTS_TAG)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_pages(sender, instance, **kwargs):
+    page_cache.invalidate(f'tag:{instance.pk}', 'list:home', SIDEBAR_TAG, FRAGMENTS_TAG)
+
+
+# Cached list counts and sidebar aggregates
+
+@receiver(post_save, sender=Post)
+def invalidate_saved_post_counts(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_previous_state', None) or {'status': None, 'category_id': None}
+    was_published = old['status'] == 'published'
+    is_published = instance.status == 'published'
+    if not (was_published or is_published):
+        return
+    if (was_published, old['category_id']) != (is_published, instance.category_id):
+        page_cache.invalidate(POSTS_COUNT_TAG, SIDEBAR_TAG)
+    elif is_published and (old['title'], old['excerpt'], old['content_hash']) != (
+        instance.title, instance.excerpt, instance.content_hash
+    ):
+        page_cache.invalidate(SEARCH_COUNT_TAG)
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_counts(sender, instance, **kwargs):
+    old = getattr(instance, '_previous_state', None)
+    if old and old['status'] == 'published':
+        page_cache.invalidate(POSTS_COUNT_TAG, SIDEBAR_TAG)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_retagged_post_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse and instance.status != 'published':
+        return
+    # Tag names are indexed too, so retagging can change search results
+    page_cache.invalidate(POSTS_COUNT_TAG, SEARCH_COUNT_TAG, SIDEBAR_TAG)
+
+
+@receiver(post_save, sender=Tag)
+def invalidate_renamed_tag_counts(sender, instance, created, **kwargs):
+    if not created:
+        page_cache.invalidate(SEARCH_COUNT_TAG)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Tag)
+def invalidate_deleted_filter_counts(sender, instance, **kwargs):
+    # Posts leave the category (SET_NULL) or lose the tag without Post signals
+    page_cache.invalidate(POSTS_COUNT_TAG, SEARCH_COUNT_TAG)
+
+
+# Cached template fragments
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def touch_retagged_posts(sender, instance, action, reverse, pk_set, **kwargs):
+    # Fragments showing a post's tags are keyed on its updated_at
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        post_ids = _retagged_post_ids(instance, action, pk_set)
+    else:
+        post_ids = {instance.pk}
+    Post.objects.filter(pk__in=post_ids).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=User)
+def invalidate_renamed_user_fragments(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    # Logging in only updates last_login; names shown in fragments can't have changed
+    if created or raw or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    page_cache.invalidate(FRAGMENTS_TAG, f'author:{instance.username}')
+
+
+# Related posts
+
+@receiver(post_save, sender=Post)
+def refresh_related_posts(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_previous_state', None) or {'status': None, 'category_id': None}
+    if created or (old['status'], old['category_id']) != (instance.status, instance.category_id):
+        related.refresh_around(instance.pk)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def refresh_retagged_related_posts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        related.refresh_around(instance.pk)
+        return
+    for post_id in _retagged_post_ids(instance, action, pk_set):
+        related.refresh_around(post_id)
+
+
+@receiver(pre_delete, sender=Post)
+def remember_related_referrers(sender, instance, **kwargs):
+    instance._related_referrers = list(
+        RelatedPost.objects.filter(related_id=instance.pk).values_list('post_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Post)
+def refresh_related_referrers(sender, instance, **kwargs):
+    related.update_related(getattr(instance, '_related_referrers', []))
+
+
+# Image variants (encoded after commit, so the database isn't locked meanwhile)
+
+@receiver(post_save, sender=Post)
+def generate_image_variants(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_previous_state', None) or {'image': None}
+    name = instance.image.name if instance.image else None
+    if name == (old['image'] or None):
+        return
+    if old['image']:
+        transaction.on_commit(partial(thumbnails.delete_variants, old['image']), using=using, robust=True)
+    if name:
+        transaction.on_commit(partial(thumbnails.generate_variants_safely, name), using=using)
+
+
+@receiver(post_delete, sender=Post)
+def delete_image_variants(sender, instance, using=None, **kwargs):
+    if instance.image:
+        transaction.on_commit(partial(thumbnails.delete_variants, instance.image.name), using=using, robust=True)
@@ -0,0 +1,103 @@
+from django import template
+from django.core.cache import cache
+from django.template.base import Variable
+from django.utils.safestring import mark_safe
+
+from blog import fragments
+
+register = template.Library()
+
+GENERATION = 'blog_fragments_generation'
+
+
+class FragmentNode(template.Node):
+    def __init__(self, nodelist, name, obj, vary_on, batch=None, owner=None):
+        self.nodelist = nodelist
+        self.name = name
+        self.obj = obj
+        self.vary_on = vary_on
+        self.batch = batch
+        self.owner = owner
+
+    def _loop_variable(self):
+        """Name of the plain variable holding the object, which batch lookups rebind per item"""
+        if not self.obj.filters and isinstance(self.obj.var, Variable) and '.' not in self.obj.var.var:
+            return self.obj.var.var
+        return None
+
+    def _key(self, context, generation):
+        vary_on = [self.obj.resolve(context).pk, *(value.resolve(context) for value in self.vary_on)]
+        if self.owner is not None:
+            user = context.get('user')
+            vary_on += [getattr(user, 'pk', None) == self.owner.resolve(context), getattr(user, 'is_staff', False)]
+        return fragments.fragment_key(self.name.resolve(context), generation, vary_on)
+
+    def _prefetch(self, context, batch, generation):
+        """Look up the fragments of every object in ``batch`` at once; return ``(keys by object, fragments by key)``"""
+        name = self._loop_variable()
+        if name is None:
+            return {}, {}
+        keys = {}
+        for item in batch:
+            with context.push({name: item}):
+                keys[id(item)] = self._key(context, generation)
+        return keys, cache.get_many(list(keys.values()))
+
+    def render(self, context):
+        if not fragments.is_enabled():
+            return self.nodelist.render(context)
+        render_context = context.render_context
+        if GENERATION not in render_context:
+            render_context[GENERATION] = fragments.generation()
+        generation = render_context[GENERATION]
+        batch = self.batch.resolve(context) if self.batch is not None else None
+        if batch is not None:
+            prefetched = render_context.setdefault(self, {})
+            if id(batch) not in prefetched:
+                prefetched[id(batch)] = self._prefetch(context, batch, generation)
+            keys, found = prefetched[id(batch)]
+            obj = self.obj.resolve(context)
+            key = keys.get(id(obj)) or self._key(context, generation)
+            html = found.get(key)
+        else:
+            key = self._key(context, generation)
+            html = cache.get(key)
+        if html is None:
+            html = self.nodelist.render(context)
+            # Keys are versioned, so whichever render stores a fragment first is as good as any
+            cache.add(key, html, fragments.timeout())
+        return mark_safe(html)
+
+
+@register.tag
+def fragment(parser, token):
+    """
+    Cache the enclosed block per object and version (see ``blog.fragments``).
+
+    Usage::
+
+        {% for post in page_obj %}
+        {% fragment 'card' post post.updated_at post.comment_count batch=page_obj %}
+            ...
+        {% endfragment %}
+        {% endfor %}
+
+    The block is keyed on ``post.pk`` and the other values given. ``batch``
+    names the list being looped over so all its fragments are fetched with
+    one lookup; ``owner=<user id>`` makes the block vary on whether the
+    visitor is that user or staff.
+    """
+    bits = token.split_contents()
+    options = {}
+    positional = []
+    for bit in bits[1:]:
+        key, sep, value = bit.partition('=')
+        if sep and key in ('batch', 'owner'):
+            options[key] = parser.compile_filter(value)
+        else:
+            positional.append(parser.compile_filter(bit))
+    if len(positional) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes at least a fragment name and an object")
+    nodelist = parser.parse(('endfragment',))
+    parser.delete_first_token()
+    return FragmentNode(nodelist, positional[0], positional[1], positional[2:], **options)
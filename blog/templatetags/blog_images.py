@@ -0,0 +1,54 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from blog.thumbnails import VARIANTS, variant_name, variant_names
+
+register = template.Library()
+
+# ``sizes`` hints matching the Bootstrap layout each variant is used in
+SIZES = {
+    'card': '(min-width: 992px) 25vw, (min-width: 768px) 50vw, 100vw',
+    'hero': '(min-width: 992px) 66vw, 100vw',
+}
+
+
+def _srcset(name, fmt):
+    return ', '.join(
+        f'{default_storage.url(variant_name(name, variant, fmt))} {width}w'
+        for variant, (width, _) in VARIANTS.items()
+    )
+
+
+def _has_variants(name):
+    # generate_variants writes the last name after all the others, so one
+    # lookup per image tells whether the set is complete
+    return default_storage.exists(variant_names(name)[-1])
+
+
+@register.simple_tag
+def responsive_image(image, variant, alt='', loading='lazy', **attrs):
+    """
+    Render ``<picture>`` markup for an ``ImageField`` value with WebP and JPEG srcsets.
+
+    Usage: ``{% responsive_image post.image 'card' alt=post.title class='card-img-top' %}``
+
+    Falls back to a plain ``<img>`` of the original until every variant
+    exists, e.g. for images uploaded before ``rebuild_thumbnails`` ran.
+    """
+    if not image:
+        return ''
+    extra = format_html_join(' ', '{}="{}"', attrs.items())
+    if not _has_variants(image.name):
+        return format_html('<img src="{}" alt="{}" loading="{}" {}>', image.url, alt, loading, extra)
+    width, height = VARIANTS[variant]
+    sizes = SIZES.get(variant, '100vw')
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" loading="{}" {}>'
+        '</picture>',
+        _srcset(image.name, 'webp'), sizes,
+        default_storage.url(variant_name(image.name, variant)), _srcset(image.name, 'jpeg'), sizes,
+        width, height, alt, loading, extra,
+    )
@@ -1,3 +1,1232 @@
-from django.test import TestCase
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache, caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from blog_project.sqlite3.base import DEFAULT_PRAGMAS, DatabaseWrapper
+
+from . import (
+    archive, async_views, benchmarks, comment_queue, metrics, moderation, page_cache, query_plans, related,
+    rendering, routers, search, sidebar, thumbnails, view_counts,
+)
+from .cache import TEST_CACHES, LockingFileBasedCache, TwoTierCache
+from .models import Category, Comment, Post, PostViewBucket, Tag
+from .pagination import (
+    POSTS_COUNT_TAG, SEARCH_COUNT_TAG, CachedCountPaginator, EstimatedCountPaginator, InvalidCursor, KeysetPaginator,
+    decode_cursor, encode_cursor, filter_count_key,
+)
+from .routers import CommentsRouter
+from .templatetags.blog_images import responsive_image
+
+# The select list of a query that loads the post body or its rendered HTML
+CONTENT_COLUMN = re.compile(r'"blog_post"\."content(_html)?"')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BlogTestCase(TestCase):
+    """Caches in memory, emptied before every test, so tests never touch the site's shared cache"""
+
+    def setUp(self):
+        cache.clear()
+
+
+@override_settings(BLOG_PAGE_CACHE_ENABLED=False)
+class ListViewProjectionTests(BlogTestCase):
+    """List views render cards from ``Post.summary`` and never load post bodies"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('writer', password='secret')
+        cls.category = Category.objects.create(name='Guides')
+        cls.tag = Tag.objects.create(name='django')
+        cls.post = Post.objects.create(
+            title='Scaling list pages', slug='scaling-list-pages', author=cls.author,
+            category=cls.category, status='published', content=' '.join(['body'] * 5000),
+        )
+        cls.post.tags.add(cls.tag)
+
+    def test_summary_is_set_on_save(self):
+        self.assertEqual(self.post.summary, ' '.join(['body'] * 20) + '…')
+        self.post.excerpt = 'A short excerpt'
+        self.post.save()
+        self.assertEqual(Post.objects.get(pk=self.post.pk).summary, 'A short excerpt')
+
+    def test_list_views_never_read_content(self):
+        urls = [
+            reverse('blog:post_list'),
+            reverse('blog:post_list') + '?search=scaling',
+            reverse('blog:post_list') + f'?category={self.category.pk}&tag={self.tag.pk}',
+            reverse('blog:category_posts', args=[self.category.pk]),
+            reverse('blog:tag_posts', args=[self.tag.pk]),
+            reverse('blog:user_posts', args=[self.author.username]),
+        ]
+        for url in urls:
+            with self.subTest(url=url), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+                self.assertContains(response, 'Scaling list pages')
+                self.assertContains(response, self.post.summary)
+                for query in queries.captured_queries:
+                    select_list = query['sql'].split(' FROM ', 1)[0]
+                    self.assertIsNone(CONTENT_COLUMN.search(select_list), query['sql'])
+
+
+@override_settings(CACHES={
+    **TEST_CACHES,
+    'tier-shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'blog-tier-shared'},
+})
+class TwoTierCacheTests(SimpleTestCase):
+    """Two ``TwoTierCache`` locations over one shared tier behave like two worker processes"""
+
+    def setUp(self):
+        caches['tier-shared'].clear()
+
+    def make_cache(self, location, **options):
+        # Local tiers live as long as the process, so name them after the test
+        return TwoTierCache(f'{self.id()}:{location}', {'OPTIONS': {'SHARED': 'tier-shared', **options}})
+
+    def test_write_in_one_process_keeps_the_others_local_tier(self):
+        first, second = self.make_cache('first'), self.make_cache('second')
+        second.set('hot', 1)
+        second.get('hot')
+        second.reset_tier_stats()
+        first.set('other', 2)
+        first.incr('other')
+        first.delete('other')
+        self.assertEqual(second.get('hot'), 1)
+        self.assertEqual(second.tier_stats()['local_hits'], 1)
+
+    def test_changed_key_is_seen_once_the_local_copy_expires(self):
+        first, second = self.make_cache('first', LOCAL_TIMEOUT=0.05), self.make_cache('second', LOCAL_TIMEOUT=0.05)
+        first.set('version', 1)
+        self.assertEqual(second.get('version'), 1)
+        first.incr('version')
+        self.assertEqual(first.get('version'), 2)
+        time.sleep(0.06)
+        self.assertEqual(second.get('version'), 2)
+
+    def test_clear_empties_every_local_tier(self):
+        first, second = self.make_cache('first'), self.make_cache('second', GENERATION_CHECK_INTERVAL=0)
+        second.set('key', 1)
+        first.clear()
+        self.assertIsNone(second.get('key'))
+        self.assertEqual(second.tier_stats()['generation_resets'], 1)
+
+    def test_threads_of_a_process_share_the_local_tier(self):
+        first, again = self.make_cache('first'), self.make_cache('first')
+        first.set('key', 1)
+        caches['tier-shared'].clear()
+        self.assertEqual(again.get('key'), 1)
+
+    def test_shared_only_keys_skip_the_local_tier(self):
+        cache = self.make_cache('first', SHARED_ONLY_PREFIXES=['stats:'])
+        cache.set('stats:hits', 1)
+        cache.incr('stats:hits')
+        self.assertEqual(cache.tier_stats()['local_entries'], 0)
+        self.assertEqual(caches['tier-shared'].get('stats:hits'), 2)
+
+
+class LockingFileBasedCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = directory.name
+
+    def test_concurrent_increments_are_not_lost(self):
+        LockingFileBasedCache(self.location, {}).set('version', 0, None)
+
+        def bump():
+            # A cache instance per thread, as Django creates them
+            cache = LockingFileBasedCache(self.location, {})
+            for _ in range(50):
+                cache.incr('version')
+
+        threads = [threading.Thread(target=bump) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(LockingFileBasedCache(self.location, {}).get('version'), 400)
+
+    def test_incr_keeps_the_expiry_and_needs_the_key(self):
+        cache = LockingFileBasedCache(self.location, {})
+        cache.set('version', 1, 0.2)
+        cache.incr('version')
+        time.sleep(0.25)
+        self.assertIsNone(cache.get('version'))
+        with self.assertRaises(ValueError):
+            cache.incr('version')
+
+
+@override_settings(BLOG_PAGE_CACHE_ENABLED=False)
+class ViewCountTests(BlogTestCase):
+    """Views are counted in memory and written in batches that never fail a request"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('writer', password='secret')
+        cls.post = Post.objects.create(title='Counted', slug='counted', author=author, status='published', content='Body')
+
+    def setUp(self):
+        super().setUp()
+        # Drop views counted by earlier tests
+        view_counts._take_pending()
+
+    def test_flush_writes_totals_buckets_and_scores(self):
+        for _ in range(3):
+            view_counts.record_view(self.post.pk)
+        self.assertEqual(view_counts.flush(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.view_count, 3)
+        self.assertGreater(self.post.trending_score, 0)
+        self.assertEqual(PostViewBucket.objects.get(post=self.post).views, 3)
+        self.assertEqual(view_counts.trending_posts(), [self.post])
+        self.assertEqual(view_counts.pending_views(), {})
+
+    def test_failed_flush_keeps_the_views(self):
+        view_counts.record_view(self.post.pk)
+        with mock.patch.object(Post.objects, 'bulk_update', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                view_counts.flush()
+        self.assertEqual(view_counts.pending_views(), {self.post.pk: 1})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.view_count, 0)
+
+    @override_settings(BLOG_VIEW_FLUSH_MAX_POSTS=1)
+    def test_failed_flush_does_not_fail_the_request(self):
+        with mock.patch.object(view_counts, 'flush', side_effect=OperationalError('database is locked')) as flush:
+            with self.assertLogs('blog.view_counts', 'ERROR'):
+                response = self.client.get(reverse('blog:post_detail', args=[self.post.pk]))
+                view_counts._flusher.join()
+        self.assertEqual(response.status_code, 200)
+        flush.assert_called_once()
+
+
+@override_settings(BLOG_PAGE_CACHE_ENABLED=False)
+class ImageVariantTests(BlogTestCase):
+    """Variants are written after the save commits and removed with their image"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('writer', password='secret')
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = self.settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def upload(self, name):
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600), 'teal').save(buffer, format='PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def variants_exist(self, name):
+        return [default_storage.exists(target) for target in thumbnails.variant_names(name)]
+
+    def test_original_is_shown_until_the_variants_exist(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(title='Photo', slug='photo', author=self.author, image=self.upload('photo.png'))
+            self.assertEqual(self.variants_exist(post.image.name), [False] * 4)
+            html = responsive_image(post.image, 'card')
+            self.assertIn(f'src="{post.image.url}"', html)
+            self.assertNotIn('srcset', html)
+        self.assertEqual(self.variants_exist(post.image.name), [True] * 4)
+        html = responsive_image(post.image, 'card')
+        self.assertIn(default_storage.url(thumbnails.variant_name(post.image.name, 'card', 'webp')), html)
+
+    def test_replaced_and_deleted_images_lose_their_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(title='Photo', slug='photo', author=self.author, image=self.upload('first.png'))
+        first = post.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            post.image = self.upload('second.png')
+            post.save()
+        self.assertEqual(self.variants_exist(first), [False] * 4)
+        self.assertEqual(self.variants_exist(post.image.name), [True] * 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        self.assertEqual(self.variants_exist(post.image.name), [False] * 4)
+
+    def test_originals_differing_only_in_extension_keep_separate_variants(self):
+        self.assertTrue(set(thumbnails.variant_names('posts/a.jpg')).isdisjoint(thumbnails.variant_names('posts/a.png')))
+
+    def test_decompression_bombs_are_logged_not_raised(self):
+        name = default_storage.save('posts/bomb.png', self.upload('bomb.png'))
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000), self.assertLogs('blog.thumbnails', 'ERROR'):
+            self.assertEqual(thumbnails.generate_variants_safely(name), [])
+
+    def test_one_existence_check_per_image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(title='Photo', slug='photo', author=self.author, image=self.upload('photo.png'))
+        with mock.patch.object(default_storage, 'exists', wraps=default_storage.exists) as exists:
+            self.assertIn('<picture>', responsive_image(post.image, 'card'))
+        self.assertEqual(exists.call_count, 1)
+
+
+@override_settings(BLOG_PAGE_CACHE_ENABLED=False, BLOG_COMMENT_QUEUE_ENABLED=True)
+class CommentQueueTests(BlogTestCase):
+    """Submitted comments wait in the spool and are committed in batches with their submission time"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('writer', password='secret')
+        cls.post = Post.objects.create(title='Queued', slug='queued', author=cls.author, status='published', content='Body')
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        spool = self.settings(BLOG_COMMENT_SPOOL_DIR=directory.name)
+        spool.enable()
+        self.addCleanup(spool.disable)
+        self.client.force_login(self.author)
+
+    def test_comment_is_committed_with_its_submission_time(self):
+        url = reverse('blog:post_detail', args=[self.post.pk])
+        self.client.post(url, {'content': 'Queued **hello**'})
+        self.assertEqual(comment_queue.queued_count(), 1)
+        self.assertFalse(Comment.objects.exists())
+        self.assertContains(self.client.get(url), '<strong>hello</strong>')
+
+        submitted = timezone.now()
+        self.assertEqual(comment_queue.process_batch(), (1, 0))
+        comment = Comment.objects.get()
+        self.assertLess(comment.created_at, submitted)
+        self.assertEqual(comment.updated_at, comment.created_at)
+        self.assertEqual(comment.content_html, '<p>Queued <strong>hello</strong></p>')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertEqual(comment_queue.queued_count(), 0)
+        self.assertEqual(comment_queue.process_batch(), (0, 0))
+
+    def test_comment_on_a_withdrawn_post_is_set_aside(self):
+        self.client.post(reverse('blog:post_detail', args=[self.post.pk]), {'content': 'Too late'})
+        Post.objects.filter(pk=self.post.pk).update(status='draft')
+        with self.assertLogs('blog.comment_queue', 'WARNING'):
+            self.assertEqual(comment_queue.process_batch(), (0, 1))
+        self.assertEqual(len(os.listdir(comment_queue.spool_directory('failed'))), 1)
+        self.assertFalse(Comment.objects.exists())
+
+
+class AdminSearchTests(BlogTestCase):
+    """Changelist searches use the FTS index and still match the fields it doesn't cover"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='secret')
+        alice = User.objects.create_user('alice', password='secret')
+        bob = User.objects.create_user('bob', password='secret')
+        post = Post.objects.create(title='Scaling SQLite', slug='scaling-sqlite', author=alice, status='published', content='WAL mode')
+        cls.alice_comment = Comment.objects.create(post=post, author=alice, content='Lovely write-up')
+        cls.bob_comment = Comment.objects.create(post=post, author=bob, content='Thanks for this')
+
+    def search(self, model, term):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse(f'admin:blog_{model}_changelist'), {'q': term})
+        return set(response.context['cl'].result_list)
+
+    def test_comment_search_covers_content_usernames_and_post_titles(self):
+        self.assertEqual(self.search('comment', 'lovely'), {self.alice_comment})
+        self.assertEqual(self.search('comment', 'bob'), {self.bob_comment})
+        self.assertEqual(self.search('comment', 'scaling'), {self.alice_comment, self.bob_comment})
+        self.assertEqual(self.search('comment', 'nothing'), set())
+
+    def test_post_search_uses_the_index(self):
+        self.assertEqual([post.title for post in self.search('post', 'wal')], ['Scaling SQLite'])
+
+
+@override_settings(BLOG_ESTIMATE_COUNT_OVER=3)
+class EstimatedCountPaginatorTests(BlogTestCase):
+    def test_page_past_the_last_row_falls_back_to_the_exact_count(self):
+        categories = [Category.objects.create(name=f'Category {i}') for i in range(6)]
+        Category.objects.filter(pk__in=[category.pk for category in categories[1:5]]).delete()
+        paginator = EstimatedCountPaginator(Category.objects.order_by('pk'), 2)
+        self.assertEqual(paginator.count, 6)
+        self.assertTrue(paginator.estimated)
+        page = paginator.page(3)
+        self.assertEqual(list(page), [categories[0], categories[5]])
+        self.assertEqual((paginator.count, paginator.num_pages, paginator.estimated), (2, 1, False))
+
+    def test_filtered_querysets_are_counted(self):
+        for i in range(4):
+            Category.objects.create(name=f'Category {i}')
+        paginator = EstimatedCountPaginator(Category.objects.filter(name__endswith='1'), 2)
+        self.assertEqual(paginator.count, 1)
+        self.assertFalse(paginator.estimated)
+
+
+class ModerationTests(BlogTestCase):
+    """Bulk moderation keeps comment counts, the search index and cached pages consistent"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('writer', password='secret')
+        cls.post = Post.objects.create(title='Moderated', slug='moderated', author=author, status='published', content='Body')
+        for content, is_active in [('Helpful reply', True), ('Buy cheap spam', True), ('Old spam', False)]:
+            Comment.objects.create(post=cls.post, author=author, content=content, is_active=is_active)
+
+    def comment_count(self):
+        self.post.refresh_from_db()
+        return self.post.comment_count
+
+    def test_hide_and_approve_in_batches(self):
+        self.assertEqual(self.comment_count(), 2)
+        self.assertEqual(moderation.moderate(Comment.objects.all(), 'hide', batch_size=1), 2)
+        self.assertEqual(self.comment_count(), 0)
+        self.assertEqual(moderation.moderate(Comment.objects.all(), 'approve', batch_size=2), 3)
+        self.assertEqual(self.comment_count(), 3)
+
+    def test_purge_matching_comments(self):
+        tag = f'post:{self.post.pk}'
+        version = page_cache.tag_versions([tag])[tag]
+        self.assertEqual(moderation.moderate(moderation.comment_filter(matching='spam'), 'purge'), 2)
+        self.assertEqual(list(Comment.objects.values_list('content', flat=True)), ['Helpful reply'])
+        self.assertEqual(self.comment_count(), 1)
+        self.assertFalse(moderation.comment_filter(matching='spam').exists())
+        self.assertNotEqual(page_cache.tag_versions([tag])[tag], version)
+
+
+class RenderingTests(BlogTestCase):
+    """Stored HTML is re-rendered once the renderer or the sanitizer policy changes"""
+
+    def test_sanitizer_policy_change_makes_stored_html_stale(self):
+        author = User.objects.create_user('writer', password='secret')
+        post = Post.objects.create(title='Markup', slug='markup', author=author, content='Some <u>underlined</u> **text**')
+        self.assertEqual(post.content_html, '<p>Some <u>underlined</u> <strong>text</strong></p>')
+        self.assertFalse(rendering.refresh_rendered(post, rendering.POST_EXTENSIONS))
+        with mock.patch.object(rendering, 'ALLOWED_TAGS', rendering.ALLOWED_TAGS - {'u'}):
+            self.assertTrue(rendering.refresh_rendered(post, rendering.POST_EXTENSIONS))
+        self.assertEqual(post.content_html, '<p>Some underlined <strong>text</strong></p>')
+
+    def test_sanitizer_version_is_part_of_the_hash(self):
+        digest = rendering.content_hash('text')
+        with mock.patch.object(rendering.nh3, '__version__', '99.0'):
+            self.assertNotEqual(rendering.content_hash('text'), digest)
+
+
+class RetaggedPostTests(BlogTestCase):
+    """Removing a tag from the tag's side touches every affected post, drafts included"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('writer', password='secret')
+        cls.tag = Tag.objects.create(name='django')
+        cls.draft = Post.objects.create(title='Draft', slug='draft', author=cls.author, content='Draft body')
+        cls.draft.tags.add(cls.tag)
+
+    def assert_draft_touched(self, change):
+        version = page_cache.tag_versions([f'post:{self.draft.pk}'])[f'post:{self.draft.pk}']
+        Post.objects.filter(pk=self.draft.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        before = Post.objects.get(pk=self.draft.pk).updated_at
+        change()
+        self.assertGreater(Post.objects.get(pk=self.draft.pk).updated_at, before)
+        self.assertNotEqual(page_cache.tag_versions([f'post:{self.draft.pk}'])[f'post:{self.draft.pk}'], version)
+
+    def test_clear_touches_drafts(self):
+        self.assert_draft_touched(self.tag.posts.clear)
+
+    def test_remove_touches_drafts(self):
+        self.assert_draft_touched(lambda: self.tag.posts.remove(self.draft))
+
+
+@override_settings(BLOG_PAGE_CACHE_ENABLED=False)
+class RelatedPostTests(BlogTestCase):
+    """Stored related posts follow retags from either side of the relation"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('writer', password='secret')
+        cls.orm = Tag.objects.create(name='orm')
+        cls.caching = Tag.objects.create(name='caching')
+        cls.post, cls.orm_post, cls.caching_post = [
+            Post.objects.create(title=title, slug=title.lower(), author=author, status='published', content='Body')
+            for title in ('Post', 'Queries', 'Caches')
+        ]
+        cls.post.tags.add(cls.orm)
+        cls.orm_post.tags.add(cls.orm)
+        cls.caching_post.tags.add(cls.caching)
+
+    def assert_related(self, post, expected):
+        self.assertEqual(related.related_posts(post), expected)
+
+    def test_retagged_post_moves_to_its_new_neighbours(self):
+        self.assert_related(self.post, [self.orm_post])
+        self.post.tags.set([self.caching])
+        self.assert_related(self.post, [self.caching_post])
+        self.assert_related(self.orm_post, [])
+        self.assert_related(self.caching_post, [self.post])
+
+    def test_retag_from_the_tag_side(self):
+        self.caching.posts.add(self.orm_post)
+        self.assert_related(self.caching_post, [self.orm_post])
+        self.orm.posts.clear()
+        self.assert_related(self.post, [])
+        self.assert_related(self.orm_post, [self.caching_post])
+
+    def test_post_detail_lists_related_posts(self):
+        response = self.client.get(self.post.get_absolute_url())
+        self.assertEqual(response.context['related_posts'], [self.orm_post])
+
+
+@override_settings(BLOG_PAGE_CACHE_ENABLED=False)
+class SearchTests(BlogTestCase):
+    """Search uses the FTS index on SQLite and ``icontains`` elsewhere"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('writer', password='secret')
+        tag = Tag.objects.create(name='orm')
+        cls.in_title = Post.objects.create(
+            title='Database indexes', slug='database-indexes', author=author, status='published',
+            content='Covering indexes explained',
+        )
+        cls.in_content = Post.objects.create(
+            title='Query plans', slug='query-plans', author=author, status='published',
+            content='Reading plans before adding database indexes',
+        )
+        cls.tagged = Post.objects.create(title='Managers', slug='managers', author=author, status='published', content='Body')
+        cls.tagged.tags.add(tag)
+
+    def test_matches_are_ranked_by_column_weight(self):
+        results = list(search.search_posts(Post.objects.all(), 'database'))
+        self.assertEqual(results, [self.in_title, self.in_content])
+
+    def test_tag_names_and_prefixes_match(self):
+        self.assertEqual(list(search.search_posts(Post.objects.all(), 'orm')), [self.tagged])
+        self.assertEqual(list(search.search_posts(Post.objects.all(), 'manag*')), [self.tagged])
+
+    def test_index_follows_edits(self):
+        self.tagged.title = 'Database managers'
+        self.tagged.save()
+        self.assertIn(self.tagged, search.search_posts(Post.objects.all(), 'database'))
+        self.tagged.tags.clear()
+        self.assertEqual(list(search.search_posts(Post.objects.all(), 'orm')), [])
+
+    def test_fts_syntax_is_treated_as_text(self):
+        for query in ('database OR', 'NEAR(database', '"unbalanced', 'title:database', '*'):
+            with self.subTest(query=query):
+                list(search.search_posts(Post.objects.all(), query))
+        self.assertEqual(list(search.search_posts(Post.objects.all(), '"!?"')), [])
+
+    def test_falls_back_to_icontains(self):
+        with mock.patch.object(search, 'is_enabled', return_value=False):
+            results = set(search.search_posts(Post.objects.all(), 'database'))
+            self.assertEqual(results, {self.in_title, self.in_content})
+            self.assertEqual(list(search.search_posts(Post.objects.all(), 'orm')), [self.tagged])
+
+    def test_search_view(self):
+        response = self.client.get(reverse('blog:post_list'), {'search': 'covering'})
+        self.assertContains(response, 'Database indexes')
+        self.assertNotContains(response, 'Query plans')
+
+
+@override_settings(BLOG_PAGE_CACHE_ENABLED=False)
+class CounterSignalTests(BlogTestCase):
+    """``comment_count`` and ``post_count`` follow publishing, retagging, moderation and deletes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('writer', password='secret')
+        cls.category = Category.objects.create(name='Guides')
+        cls.tag = Tag.objects.create(name='django')
+
+    def create_post(self, **fields):
+        post = Post.objects.create(
+            title='Counted', slug=f'counted-{Post.objects.count()}', author=self.author,
+            category=self.category, content='Body', **fields,
+        )
+        post.tags.add(self.tag)
+        return post
+
+    def assert_post_counts(self, category, tag):
+        self.category.refresh_from_db()
+        self.tag.refresh_from_db()
+        self.assertEqual((self.category.post_count, self.tag.post_count), (category, tag))
+
+    def test_publish_and_unpublish(self):
+        post = self.create_post()
+        self.assert_post_counts(0, 0)
+        post.status = 'published'
+        post.save()
+        self.assert_post_counts(1, 1)
+        post.status = 'draft'
+        post.save()
+        self.assert_post_counts(0, 0)
+
+    def test_recategorize(self):
+        post = self.create_post(status='published')
+        other = Category.objects.create(name='News')
+        post.category = other
+        post.save()
+        other.refresh_from_db()
+        self.assertEqual(other.post_count, 1)
+        self.assert_post_counts(0, 1)
+
+    def test_retag_from_either_side(self):
+        post = self.create_post(status='published')
+        draft = self.create_post()
+        post.tags.remove(self.tag)
+        self.assert_post_counts(1, 0)
+        self.tag.posts.add(post, draft)
+        self.assert_post_counts(1, 1)
+        self.tag.posts.clear()
+        self.assert_post_counts(1, 0)
+        post.tags.set([self.tag])
+        self.assert_post_counts(1, 1)
+
+    def test_delete(self):
+        post = self.create_post(status='published')
+        post.delete()
+        self.assert_post_counts(0, 0)
+        self.create_post(status='published')
+        self.tag.delete()
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.post_count, 1)
+
+    def test_comment_counts(self):
+        post = self.create_post(status='published')
+        comment = Comment.objects.create(post=post, author=self.author, content='First')
+        Comment.objects.create(post=post, author=self.author, content='Hidden', is_active=False)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        comment.is_active = False
+        comment.save()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        comment.is_active = True
+        comment.save()
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+
+
+@override_settings(BLOG_PAGE_CACHE_ENABLED=False)
+class CursorPaginationTests(BlogTestCase):
+    """Cursor pages walk the newest-first order in both directions without gaps or repeats"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('writer', password='secret')
+        now = timezone.now()
+        for number in range(7):
+            post = Post.objects.create(
+                title=f'Post {number}', slug=f'post-{number}', author=author, status='published', content='Body',
+            )
+            # Two posts share a timestamp so the id breaks the tie
+            Post.objects.filter(pk=post.pk).update(created_at=now - timedelta(hours=min(number, 5)))
+        cls.ordered = list(Post.objects.order_by('-created_at', '-pk'))
+
+    def setUp(self):
+        self.paginator = KeysetPaginator(Post.objects.all(), 3)
+
+    def test_round_trip(self):
+        first = self.paginator.get_page(None)
+        second = self.paginator.get_page(first.next_cursor)
+        third = self.paginator.get_page(second.next_cursor)
+        self.assertEqual(list(first) + list(second) + list(third), self.ordered)
+        self.assertEqual((first.has_previous(), third.has_next(), third.next_cursor), (False, False, ''))
+        self.assertEqual(list(self.paginator.get_page(third.previous_cursor)), list(second))
+        self.assertEqual(list(self.paginator.get_page(second.previous_cursor)), list(first))
+        self.assertFalse(self.paginator.get_page(second.previous_cursor).has_previous())
+
+    def test_invalid_cursor_serves_the_first_page(self):
+        for cursor in ('garbage', 'W10', encode_cursor(self.ordered[0], 'sideways')):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(list(self.paginator.get_page(cursor)), self.ordered[:3])
+        self.assertRaises(InvalidCursor, decode_cursor, 'garbage')
+
+    def test_list_view_follows_cursors(self):
+        response = self.client.get(reverse('blog:post_list'), {'cursor': ''})
+        page = response.context['page_obj']
+        self.assertTrue(page.is_cursor)
+        self.assertEqual(list(page), self.ordered[:6])
+        response = self.client.get(reverse('blog:post_list'), {'cursor': page.next_cursor})
+        self.assertEqual(list(response.context['page_obj']), self.ordered[6:])
+        response = self.client.get(reverse('blog:post_list'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(BLOG_PAGE_CACHE_ENABLED=True, BLOG_VIEW_COUNTS_ENABLED=False)
+class PageCacheTests(BlogTestCase):
+    """Anonymous pages are served from the cache until a change invalidates them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('writer', password='secret')
+        cls.post = Post.objects.create(
+            title='Cached post', slug='cached-post', author=cls.author, status='published', content='Body',
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('blog:post_detail', args=[self.post.pk])
+
+    def test_hit_until_the_post_changes(self):
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'hit')
+        self.post.title = 'Edited post'
+        self.post.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Edited post')
+
+    def test_list_is_invalidated_by_a_new_post(self):
+        url = reverse('blog:post_list')
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'hit')
+        Post.objects.create(title='Fresh post', slug='fresh-post', author=self.author, status='published', content='Body')
+        self.assertContains(self.client.get(url), 'Fresh post')
+
+    def test_logged_in_users_bypass_the_cache(self):
+        self.client.force_login(self.author)
+        response = self.client.get(self.url)
+        self.assertNotIn('X-Page-Cache', response)
+
+    def test_stats_are_counted_in_process(self):
+        page_cache.reset_stats()
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.assertEqual(page_cache.stats(), {'hits': 1, 'misses': 1, 'invalidations': 0})
+        metrics = self.client.get(reverse('blog:metrics')).content.decode()
+        self.assertIn('blog_page_cache_hits_total 1\n', metrics)
+        self.assertIn('blog_page_cache_misses_total 1\n', metrics)
+
+
+@override_settings(BLOG_PAGE_CACHE_ENABLED=True, BLOG_VIEW_COUNTS_ENABLED=False)
+class ConditionalGetTests(BlogTestCase):
+    """Pages carry validators and answer 304 until something they show changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('writer', password='secret')
+        cls.category = Category.objects.create(name='Guides')
+        cls.tag = Tag.objects.create(name='django')
+        cls.post = Post.objects.create(
+            title='Cached post', slug='cached-post', author=cls.author, category=cls.category,
+            status='published', content='Body',
+        )
+        cls.post.tags.add(cls.tag)
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('blog:post_detail', args=[self.post.pk])
+
+    def assert_renaming_refreshes(self, url, rename):
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        rename()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_renamed_category_tag_and_author_refresh_their_pages(self):
+        def rename(obj, field):
+            def change():
+                setattr(obj, field, getattr(obj, field) + ' renamed')
+                obj.save()
+            return change
+
+        urls = {
+            reverse('blog:category_posts', args=[self.category.pk]): rename(self.category, 'name'),
+            reverse('blog:tag_posts', args=[self.tag.pk]): rename(self.tag, 'name'),
+            reverse('blog:user_posts', args=[self.author.username]): rename(self.author, 'first_name'),
+        }
+        for url, change in urls.items():
+            with self.subTest(url=url):
+                self.assert_renaming_refreshes(url, change)
+        for field, obj in (('name', self.category), ('name', self.tag), ('first_name', self.author)):
+            with self.subTest(post_renames=field):
+                self.assert_renaming_refreshes(self.url, rename(obj, field))
+
+    def test_list_validators_do_not_aggregate(self):
+        url = reverse('blog:post_list')
+        etag = self.client.get(url, {'search': 'cached'})['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'search': 'cached'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        for query in queries.captured_queries:
+            self.assertNotRegex(query['sql'], r'COUNT\(|SUM\(|MATCH', query['sql'])
+        # Cards show comment counts, which no post edit records
+        Comment.objects.create(post=self.post, author=self.author, content='New comment')
+        self.assertEqual(self.client.get(url, {'search': 'cached'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_not_modified_until_a_comment_is_added(self):
+        response = self.client.get(self.url)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        Comment.objects.create(post=self.post, author=self.author, content='New comment')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'New comment')
+
+    def test_logged_in_pages_are_private(self):
+        anonymous = self.client.get(self.url)
+        self.client.force_login(self.author)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=anonymous['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+
+
+@override_settings(BLOG_PAGE_CACHE_ENABLED=False)
+class ArchiveTests(BlogTestCase):
+    """Archives round-trip the content, and imported HTML is never trusted"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('writer', password='secret', first_name='Wanda')
+        category = Category.objects.create(name='Guides')
+        tag = Tag.objects.create(name='django')
+        post = Post.objects.create(
+            title='Archived', slug='archived', author=cls.author, category=category,
+            status='published', content='Some **bold** text',
+        )
+        post.tags.add(tag)
+        Comment.objects.create(post=post, author=cls.author, content='A *comment*')
+
+    def export(self):
+        out = StringIO()
+        archive.export_archive(out)
+        return out.getvalue().splitlines()
+
+    def test_round_trip(self):
+        lines = self.export()
+        before = Post.objects.values('title', 'content_html', 'created_at', 'category__name').get()
+        Post.objects.all().delete()
+        Category.objects.all().delete()
+        Tag.objects.all().delete()
+        totals = archive.import_archive(lines)
+        self.assertEqual((totals['posts'], totals['comments'], totals['categories'], totals['tags']), (1, 1, 1, 1))
+        post = Post.objects.get(slug='archived')
+        self.assertEqual(Post.objects.values('title', 'content_html', 'created_at', 'category__name').get(), before)
+        self.assertEqual([tag.name for tag in post.tags.all()], ['django'])
+        self.assertEqual((post.comment_count, Category.objects.get().post_count), (1, 1))
+        self.assertEqual(archive.import_archive(lines)['skipped_posts'], 1)
+
+    def test_imported_html_is_sanitized(self):
+        header, *records = self.export()
+        post = json.loads(records[-1])
+        post.update(slug='forged', content_html='<p onclick="steal()">Hi</p><script>steal()</script>')
+        post['comments'][0]['content_html'] = '<img src=x onerror="steal()">'
+        archive.import_archive([header, json.dumps(post)])
+        forged = Post.objects.get(slug='forged')
+        html = forged.content_html + forged.comments.get().content_html
+        self.assertNotIn('script', html)
+        self.assertNotIn('steal', html)
+        self.assertEqual(forged.content_hash, rendering.content_hash(forged.content))
+
+
+@override_settings(BLOG_PAGE_CACHE_ENABLED=False, BLOG_VIEW_COUNTS_ENABLED=False)
+class BenchmarkTests(BlogTestCase):
+    """Benchmark scenarios report latency, query counts and SQL time below a millisecond"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('writer', password='secret')
+        cls.post = Post.objects.create(title='Measured', slug='measured', author=author, status='published', content='Body')
+
+    def test_sql_time_is_not_rounded_away(self):
+        scenario = benchmarks.Scenario('post_detail', 'get', reverse('blog:post_detail', args=[self.post.pk]), None, False)
+        result = benchmarks.run_scenario(scenario, iterations=3, warmup=1)
+        self.assertEqual(result['status'], [200])
+        self.assertGreater(result['queries'], 0)
+        self.assertGreater(result['sql_ms'], 0)
+        self.assertLess(result['sql_ms'], result['latency_ms']['max'])
+
+
+class CommentSearchIndexTests(BlogTestCase):
+    """The comment index triggers come back after a migration rebuilds the comment table"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('writer', password='secret')
+        cls.post = Post.objects.create(title='Post', slug='post', author=cls.author, status='published', content='Body')
+
+    def matching(self, query):
+        return list(search.filter_matching(Comment.objects.all(), query, search.COMMENT_FTS_TABLE))
+
+    def test_migrated_database_has_every_trigger(self):
+        self.assertEqual(search.restore_comment_triggers(), [])
+
+    def test_missing_triggers_are_recreated_and_the_index_resynced(self):
+        with connection.cursor() as cursor:
+            for name in search.COMMENT_FTS_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER {name}')
+        comment = Comment.objects.create(post=self.post, author=self.author, content='written while unindexed')
+        self.assertEqual(self.matching('unindexed'), [])
+        self.assertEqual(search.restore_comment_triggers(), list(search.COMMENT_FTS_TRIGGERS))
+        self.assertEqual(self.matching('unindexed'), [comment])
+        comment.content = 'edited afterwards'
+        comment.save()
+        self.assertEqual((self.matching('unindexed'), self.matching('edited')), ([], [comment]))
+
+
+@override_settings(BLOG_PAGE_CACHE_ENABLED=False, BLOG_VIEW_COUNTS_ENABLED=False)
+class MetricsTests(BlogTestCase):
+    """Requests feed per-view histograms, rendered by /metrics/ for allowed clients only"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('writer', password='secret')
+        cls.post = Post.objects.create(title='Post', slug='post', author=author, status='published', content='Body')
+
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+        self.addCleanup(metrics.registry.clear)
+
+    def series(self, text, name, view):
+        """Return ``{le: count}`` of the buckets and the count of ``name`` for ``view``"""
+        labels = f'view="{view}",method="GET"'
+        buckets = dict(re.findall(rf'^{name}_bucket\{{{labels},le="([^"]+)"\}} (\d+)$', text, re.MULTILINE))
+        count = re.search(rf'^{name}_count\{{{labels}\}} (\d+)$', text, re.MULTILINE)
+        return buckets, int(count.group(1)) if count else 0
+
+    def test_histograms_per_view(self):
+        self.client.get(self.post.get_absolute_url())
+        self.client.get(self.post.get_absolute_url())
+        text = self.client.get(reverse('blog:metrics')).content.decode()
+        self.assertIn('# TYPE blog_request_duration_seconds histogram\n', text)
+        buckets, count = self.series(text, 'blog_request_duration_seconds', 'blog:post_detail')
+        self.assertEqual(count, 2)
+        self.assertEqual(list(buckets), [*map(repr, metrics.DURATION_BUCKETS), '+Inf'])
+        self.assertEqual(buckets['+Inf'], '2')
+        self.assertEqual(list(map(int, buckets.values())), sorted(map(int, buckets.values())))
+        queries, _ = self.series(text, 'blog_request_sql_queries', 'blog:post_detail')
+        # post_detail always runs more than one query, so nothing lands in the lowest bucket
+        self.assertEqual(queries['1'], '0')
+        _, count = self.series(text, 'blog_response_size_bytes', 'blog:post_detail')
+        self.assertEqual(count, 2)
+
+    def test_hidden_from_other_clients(self):
+        response = self.client.get(reverse('blog:metrics'), REMOTE_ADDR='203.0.113.9')
+        self.assertEqual(response.status_code, 404)
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    """The project backend applies its pragmas and retries statements that hit the write lock"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'locks.sqlite3')
+
+    def open(self, **options):
+        settings_dict = {**connection.settings_dict, 'NAME': self.path, 'TEST': {}}
+        settings_dict['OPTIONS'] = {'pragmas': {'journal_mode': 'WAL', 'busy_timeout': 0}, **options}
+        wrapper = DatabaseWrapper(settings_dict, alias='locks')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def hold_write_lock(self):
+        # Released from a timer thread in test_locked_statements_are_retried
+        holder = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.addCleanup(holder.close)
+        holder.execute('BEGIN IMMEDIATE')
+        return holder
+
+    def test_pragmas_are_applied(self):
+        wrapper = self.open(pragmas={**DEFAULT_PRAGMAS, 'busy_timeout': 1234})
+        with wrapper.cursor() as cursor:
+            for name, expected in [('journal_mode', 'wal'), ('synchronous', 1), ('busy_timeout', 1234)]:
+                cursor.execute(f'PRAGMA {name}')
+                self.assertEqual(cursor.fetchone()[0], expected)
+
+    def test_invalid_pragmas_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.open(pragmas={'journal_mode': 'WAL; DROP TABLE x'}).cursor()
+
+    def test_locked_statements_are_retried(self):
+        wrapper = self.open(lock_retries=8, lock_retry_delay=0.01)
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id integer)')
+        holder = self.hold_write_lock()
+        threading.Timer(0.05, holder.rollback).start()
+        with wrapper.cursor() as cursor:
+            cursor.execute('INSERT INTO item VALUES (1)')
+            cursor.execute('SELECT count(*) FROM item')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_gives_up_after_the_last_retry(self):
+        wrapper = self.open(lock_retries=2, lock_retry_delay=0.001)
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id integer)')
+        self.hold_write_lock()
+        with mock.patch('blog_project.sqlite3.base.time.sleep') as sleep, self.assertRaises(OperationalError):
+            with wrapper.cursor() as cursor:
+                cursor.execute('INSERT INTO item VALUES (1)')
+        self.assertEqual(sleep.call_count, 2)
+
+
+@override_settings(BLOG_COMMENTS_DATABASE='comments')
+class CommentsRouterTests(SimpleTestCase):
+    """Comment reads, writes and migrations go to the comments alias, everything else stays in default"""
+
+    def setUp(self):
+        self.router = CommentsRouter()
+
+    def test_comment_queries_use_the_comments_alias(self):
+        self.assertEqual(self.router.db_for_write(Comment), 'comments')
+        self.assertEqual(self.router.db_for_read(Comment, instance=Post()), 'comments')
+        self.assertEqual(self.router.db_for_write(Post, instance=Comment()), 'default')
+        self.assertEqual(self.router.db_for_read(User), 'default')
+        self.assertEqual(Comment.objects.all().db, 'comments')
+        self.assertEqual(Post.objects.all().db, 'default')
+
+    def test_comments_are_separate(self):
+        self.assertEqual(routers.comments_database(), 'comments')
+        self.assertTrue(routers.comments_are_separate())
+        with self.settings(BLOG_COMMENTS_DATABASE=None):
+            self.assertEqual(routers.comments_database(), 'default')
+            self.assertFalse(routers.comments_are_separate())
+
+    def test_only_the_comment_table_is_migrated_to_the_comments_alias(self):
+        self.assertIs(self.router.allow_migrate('comments', 'blog', model_name='comment'), True)
+        self.assertIs(self.router.allow_migrate('comments', 'blog', model_name='post'), False)
+        self.assertIs(self.router.allow_migrate('comments', 'auth', model_name='user'), False)
+        self.assertIsNone(self.router.allow_migrate('default', 'blog', model_name='comment'))
+
+    def test_relations_across_databases_are_allowed_for_comments(self):
+        self.assertIs(self.router.allow_relation(Comment(), Post()), True)
+        self.assertIsNone(self.router.allow_relation(Post(), Category()))
+
+
+async def run_in_test_thread(func, *args, **kwargs):
+    # TestCase data is only visible to the test's own connection, so skip the worker threads
+    return await sync_to_async(func)(*args, **kwargs)
+
+
+@override_settings(BLOG_PAGE_CACHE_ENABLED=False, BLOG_VIEW_COUNTS_ENABLED=False)
+@mock.patch.object(async_views, 'run_blocking', run_in_test_thread)
+class AsyncViewTests(BlogTestCase):
+    """The async read views render posts and comments loaded concurrently"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('writer', password='secret')
+        cls.post = Post.objects.create(title='Async post', slug='async-post', author=cls.author, status='published', content='Body')
+        cls.draft = Post.objects.create(title='Async draft', slug='async-draft', author=cls.author, content='Body')
+        Comment.objects.create(post=cls.post, author=cls.author, content='Awaited comment')
+
+    def get(self, view, path, *args):
+        request = RequestFactory().get(path)
+        request.user, request.session = AnonymousUser(), SessionStore()
+        return async_to_sync(view)(request, *args)
+
+    def test_post_list(self):
+        response = self.get(async_views.post_list, reverse('blog:post_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Async post')
+        self.assertNotContains(response, 'Async draft')
+
+    def test_post_detail(self):
+        response = self.get(async_views.post_detail, self.post.get_absolute_url(), self.post.pk)
+        self.assertContains(response, 'Async post')
+        self.assertContains(response, 'Awaited comment')
+
+    def test_drafts_are_not_found(self):
+        with self.assertRaises(Http404):
+            self.get(async_views.post_detail, self.draft.get_absolute_url(), self.draft.pk)
+
+
+class CachedCountTests(BlogTestCase):
+    """Cached list counts are reused until a post enters or leaves the list"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('writer', password='secret')
+        cls.published = Post.objects.create(title='Out', slug='out', author=cls.author, status='published', content='Body')
+        cls.draft = Post.objects.create(title='Soon', slug='soon', author=cls.author, content='Body')
+
+    def count(self, **options):
+        posts = Post.objects.filter(status='published').order_by('-created_at')
+        return CachedCountPaginator(posts, 6, count_key=filter_count_key('post_list', None, None), **options).count
+
+    def test_count_is_cached(self):
+        self.assertEqual(self.count(), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.count(), 1)
+
+    def test_publishing_invalidates_the_count(self):
+        self.assertEqual(self.count(), 1)
+        self.draft.content = 'Edited while still a draft'
+        self.draft.save()
+        self.assertEqual(self.count(), 1)
+        self.draft.status = 'published'
+        self.draft.save()
+        self.assertEqual(self.count(), 2)
+        self.published.delete()
+        self.assertEqual(self.count(), 1)
+
+    def test_search_counts_follow_text_edits(self):
+        counter = mock.Mock(return_value=(1, False))
+        self.count(count_tags=(POSTS_COUNT_TAG, SEARCH_COUNT_TAG), counter=counter)
+        self.draft.title = 'Still a draft'
+        self.draft.save()
+        self.count(count_tags=(POSTS_COUNT_TAG, SEARCH_COUNT_TAG), counter=counter)
+        self.assertEqual(counter.call_count, 1)
+        self.published.title = 'Renamed'
+        self.published.save()
+        self.count(count_tags=(POSTS_COUNT_TAG, SEARCH_COUNT_TAG), counter=counter)
+        self.assertEqual(counter.call_count, 2)
+
+
+@override_settings(BLOG_PAGE_CACHE_ENABLED=False, BLOG_VIEW_COUNTS_ENABLED=False)
+class QueryPlanAuditTests(BlogTestCase):
+    """The audit flags full scans and temporary sorts, and the indexed views have none"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('writer', password='secret')
+        category = Category.objects.create(name='Guides')
+        tag = Tag.objects.create(name='django')
+        for i in range(8):
+            post = Post.objects.create(
+                title=f'Post {i}', slug=f'post-{i}', author=author, category=category, status='published', content='Body',
+            )
+            post.tags.add(tag)
+            Comment.objects.create(post=post, author=author, content=f'Comment {i}')
+
+    def test_problems(self):
+        plan = [
+            'SCAN blog_post',
+            'SCAN blog_tag',
+            'SEARCH blog_post USING INDEX blog_post_status_idx (status=?)',
+            'SCAN blog_comment USING INDEX blog_comment_created_idx',
+            'SCAN (subquery-1)',
+            'USE TEMP B-TREE FOR ORDER BY',
+        ]
+        self.assertEqual(
+            query_plans.problems(plan, ignore_tables=['blog_tag']),
+            ['SCAN blog_post', 'USE TEMP B-TREE FOR ORDER BY'],
+        )
+
+    def test_list_and_comment_queries_use_indexes(self):
+        scenarios = [
+            scenario for scenario in benchmarks.build_scenarios()
+            if scenario.name in ('post_list', 'post_list:category', 'post_detail', 'user_posts', 'comment_post')
+        ]
+        report = query_plans.audit(scenarios)
+        self.assertEqual(sorted(report), ['post_detail', 'post_list', 'post_list:category', 'user_posts'])
+        for name, entries in report.items():
+            self.assertTrue(entries)
+            for entry in entries:
+                scans = [step for step in entry['problems'] if re.search(r'\bblog_(post|comment)\b', step)]
+                self.assertEqual(scans, [], f'{name}: {entry["sql"]}')
+
+
+class SidebarTests(BlogTestCase):
+    """The per-process sidebar cache is dropped whenever a ranked count or name changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('writer', password='secret')
+        cls.category = Category.objects.create(name='Guides')
+        cls.django, cls.sqlite = Tag.objects.create(name='django'), Tag.objects.create(name='sqlite')
+        cls.post = Post.objects.create(
+            title='Published', slug='published', author=cls.author, category=cls.category, status='published',
+            content='Body',
+        )
+        cls.post.tags.add(cls.django)
+        cls.draft = Post.objects.create(title='Draft', slug='draft', author=cls.author, content='Body')
+        cls.draft.tags.add(cls.sqlite)
+
+    def setUp(self):
+        super().setUp()
+        sidebar.clear_local_cache()
+        self.addCleanup(sidebar.clear_local_cache)
+
+    def ranking(self):
+        return [(tag['name'], tag['post_count']) for tag in sidebar.popular_tags()]
+
+    def test_reads_are_cached_per_process(self):
+        self.assertEqual(self.ranking(), [('django', 1)])
+        categories = sidebar.popular_categories()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.ranking(), [('django', 1)])
+            self.assertEqual(sidebar.popular_categories(), categories)
+
+    def test_publishing_and_retagging(self):
+        self.assertEqual(self.ranking(), [('django', 1)])
+        self.draft.status = 'published'
+        self.draft.save()
+        self.assertEqual(self.ranking(), [('django', 1), ('sqlite', 1)])
+        self.post.tags.add(self.sqlite)
+        self.assertEqual(self.ranking(), [('sqlite', 2), ('django', 1)])
+        self.draft.delete()
+        self.assertEqual(self.ranking(), [('django', 1), ('sqlite', 1)])
+
+    def test_renames_and_deletes(self):
+        self.assertEqual([category['name'] for category in sidebar.popular_categories()], ['Guides'])
+        self.category.name = 'Tutorials'
+        self.category.save()
+        self.assertEqual([category['name'] for category in sidebar.popular_categories()], ['Tutorials'])
+        self.django.delete()
+        self.assertEqual(self.ranking(), [])
+
+
+@override_settings(BLOG_PAGE_CACHE_ENABLED=False, BLOG_VIEW_COUNTS_ENABLED=False, BLOG_FRAGMENT_CACHE_ENABLED=True)
+class FragmentCacheTests(BlogTestCase):
+    """Cached fragments follow edits of their object and renames of what they show, per owner"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('writer', password='secret')
+        cls.reader = User.objects.create_user('reader', password='secret')
+        cls.category = Category.objects.create(name='Guides')
+        cls.post = Post.objects.create(
+            title='Fragments', slug='fragments', author=cls.author, category=cls.category, status='published',
+            content='First body',
+        )
+        Comment.objects.create(post=cls.post, author=cls.author, content='Cached comment')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.reader)
+
+    def test_edits_replace_the_cached_body(self):
+        self.assertContains(self.client.get(self.post.get_absolute_url()), 'First body')
+        # Without a new updated_at the cached fragment is still served
+        Post.objects.filter(pk=self.post.pk).update(content_html='<p>Sneaked in</p>')
+        self.assertContains(self.client.get(self.post.get_absolute_url()), 'First body')
+        self.post.content = 'Second body'
+        self.post.save()
+        response = self.client.get(self.post.get_absolute_url())
+        self.assertContains(response, 'Second body')
+        self.assertNotContains(response, 'First body')
+
+    def test_renames_invalidate_cards(self):
+        self.assertContains(self.client.get(reverse('blog:post_list')), 'Guides')
+        self.category.name = 'Tutorials'
+        self.category.save()
+        self.assertContains(self.client.get(reverse('blog:post_list')), 'Tutorials')
+        self.author.first_name, self.author.last_name = 'Ada', 'Writer'
+        self.author.save()
+        self.assertContains(self.client.get(reverse('blog:post_list')), 'Ada Writer')
+
+    def test_owner_controls_are_not_shared(self):
+        self.assertNotContains(self.client.get(self.post.get_absolute_url()), 'fa-ellipsis-h')
+        self.client.force_login(self.author)
+        self.assertContains(self.client.get(self.post.get_absolute_url()), 'fa-ellipsis-h')
+        self.client.force_login(self.reader)
+        self.assertNotContains(self.client.get(self.post.get_absolute_url()), 'fa-ellipsis-h')
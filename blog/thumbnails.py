@@ -0,0 +1,89 @@
+"""
+Fixed-size variants of ``Post.image``.
+
+Each upload gets a JPEG and a WebP copy of every variant in ``VARIANTS``,
+cropped to fill the target box and stored next to the original:
+``posts/photo.jpg`` -> ``posts/photo.jpg.card.jpg``, ``posts/photo.jpg.card.webp``,
+``posts/photo.jpg.hero.jpg`` ... The original's extension stays in the name
+so ``photo.jpg`` and ``photo.png`` get separate variants. The
+``responsive_image`` template tag in ``blog_images`` turns them into
+``srcset`` markup.
+"""
+import logging
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# name: (width, height)
+VARIANTS = {
+    'card': (600, 400),
+    'hero': (1200, 600),
+}
+
+# format: (file extension, Pillow save options)
+FORMATS = {
+    'jpeg': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+}
+
+
+def variant_name(name, variant, fmt='jpeg'):
+    """Storage name of ``variant`` of the original image ``name`` in format ``fmt``"""
+    return f'{name}.{variant}.{FORMATS[fmt][0]}'
+
+
+def variant_names(name):
+    """Every variant of ``name``, in the order ``generate_variants`` writes them"""
+    return [variant_name(name, variant, fmt) for variant in VARIANTS for fmt in FORMATS]
+
+
+def _encode(image, fmt):
+    _, options = FORMATS[fmt]
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, format=fmt.upper(), **options)
+    return buffer.getvalue()
+
+
+def generate_variants(name, storage=None, overwrite=True):
+    """Write every variant of the original image ``name``; return the names written"""
+    storage = storage or default_storage
+    with storage.open(name, 'rb') as original:
+        source = ImageOps.exif_transpose(Image.open(original))
+        source.load()
+    if source.mode not in ('RGB', 'RGBA'):
+        source = source.convert('RGBA' if 'transparency' in source.info else 'RGB')
+
+    written = []
+    for variant, size in VARIANTS.items():
+        resized = ImageOps.fit(source, size, method=Image.Resampling.LANCZOS)
+        for fmt in FORMATS:
+            target = variant_name(name, variant, fmt)
+            if storage.exists(target):
+                if not overwrite:
+                    continue
+                storage.delete(target)
+            storage.save(target, ContentFile(_encode(resized, fmt)))
+            written.append(target)
+    return written
+
+
+def generate_variants_safely(name, overwrite=True):
+    """``generate_variants`` that logs instead of raising, for use on save and in worker pools"""
+    try:
+        return generate_variants(name, overwrite=overwrite)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.exception('Could not generate image variants for %s', name)
+        return []
+
+
+def delete_variants(name, storage=None):
+    storage = storage or default_storage
+    for target in variant_names(name):
+        if storage.exists(target):
+            storage.delete(target)
@@ -1,13 +1,17 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import async_views, metrics, views
 
 app_name = 'blog'
 
+# Under ASGI the public read views run async (see blog/async_views.py)
+read_views = async_views if settings.BLOG_ASYNC_VIEWS else views
+
 urlpatterns = [
     # Post URLs
-    path('', views.post_list, name='post_list'),
-    path('post/<int:pk>/', views.post_detail, name='post_detail'),
+    path('', read_views.post_list, name='post_list'),
+    path('post/<int:pk>/', read_views.post_detail, name='post_detail'),
     path('post/new/', views.post_create, name='post_create'),
     path('post/<int:pk>/edit/', views.post_update, name='post_update'),
     path('post/<int:pk>/delete/', views.post_delete, name='post_delete'),
@@ -17,6 +21,9 @@ urlpatterns = [
     path('tag/<int:pk>/', views.TagPostListView.as_view(), name='tag_posts'),
     path('author/<str:username>/', views.UserPostListView.as_view(), name='user_posts'),
     
+    # Monitoring
+    path('metrics/', metrics.metrics_view, name='metrics'),
+    
     # Authentication URLs
     path('register/', views.register, name='register'),
     path('login/', auth_views.LoginView.as_view(template_name='registration/login.html'), name='login'),
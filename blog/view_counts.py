@@ -0,0 +1,249 @@
+"""
+Write-behind page view counters and trending posts.
+
+``record_view`` only adds to a counter in process memory. Every
+``BLOG_VIEW_FLUSH_INTERVAL`` seconds (or once ``BLOG_VIEW_FLUSH_MAX_POSTS``
+posts are pending) a background thread flushes the counts in one transaction:
+one ``UPDATE`` per distinct count for ``Post.view_count``, one upsert into
+the hourly ``PostViewBucket`` rows and one batched update of
+``Post.trending_score``. Views that were counted but not flushed when a
+process dies are lost, which is the price of not writing on every hit. A
+failed flush is logged and its counts are kept for the next one; it never
+affects the request that started it.
+``ViewCountMiddleware`` records the views of ``post_detail``, including the
+ones answered from the page cache or with a 304.
+
+The trending score uses forward decay: a view at time ``t`` is worth
+``2 ** ((t - epoch) / half_life)``, so older views count for less relative
+to newer ones without any row ever being decayed again. The score stores the
+base-2 logarithm of that sum, which keeps it small, and ranking by it is
+the same as ranking by the decayed view count; "trending" is then one read
+of the ``(status, -trending_score)`` index.
+
+When the trending list changes, the ``trending`` page cache tag is
+invalidated so cached pages and ETags that show it are refreshed.
+"""
+import atexit
+import logging
+import math
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import page_cache
+
+TRENDING_TAG = 'trending'
+TRENDING_LIMIT = 5
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = Counter()
+_last_flush = time.monotonic()
+_flusher = None
+
+
+def _half_life_seconds():
+    return getattr(settings, 'BLOG_TRENDING_HALF_LIFE_HOURS', 24) * 3600
+
+
+def decay_exponent(moment):
+    """log2 of the weight of one view at ``moment``"""
+    return (moment - EPOCH).total_seconds() / _half_life_seconds()
+
+
+def _log2_add(a, b):
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def record_view(post_id):
+    """Count one view of ``post_id``; return True when a flush is due"""
+    with _lock:
+        _pending[post_id] += 1
+        due = (
+            time.monotonic() - _last_flush >= getattr(settings, 'BLOG_VIEW_FLUSH_INTERVAL', 30)
+            or len(_pending) >= getattr(settings, 'BLOG_VIEW_FLUSH_MAX_POSTS', 1000)
+        )
+    return due
+
+
+def pending_views():
+    with _lock:
+        return dict(_pending)
+
+
+def _take_pending():
+    global _last_flush
+    with _lock:
+        counts = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    return counts
+
+
+def _restore_pending(counts):
+    with _lock:
+        _pending.update(counts)
+
+
+def flush():
+    """Write the pending view counts to the database; return the number of posts updated"""
+    from .models import Post, PostViewBucket
+
+    counts = _take_pending()
+    if not counts:
+        return 0
+    now = timezone.now()
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    exponent = decay_exponent(now)
+    using = router.db_for_write(Post)
+    connection = connections[using]
+    try:
+        with transaction.atomic(using=using):
+            by_count = {}
+            for post_id, views in counts.items():
+                by_count.setdefault(views, []).append(post_id)
+            for views, post_ids in by_count.items():
+                for start in range(0, len(post_ids), 500):
+                    Post.objects.filter(pk__in=post_ids[start:start + 500]).update(
+                        view_count=F('view_count') + views
+                    )
+
+            buckets = connection.ops.quote_name(PostViewBucket._meta.db_table)
+            posts_table = connection.ops.quote_name(Post._meta.db_table)
+            bucket_hour = connection.ops.adapt_datetimefield_value(hour)
+            with connection.cursor() as cursor:
+                # Selecting from the post table skips posts deleted since they were viewed
+                cursor.executemany(
+                    f'INSERT INTO {buckets} (post_id, hour, views) '
+                    f'SELECT id, %s, %s FROM {posts_table} WHERE id = %s '
+                    f'ON CONFLICT (post_id, hour) DO UPDATE SET views = views + excluded.views',
+                    [(bucket_hour, views, post_id) for post_id, views in counts.items()],
+                )
+
+            # select_for_update keeps concurrent flushes from losing score updates on other databases
+            posts = list(
+                Post.objects.using(using).select_for_update().filter(pk__in=counts).only('pk', 'trending_score')
+            )
+            for post in posts:
+                post.trending_score = _log2_add(post.trending_score, exponent + math.log2(counts[post.pk]))
+            Post.objects.bulk_update(posts, ['trending_score'], batch_size=500)
+    except Exception:
+        # Keep the views for the next flush instead of dropping them
+        _restore_pending(counts)
+        raise
+    _invalidate_if_trending_changed()
+    return len(posts)
+
+
+def _flush_logging_errors():
+    try:
+        flush()
+    except Exception:
+        logger.exception('Could not flush post view counts; keeping them for the next flush')
+    finally:
+        # Close the connections this thread opened
+        connections.close_all()
+
+
+def flush_in_background():
+    """Start a flush in a background thread unless one is already running"""
+    global _flusher
+    with _lock:
+        if _flusher is not None and _flusher.is_alive():
+            return
+        _flusher = threading.Thread(target=_flush_logging_errors, name='blog-view-counts-flush', daemon=True)
+        _flusher.start()
+
+
+def drain():
+    """Wait for a running background flush, then write whatever is still pending"""
+    flusher = _flusher
+    if flusher is not None:
+        flusher.join()
+    flush()
+
+
+def _flush_at_exit():
+    try:
+        drain()
+    except DatabaseError:
+        pass
+
+
+def trending_posts(limit=TRENDING_LIMIT):
+    """The published posts with the highest decayed view counts"""
+    from .models import Post
+    return list(
+        Post.objects.filter(status='published', trending_score__gt=0)
+        .order_by('-trending_score').only('pk', 'title', 'view_count')[:limit]
+    )
+
+
+def _invalidate_if_trending_changed():
+    key = 'blog:trending:ids'
+    ids = [post.pk for post in trending_posts()]
+    if cache.get(key) != ids:
+        cache.set(key, ids, None)
+        page_cache.invalidate(TRENDING_TAG)
+
+
+def prune_buckets(days=None):
+    """Delete hourly buckets older than ``days`` (default ``BLOG_VIEW_BUCKET_RETENTION_DAYS``); return how many"""
+    from .models import PostViewBucket
+    if days is None:
+        days = getattr(settings, 'BLOG_VIEW_BUCKET_RETENTION_DAYS', 30)
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = PostViewBucket.objects.filter(hour__lt=cutoff).delete()
+    return deleted
+
+
+class ViewCountMiddleware:
+    """Count successful GETs of ``blog:post_detail``, including cache hits and 304s"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'BLOG_VIEW_COUNTS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self._is_coroutine = iscoroutinefunction(get_response)
+        if self._is_coroutine:
+            markcoroutinefunction(self)
+        # Write what is still pending when the server process shuts down cleanly
+        atexit.register(_flush_at_exit)
+
+    def _record(self, request, response):
+        match = request.resolver_match
+        if (
+            request.method == 'GET' and response.status_code in (200, 304)
+            and match is not None and match.view_name == 'blog:post_detail'
+        ):
+            return record_view(int(match.kwargs['pk']))
+        return False
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self._record(request, response):
+            flush_in_background()
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self._record(request, response):
+            flush_in_background()
+        return response
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -5,26 +6,32 @@ from django.contrib.auth import login
 from django.contrib import messages
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
-from django.db.models import Q
-from django.core.paginator import Paginator
+from django.utils.decorators import method_decorator
+from django.db.models import Max
+from django.utils.http import urlencode
 from .models import Post, Comment, Category, Tag
 from .forms import PostForm, CommentForm, CustomUserCreationForm
+from . import comment_queue, sidebar, view_counts
+from .conditional import conditional_page
+from .counters import COMMENTS_TAG
+from .fragments import FRAGMENTS_TAG
+from .page_cache import add_dependencies, cache_anonymous_page, depend_on_posts, tag_versions
+from .pagination import (
+    POSTS_COUNT_TAG, SEARCH_COUNT_TAG, CursorPaginationMixin, filter_count_key, paginate_posts,
+)
+from .related import related_posts
+from .routers import comments_are_separate
+from .search import build_match_expression, estimate_count, search_posts
 
 
 # Function-Based Views
 
-def post_list(request):
-    """Display list of published posts with search and filtering"""
-    posts = Post.objects.filter(status='published').select_related('author', 'category').prefetch_related('tags')
-    
+def filter_posts(request, posts):
+    """Apply the search, category and tag filters in the query string to ``posts``"""
     # Search functionality
     search_query = request.GET.get('search')
     if search_query:
-        posts = posts.filter(
-            Q(title__icontains=search_query) |
-            Q(content__icontains=search_query) |
-            Q(tags__name__icontains=search_query)
-        ).distinct()
+        posts = search_posts(posts, search_query)
     
     # Category filtering
     category_id = request.GET.get('category')
@@ -36,40 +43,139 @@ def post_list(request):
     if tag_id:
         posts = posts.filter(tags__id=tag_id)
     
-    # Pagination
-    paginator = Paginator(posts, 6)  # Show 6 posts per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    return posts, search_query, category_id, tag_id
+
+
+def post_list_count_options(posts, search_query, category_id, tag_id):
+    """Paginator arguments that cache the count of ``post_list`` per filter (and may estimate it)"""
+    if not search_query:
+        return {'count_key': filter_count_key('post_list', category_id, tag_id)}
+    # Queries that differ only in case, spacing or punctuation match the same posts
+    normalized = (build_match_expression(search_query) or search_query).lower()
+    options = {
+        'count_key': filter_count_key('post_list', normalized, category_id, tag_id),
+        'count_tags': (POSTS_COUNT_TAG, SEARCH_COUNT_TAG),
+    }
+    if getattr(settings, 'BLOG_ESTIMATE_SEARCH_COUNTS', False):
+        sample_size = getattr(settings, 'BLOG_SEARCH_COUNT_SAMPLE_SIZE', 1000)
+        options['counter'] = lambda: estimate_count(posts, search_query, sample_size)
+    return options
+
+
+def list_validators(posts, *tags):
+    """
+    Last-Modified and ETag parts for a list page: the newest edit among the
+    posts it can show, read from an index, and the page cache tag versions
+    that change whenever its posts, names or counts do
+    """
+    latest = posts.order_by('-updated_at').values_list('updated_at', flat=True).first()
+    if latest is None:
+        return None
+    tags = (*tags, COMMENTS_TAG, FRAGMENTS_TAG, sidebar.SIDEBAR_TAG)
+    versions = tag_versions(tags)
+    return latest, tuple(versions[tag] for tag in tags)
+
+
+def post_list_validators(request):
+    # 'list:home' changes with every post, so the filters needn't be applied here
+    return list_validators(Post.objects.filter(status='published'), 'list:home', view_counts.TRENDING_TAG)
+
+
+def category_posts_validators(request, pk):
+    return list_validators(Post.objects.filter(category_id=pk, status='published'), f'category:{pk}')
+
+
+def tag_posts_validators(request, pk):
+    return list_validators(Post.objects.filter(tags__id=pk, status='published'), f'tag:{pk}')
+
+
+def user_posts_validators(request, username):
+    return list_validators(Post.objects.filter(author__username=username, status='published'), f'author:{username}')
+
+
+def post_detail_validators(request, pk):
+    post = Post.objects.filter(pk=pk, status='published').values('updated_at', 'category_id', 'author__username').first()
+    if post is None:
+        return None
+    latest_comment = Comment.objects.filter(post_id=pk).aggregate(latest=Max('updated_at'))['latest']
+    last_modified = max(filter(None, (post['updated_at'], latest_comment)))
+    # Comments bump the post's tag; its category, tags and author have their own
+    tag_ids = Post.tags.through.objects.filter(post_id=pk).values_list('tag_id', flat=True)
+    tags = (
+        f'post:{pk}', f'author:{post["author__username"]}', FRAGMENTS_TAG,
+        *([f'category:{post["category_id"]}'] if post['category_id'] else []),
+        *(f'tag:{tag_id}' for tag_id in tag_ids),
+    )
+    versions = tag_versions(tags)
+    # The visitor's own queued comments change the page only for them
+    pending = tuple(entry['name'] for entry in comment_queue.pending_comments(request, pk))
+    return last_modified, (*(versions[tag] for tag in tags), *pending)
+
+
+@conditional_page(post_list_validators)
+@cache_anonymous_page(lambda request: ['list:home', view_counts.TRENDING_TAG, sidebar.SIDEBAR_TAG])
+def post_list(request):
+    """Display list of published posts with search and filtering"""
+    posts = Post.objects.filter(status='published').cards()
+    posts, search_query, category_id, tag_id = filter_posts(request, posts)
+    
+    # Pagination: 6 posts per page; ranked search results can't be keyset-paginated by date
+    page_obj = paginate_posts(
+        request, posts, 6, allow_cursor=not search_query,
+        **post_list_count_options(posts, search_query, category_id, tag_id)
+    )
+    depend_on_posts(request, page_obj)
+    filter_query = urlencode({
+        key: value for key, value in
+        (('search', search_query), ('category', category_id), ('tag', tag_id)) if value
+    })
     
-    # Get categories and tags for sidebar
-    categories = Category.objects.all()
-    tags = Tag.objects.all()
+    # Most used categories and tags for the sidebar
+    categories = sidebar.popular_categories()
+    tags = sidebar.popular_tags()
+    trending = view_counts.trending_posts()
     
     context = {
         'page_obj': page_obj,
         'categories': categories,
         'tags': tags,
+        'trending_posts': trending,
         'search_query': search_query,
         'selected_category': category_id,
         'selected_tag': tag_id,
+        'filter_query': filter_query,
     }
     return render(request, 'blog/post_list.html', context)
 
 
+@conditional_page(post_detail_validators)
+@cache_anonymous_page(lambda request, pk: [f'post:{pk}'])
 def post_detail(request, pk):
     """Display single post with comments"""
-    post = get_object_or_404(Post, pk=pk, status='published')
-    comments = post.comments.filter(is_active=True).select_related('author')
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'category').prefetch_related('tags'),
+        pk=pk, status='published'
+    )
+    depend_on_posts(request, [post])
+    comments = post.comments.filter(is_active=True)
+    # Authors can't be joined when comments live in their own database
+    comments = comments.prefetch_related('author') if comments_are_separate() else comments.select_related('author')
+    related = related_posts(post)
+    add_dependencies(request, *(f'post:{related_post.pk}' for related_post in related))
     
     # Handle comment form submission
     if request.method == 'POST' and request.user.is_authenticated:
         comment_form = CommentForm(request.POST)
         if comment_form.is_valid():
-            comment = comment_form.save(commit=False)
-            comment.post = post
-            comment.author = request.user
-            comment.save()
-            messages.success(request, 'Your comment has been added successfully!')
+            if comment_queue.is_enabled():
+                comment_queue.enqueue(request, post, comment_form.cleaned_data['content'])
+                messages.success(request, 'Thanks! Your comment will be visible to everyone in a moment.')
+            else:
+                comment = comment_form.save(commit=False)
+                comment.post = post
+                comment.author = request.user
+                comment.save()
+                messages.success(request, 'Your comment has been added successfully!')
             return redirect('blog:post_detail', pk=post.pk)
     else:
         comment_form = CommentForm()
@@ -77,6 +183,8 @@ def post_detail(request, pk):
     context = {
         'post': post,
         'comments': comments,
+        'pending_comments': comment_queue.pending_comments(request, post.pk),
+        'related_posts': related,
         'comment_form': comment_form,
     }
     return render(request, 'blog/post_detail.html', context)
@@ -157,7 +265,9 @@ def register(request):
 
 # Class-Based Views
 
-class CategoryPostListView(ListView):
+@method_decorator(conditional_page(category_posts_validators), name='dispatch')
+@method_decorator(cache_anonymous_page(lambda request, pk: [f'category:{pk}']), name='dispatch')
+class CategoryPostListView(CursorPaginationMixin, ListView):
     """List posts by category"""
     model = Post
     template_name = 'blog/category_posts.html'
@@ -169,15 +279,21 @@ class CategoryPostListView(ListView):
         return Post.objects.filter(
             category=self.category,
             status='published'
-        ).select_related('author', 'category').prefetch_related('tags')
+        ).cards()
+    
+    def get_count_key(self):
+        return filter_count_key('category_posts', self.category.pk)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['category'] = self.category
+        depend_on_posts(self.request, context['posts'])
         return context
 
 
-class TagPostListView(ListView):
+@method_decorator(conditional_page(tag_posts_validators), name='dispatch')
+@method_decorator(cache_anonymous_page(lambda request, pk: [f'tag:{pk}']), name='dispatch')
+class TagPostListView(CursorPaginationMixin, ListView):
     """List posts by tag"""
     model = Post
     template_name = 'blog/tag_posts.html'
@@ -189,15 +305,21 @@ class TagPostListView(ListView):
         return Post.objects.filter(
             tags=self.tag,
             status='published'
-        ).select_related('author', 'category').prefetch_related('tags')
+        ).cards()
+    
+    def get_count_key(self):
+        return filter_count_key('tag_posts', self.tag.pk)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['tag'] = self.tag
+        depend_on_posts(self.request, context['posts'])
         return context
 
 
-class UserPostListView(ListView):
+@method_decorator(conditional_page(user_posts_validators), name='dispatch')
+@method_decorator(cache_anonymous_page(lambda request, username: [f'author:{username}']), name='dispatch')
+class UserPostListView(CursorPaginationMixin, ListView):
     """List posts by specific user"""
     model = Post
     template_name = 'blog/user_posts.html'
@@ -210,10 +332,14 @@ class UserPostListView(ListView):
         return Post.objects.filter(
             author=self.author,
             status='published'
-        ).select_related('author', 'category').prefetch_related('tags')
+        ).cards()
+    
+    def get_count_key(self):
+        return filter_count_key('user_posts', self.author.pk)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['author'] = self.author
+        depend_on_posts(self.request, context['posts'])
         return context
 
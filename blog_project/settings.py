@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'blog.metrics.RequestMetricsMiddleware',
+    'blog.view_counts.ViewCountMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,7 +57,7 @@ ROOT_URLCONF = 'blog_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'blog.metrics.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -67,6 +70,17 @@ TEMPLATES = [
     },
 ]
 
+# Outside development, keep compiled templates in memory instead of re-reading and
+# re-parsing them (APP_DIRS can't be combined with explicit loaders)
+if not DEBUG:
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'blog_project.wsgi.application'
 
 
@@ -75,11 +89,56 @@ WSGI_APPLICATION = 'blog_project.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # Django's SQLite backend plus WAL/pragmas and lock retries (see blog_project/sqlite3/base.py)
+        'ENGINE': 'blog_project.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'mmap_size': 256 * 1024 * 1024,
+                'cache_size': -64 * 1024,
+                'busy_timeout': 5000,
+                'temp_store': 'MEMORY',
+            },
+            'lock_retries': 5,
+            'lock_retry_delay': 0.05,
+        },
     }
 }
 
+# Comments can live in their own SQLite file so their writes don't lock the rest of
+# the blog (see blog/routers.py). Set BLOG_COMMENTS_DB to the file's path, then run
+# "python manage.py migrate --database comments".
+BLOG_COMMENTS_DATABASE = None
+if os.environ.get('BLOG_COMMENTS_DB'):
+    DATABASES['comments'] = {**DATABASES['default'], 'NAME': os.environ['BLOG_COMMENTS_DB']}
+    BLOG_COMMENTS_DATABASE = 'comments'
+
+DATABASE_ROUTERS = ['blog.routers.CommentsRouter']
+
+# Caches: a per-process LRU in front of a file cache shared by every worker
+# (see blog/cache.py); BLOG_CACHE_DIR moves the shared files
+CACHES = {
+    'default': {
+        'BACKEND': 'blog.cache.TwoTierCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 5,
+            'GENERATION_CHECK_INTERVAL': 1.0,
+        },
+    },
+    'shared': {
+        'BACKEND': 'blog.cache.LockingFileBasedCache',
+        'LOCATION': os.environ.get('BLOG_CACHE_DIR', BASE_DIR / 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -130,6 +189,60 @@ LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
+# Blog page cache for anonymous readers (see blog/page_cache.py)
+BLOG_PAGE_CACHE_ENABLED = True
+BLOG_PAGE_CACHE_TIMEOUT = 60 * 10
+
+# Cached post cards, post bodies and comments for pages that can't be cached
+# whole, e.g. for logged-in users (see blog/fragments.py)
+BLOG_FRAGMENT_CACHE_ENABLED = True
+BLOG_FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+# Cached pagination counts (see blog/pagination.py); with BLOG_ESTIMATE_SEARCH_COUNTS
+# searches matching more than BLOG_SEARCH_COUNT_SAMPLE_SIZE posts show an estimated count
+BLOG_COUNT_CACHE_TIMEOUT = 60 * 60
+BLOG_ESTIMATE_SEARCH_COUNTS = False
+BLOG_SEARCH_COUNT_SAMPLE_SIZE = 1000
+
+# Admin changelists show an estimated total for unfiltered tables larger than this
+BLOG_ESTIMATE_COUNT_OVER = 10000
+
+# Cache-Control max-age for anonymous responses; they are revalidated with ETags afterwards
+BLOG_HTTP_MAX_AGE = 60
+
+# Serve post_list and post_detail with the async views in blog/async_views.py;
+# blog_project/asgi.py turns this on
+BLOG_ASYNC_VIEWS = os.environ.get('BLOG_ASYNC_VIEWS') == '1'
+
+# Spool submitted comments and commit them in batches with
+# "python manage.py process_comment_queue" (see blog/comment_queue.py)
+BLOG_COMMENT_QUEUE_ENABLED = False
+BLOG_COMMENT_SPOOL_DIR = BASE_DIR / 'spool' / 'comments'
+
+# Request metrics served at /metrics/ (see blog/metrics.py); set BLOG_PROFILE_DIR to
+# dump cProfile stats of sampled requests slower than BLOG_PROFILE_SLOW_SECONDS
+BLOG_METRICS_ENABLED = True
+BLOG_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+BLOG_PROFILE_DIR = None
+BLOG_PROFILE_SAMPLE_RATE = 0.01
+BLOG_PROFILE_SLOW_SECONDS = 1.0
+
+# Post view counters (see blog/view_counts.py): views are counted in memory and written
+# every BLOG_VIEW_FLUSH_INTERVAL seconds or once BLOG_VIEW_FLUSH_MAX_POSTS posts are pending
+BLOG_VIEW_COUNTS_ENABLED = True
+BLOG_VIEW_FLUSH_INTERVAL = 30
+BLOG_VIEW_FLUSH_MAX_POSTS = 1000
+BLOG_TRENDING_HALF_LIFE_HOURS = 24
+BLOG_VIEW_BUCKET_RETENTION_DAYS = 30
+
+# Sidebar of post_list (see blog/sidebar.py): the BLOG_SIDEBAR_TAGS tags and
+# BLOG_SIDEBAR_CATEGORIES categories with the most published posts, counted over the
+# last BLOG_SIDEBAR_WINDOW_DAYS days when set, cached per process
+BLOG_SIDEBAR_TAGS = 20
+BLOG_SIDEBAR_CATEGORIES = 10
+BLOG_SIDEBAR_WINDOW_DAYS = None
+BLOG_SIDEBAR_CACHE_TIMEOUT = 60 * 5
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
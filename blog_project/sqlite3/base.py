@@ -0,0 +1,99 @@
+"""
+SQLite backend tuned for a small production site.
+
+Select it with ``'ENGINE': 'blog_project.sqlite3'``. On top of Django's
+backend it:
+
+* runs the ``PRAGMA`` statements from ``OPTIONS['pragmas']`` on every new
+  connection (``DEFAULT_PRAGMAS`` when not given): WAL journaling so readers
+  never block the writer, ``synchronous=NORMAL``, a memory-mapped file, a
+  larger page cache and a busy timeout;
+* retries statements that fail with "database is locked" up to
+  ``OPTIONS['lock_retries']`` times with exponential backoff and jitter,
+  starting at ``OPTIONS['lock_retry_delay']`` seconds.
+
+Use it together with ``'transaction_mode': 'IMMEDIATE'`` so transactions take
+the write lock when they begin. A lock error can then only happen on
+``BEGIN`` or on a statement outside a transaction, which are both safe to
+retry; with deferred transactions a read transaction that later writes can
+fail in a way no retry can fix.
+"""
+import random
+import re
+import time
+
+from django.db.backends.sqlite3 import base
+from django.db.backends.sqlite3.base import Database
+from django.utils.functional import cached_property
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # negative: KiB instead of pages
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+
+CUSTOM_OPTIONS = ('pragmas', 'lock_retries', 'lock_retry_delay')
+
+_PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+_PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+
+def is_locked_error(error):
+    return isinstance(error, Database.OperationalError) and 'database is locked' in str(error)
+
+
+class RetryingCursorWrapper(base.SQLiteCursorWrapper):
+    """Cursor that retries statements failing on lock contention"""
+
+    retries = 0
+    delay = 0.05
+
+    def _retry(self, method, *args):
+        attempt = 0
+        while True:
+            try:
+                return method(*args)
+            except Database.OperationalError as e:
+                if attempt >= self.retries or not is_locked_error(e):
+                    raise
+                time.sleep(self.delay * (2 ** attempt) * random.uniform(0.5, 1.5))
+                attempt += 1
+
+    def execute(self, query, params=None):
+        return self._retry(super().execute, query, params)
+
+    def executemany(self, query, param_list):
+        # ``param_list`` may be a one-shot iterator, which can't be replayed
+        param_list = list(param_list)
+        return self._retry(super().executemany, query, param_list)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        for option in CUSTOM_OPTIONS:
+            params.pop(option, None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = self.settings_dict['OPTIONS'].get('pragmas', DEFAULT_PRAGMAS)
+        for name, value in pragmas.items():
+            if not _PRAGMA_NAME.match(name) or not _PRAGMA_VALUE.match(str(value)):
+                raise ValueError(f'Invalid SQLite pragma {name}={value!r}')
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    @cached_property
+    def cursor_class(self):
+        options = self.settings_dict['OPTIONS']
+        return type('RetryingCursorWrapper', (RetryingCursorWrapper,), {
+            'retries': options.get('lock_retries', 5),
+            'delay': options.get('lock_retry_delay', 0.05),
+        })
+
+    def create_cursor(self, name=None):
+        return self.connection.cursor(factory=self.cursor_class)